@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import os
+from typing import Annotated
+
+import profiling
+from database.utils import get_db
+from exceptions import catch_exception
+from fastapi import APIRouter
+from fastapi import Depends
+from fastapi import HTTPException
+from fastapi.responses import PlainTextResponse
+from spawner import get_wrapper
+from spawner import http_client
+from spawner import outbox
+from sqlalchemy.orm import Session
+from users import verify_admin
+
+router = APIRouter(prefix="/admin")
+
+logger_name = os.environ.get("LOGGER_NAME", "JupyterHubOutpost")
+log = logging.getLogger(logger_name)
+
+# Only one profile per worker at a time
+profile_lock = asyncio.Lock()
+
+
+@router.get("/circuits")
+@catch_exception
+async def list_circuits(
+    admin: Annotated[str, Depends(verify_admin)],
+) -> dict:
+    log.debug(f"List circuit breakers for {admin}")
+    return http_client.circuit_breakers.to_dict()
+
+
+@router.get("/notifications")
+@catch_exception
+async def list_notifications(
+    admin: Annotated[str, Depends(verify_admin)],
+    db: Session = Depends(get_db),
+) -> dict:
+    log.debug(f"List pending notifications for {admin}")
+    return outbox.get_status(db)
+
+
+@router.get("/timings")
+@catch_exception
+async def list_start_timings(
+    admin: Annotated[str, Depends(verify_admin)],
+) -> list:
+    log.debug(f"List start timings for {admin}")
+    return [timings.to_dict() for timings in get_wrapper().start_timings]
+
+
+@router.get("/profile")
+@catch_exception
+async def profile(
+    admin: Annotated[str, Depends(verify_admin)],
+    seconds: float = 10,
+    mode: str = "cpu",
+    interval: float = 0.005,
+) -> PlainTextResponse:
+    if mode not in ["cpu", "memory"]:
+        raise HTTPException(status_code=400, detail="mode must be cpu or memory")
+    if not 0 < seconds <= profiling.max_seconds:
+        raise HTTPException(
+            status_code=400,
+            detail=f"seconds must be between 0 and {profiling.max_seconds}",
+        )
+    if profile_lock.locked():
+        raise HTTPException(status_code=409, detail="Profiling already running")
+    async with profile_lock:
+        log.info(f"Profile worker {os.getpid()} ({mode}) for {seconds}s for {admin}")
+        if mode == "cpu":
+            ret = await profiling.profile_cpu(seconds, max(interval, 0.001))
+        else:
+            ret = await profiling.profile_memory(seconds)
+    return PlainTextResponse(ret)
@@ -1,26 +1,39 @@
 import asyncio
+import hashlib
 import time
+from datetime import datetime
 from typing import Annotated
 from typing import List
+from typing import Optional
 
+import tracing
 from database import models as service_model
 from database import schemas as service_schema
+from database import service_events
+from database import state_events
 from database.schemas import decrypt
 from database.schemas import encrypt
 from database.utils import get_db
 from database.utils import get_or_create_jupyterhub
 from database.utils import get_service
-from database.utils import get_services_all
+from database.utils import get_services_page
+from database.utils import get_services_version
 from fastapi import APIRouter
 from fastapi import BackgroundTasks
 from fastapi import Depends
 from fastapi import HTTPException
 from fastapi import Request
-from fastapi.responses import JSONResponse
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBasicCredentials
+from json_codec import JSONResponse
 from spawner import get_spawner
 from spawner import get_wrapper
 from spawner import remove_spawner
+from spawner.utils import get_credits_path
+from spawner.utils import get_file_version
+from spawner.utils import get_flavors_path
 from sqlalchemy.orm import Session
 from users import verify_user
 
@@ -28,6 +41,7 @@ from .utils import async_start
 from .utils import full_stop_and_remove
 from .utils import get_auth_state
 from .utils import validate_flavor
+from .utils import validate_flavors_bulk
 
 router = APIRouter()
 
@@ -42,19 +56,65 @@ log = logging.getLogger(logger_name)
 
 # background_tasks = set()
 
+# Seconds between database checks while waiting for a stored state
+state_stored_recheck_interval = 5
+
+
+def etag_matches(request, etag):
+    if_none_match = request.headers.get("if-none-match", "")
+    return any(x.strip() in (etag, "*") for x in if_none_match.split(","))
+
+
+# (endpoint, jupyterhub name) -> (version, response content)
+response_cache = {}
+
+
+async def cached_response(request, key, version, compute):
+    """
+    Returns the content of `compute()`, which must only depend on `key`
+    and `version`. With an unknown version (None) nothing is cached.
+    """
+    wrapper = get_wrapper()
+    if version is None or not wrapper.flavors_credits_cache:
+        return JSONResponse(content=jsonable_encoder(await compute()))
+
+    etag = f'W/"{hashlib.sha256(repr((key, version)).encode()).hexdigest()[:16]}"'
+    headers = {"ETag": etag}
+    if wrapper.flavors_credits_max_age:
+        headers["Cache-Control"] = f"private, max-age={wrapper.flavors_credits_max_age}"
+    else:
+        headers["Cache-Control"] = "no-cache"
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    cached = response_cache.get(key)
+    if cached is not None and cached[0] == version:
+        content = cached[1]
+    else:
+        content = jsonable_encoder(await compute())
+        response_cache[key] = (version, content)
+    return JSONResponse(content=content, headers=headers)
+
 
 @router.get("/credits/")
 @catch_exception
 async def list_credits(
     jupyterhub_name: Annotated[HTTPBasicCredentials, Depends(verify_user)],
+    request: Request,
     db: Session = Depends(get_db),
 ) -> dict:
     log.debug(f"List credits for {jupyterhub_name}")
     wrapper = get_wrapper()
-    current_credit_values = await wrapper._outpostspawner_get_credit_values(
-        db, jupyterhub_name
+    version = get_file_version(get_credits_path())
+    if version is not None:
+        # Hooks of the config file may change the values, too
+        version += (wrapper.reload_config_file(),)
+    return await cached_response(
+        request,
+        ("credits", jupyterhub_name),
+        version,
+        lambda: wrapper._outpostspawner_get_credit_values(db, jupyterhub_name),
     )
-    return current_credit_values
 
 
 @router.post("/usercredits")
@@ -76,24 +136,378 @@ async def usercredits(
 @catch_exception
 async def list_flavors(
     jupyterhub_name: Annotated[HTTPBasicCredentials, Depends(verify_user)],
+    request: Request,
     db: Session = Depends(get_db),
 ) -> dict:
     log.debug(f"List flavors for {jupyterhub_name}")
     wrapper = get_wrapper()
-    current_flavor_values = await wrapper._outpostspawner_get_flavor_values(
-        db, jupyterhub_name
+    version = get_file_version(get_flavors_path())
+    if version is not None:
+        version += (
+            get_services_version(jupyterhub_name, db, flavors=True),
+            wrapper.reload_config_file(),
+        )
+    return await cached_response(
+        request,
+        ("flavors", jupyterhub_name),
+        version,
+        lambda: wrapper._outpostspawner_get_flavor_values(db, jupyterhub_name),
     )
-    return current_flavor_values
 
 
 @router.get("/services/")
 @catch_exception
 async def list_services(
     jupyterhub_name: Annotated[HTTPBasicCredentials, Depends(verify_user)],
+    request: Request,
+    limit: Optional[int] = None,
+    cursor: Optional[int] = None,
+    flavor: Optional[str] = None,
+    user_id: Optional[int] = None,
+    start_pending: Optional[bool] = None,
+    stop_pending: Optional[bool] = None,
+    updated_since: Optional[datetime] = None,
     db: Session = Depends(get_db),
 ) -> List[dict]:
     log.debug(f"List services for {jupyterhub_name}")
-    return get_services_all(jupyterhub_name, db)
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=422, detail="limit must be positive")
+    # Read before the services. If they change in between, the next
+    # request gets the newer version.
+    version = get_services_version(jupyterhub_name, db)
+    etag = f'W/"{version}-{hashlib.sha256(str(request.query_params).encode()).hexdigest()[:16]}"'
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    services, next_cursor = get_services_page(
+        jupyterhub_name,
+        db,
+        limit=limit,
+        cursor=cursor,
+        flavor=flavor,
+        user_id=user_id,
+        start_pending=start_pending,
+        stop_pending=stop_pending,
+        updated_since=updated_since,
+    )
+    headers = {"ETag": etag}
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = str(next_cursor)
+    # Plain dicts, json_codec serializes the datetimes itself
+    return JSONResponse(content=services, headers=headers)
+
+
+def get_bulk_items(body):
+    """
+    Returns the list of `services` of a bulk request body.
+    """
+    services = body.get("services", None) if isinstance(body, dict) else None
+    if not isinstance(services, list) or not all(isinstance(x, dict) for x in services):
+        raise HTTPException(
+            status_code=422, detail='Expected {"services": [{...}, ...]}'
+        )
+    wrapper = get_wrapper()
+    if len(services) > wrapper.bulk_max_services:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {wrapper.bulk_max_services} services per request",
+        )
+    return services
+
+
+def get_flavor_update_target(body):
+    env = body.get("env", {})
+    return (
+        env.get("JUPYTERHUB_FLAVORS_UPDATE_URL", ""),
+        env.get("JUPYTERHUB_FLAVORS_UPDATE_TOKEN", None),
+    )
+
+
+async def run_bulk(db, func, args_list):
+    """
+    Calls `func(db, *args)` for each entry of `args_list`, at most
+    c.JupyterHubOutpost.bulk_concurrency at the same time. Each call gets
+    its own database session.
+    """
+    semaphore = asyncio.Semaphore(get_wrapper().bulk_concurrency)
+
+    async def run(args):
+        async with semaphore:
+            item_db = Session(bind=db.get_bind(), autoflush=False)
+            try:
+                await func(item_db, *args)
+            finally:
+                item_db.close()
+
+    await asyncio.gather(*[run(args) for args in args_list])
+
+
+@router.post("/services/bulk")
+@catch_exception
+async def add_services_bulk(
+    jupyterhub_name: Annotated[HTTPBasicCredentials, Depends(verify_user)],
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+) -> JSONResponse:
+    """
+    Starts multiple services. Flavor limits are checked for the whole batch,
+    accepted services are stored in one transaction and started with
+    bounded concurrency. Returns one result per service.
+    Registered before /services/{service_name}.
+    """
+    body = await request.json()
+    items = get_bulk_items(body)
+    log.info(f"Create {len(items)} services for {jupyterhub_name}")
+    results = [None] * len(items)
+    parsed = []
+    for i, item in enumerate(items):
+        item = dict(item)
+        user_authentication = item.pop("authentication", body.get("authentication", {}))
+        try:
+            service = service_schema.Service(**item)
+        except Exception as e:
+            results[i] = {"name": item.get("name"), "status": 400, "error": str(e)}
+            continue
+        parsed.append((i, service, user_authentication))
+
+    jupyterhub = get_or_create_jupyterhub(jupyterhub_name, db)
+    # Services which already exist (or twice in this request) do not
+    # count against the flavor limits
+    existing = set(
+        db.query(service_model.Service.name, service_model.Service.start_id)
+        .filter(service_model.Service.jupyterhub_username == jupyterhub_name)
+        .filter(
+            service_model.Service.name.in_({service.name for _, service, _ in parsed})
+        )
+        .all()
+    )
+    unique = []
+    for i, service, user_authentication in parsed:
+        key = (service.name, service.start_id)
+        if key in existing:
+            results[i] = {
+                "name": service.name,
+                "start_id": service.start_id,
+                "status": 409,
+                "error": "Service already exists",
+            }
+            continue
+        existing.add(key)
+        unique.append((i, service, user_authentication))
+    parsed = unique
+
+    admissions = await validate_flavors_bulk(
+        [(service, user_authentication) for _, service, user_authentication in parsed],
+        jupyterhub_name,
+        db,
+    )
+    accepted = []
+    for (i, service, _), flavor in zip(parsed, admissions):
+        result = {"name": service.name, "start_id": service.start_id}
+        if isinstance(flavor, Exception):
+            results[i] = {**result, "status": 403, "error": str(flavor)}
+            continue
+        results[i] = result
+        dec_body = decrypt(service.body)
+        certs = dec_body.pop("certs", {})
+        internal_trust_bundles = dec_body.pop("internal_trust_bundles", {})
+        d = service.model_dump()
+        d["body"] = encrypt(dec_body)
+        d["jupyterhub"] = jupyterhub
+        accepted.append(
+            (i, service, flavor, certs, internal_trust_bundles, dec_body, d)
+        )
+
+    with tracing.span("db.add_services"):
+        try:
+            db.add_all([service_model.Service(**x[-1]) for x in accepted])
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            log.exception(f"Could not store services for {jupyterhub_name}")
+            for x in accepted:
+                results[x[0]].update({"status": 500, "error": str(e)})
+            accepted = []
+
+    wrapper = get_wrapper()
+    auth_state = get_auth_state(request.headers)
+    # Load the config file once for the whole batch
+    spawner_class_config = wrapper.load_spawner_class_config() if accepted else {}
+    starts = []
+    for i, service, flavor, certs, internal_trust_bundles, dec_body, _ in accepted:
+        remove_spawner(jupyterhub_name, service.name, service.start_id)
+        spawner = await get_spawner(
+            jupyterhub_name,
+            service.name,
+            service.start_id,
+            decrypt(service.body),
+            auth_state,
+            certs,
+            internal_trust_bundles,
+            user_flavor=flavor,
+            spawner_class_config=spawner_class_config,
+        )
+        starts.append((i, service, spawner))
+
+    sync = request.headers.get("execution-type", "sync") != "async"
+
+    async def start(item_db, i, service, spawner):
+        # Flavor updates are sent once for the whole batch
+        try:
+            ret = await async_start(
+                service,
+                jupyterhub_name,
+                request,
+                item_db,
+                spawner,
+                "",
+                None,
+                sync,
+                send_flavor_update=False,
+            )
+            results[i].update({"status": 200, "service": ret})
+        except Exception as e:
+            results[i].update({"status": 500, "error": str(e)})
+
+    flavor_update_url, flavor_update_token = (
+        get_flavor_update_target(accepted[0][5]) if accepted else ("", None)
+    )
+
+    async def start_all():
+        await run_bulk(db, start, starts)
+        if starts:
+            await wrapper._outpostspawner_send_flavor_update(
+                db,
+                "bulk",
+                jupyterhub_name,
+                flavor_update_url,
+                flavor_update_token,
+            )
+
+    if not sync:
+        for i, _, _ in starts:
+            results[i]["status"] = 202
+        if starts:
+            await wrapper._outpostspawner_send_flavor_update(
+                db, "bulk", jupyterhub_name, flavor_update_url, flavor_update_token
+            )
+        task = background_tasks.add_task(start_all)
+        return JSONResponse(
+            content={"results": results}, status_code=202, background=task
+        )
+    await start_all()
+    return JSONResponse(content={"results": results}, status_code=200)
+
+
+@router.delete("/services/bulk")
+@catch_exception
+async def delete_services_bulk(
+    jupyterhub_name: Annotated[HTTPBasicCredentials, Depends(verify_user)],
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+) -> JSONResponse:
+    """
+    Stops multiple services, given by name and start_id. All of them are
+    marked as stopping in one transaction and stopped with bounded
+    concurrency. Services which did not store their state yet are not
+    stopped. Registered before /services/{service_name}.
+    """
+    items = get_bulk_items(await request.json())
+    log.info(f"Delete {len(items)} services for {jupyterhub_name}")
+    keys = [(str(x.get("name", "")), str(x.get("start_id", "0"))) for x in items]
+    services = {
+        (service.name, service.start_id): service
+        for service in db.query(service_model.Service)
+        .filter(service_model.Service.jupyterhub_username == jupyterhub_name)
+        .filter(service_model.Service.name.in_({name for name, _ in keys}))
+    }
+    results = []
+    stops = []
+    for i, (name, start_id) in enumerate(keys):
+        results.append({"name": name, "start_id": start_id})
+        service = services.get((name, start_id), None)
+        if service is None:
+            results[i].update({"status": 404, "error": "Item not found"})
+        elif service.stop_pending:
+            results[i].update({"status": 409, "error": "Already stopping"})
+        elif not service.state_stored:
+            results[i].update({"status": 409, "error": "Start not finished yet"})
+        else:
+            service.stop_pending = True
+            stops.append(
+                (i, name, start_id, decrypt(service.body), decrypt(service.state))
+            )
+    db.commit()
+    for _, name, start_id, _, _ in stops:
+        state_events.notify(db, jupyterhub_name, name, start_id)
+
+    collect_logs = request.query_params.get("collect_logs", "false").lower() == "true"
+
+    async def stop(item_db, i, name, start_id, body, state):
+        try:
+            logs = await full_stop_and_remove(
+                jupyterhub_name,
+                name,
+                start_id,
+                item_db,
+                request,
+                body=body,
+                state=state,
+                run_async=True,
+                collect_logs=collect_logs,
+                send_flavor_update=False,
+            )
+            results[i].update({"status": 200, "logs": logs})
+        except Exception as e:
+            results[i].update({"status": 500, "error": str(e)})
+
+    wrapper = get_wrapper()
+    flavor_update_url, flavor_update_token = (
+        get_flavor_update_target(stops[0][3]) if stops else ("", None)
+    )
+    # Stopping services do not count anymore
+    if stops:
+        await wrapper._outpostspawner_send_flavor_update(
+            db, "bulk", jupyterhub_name, flavor_update_url, flavor_update_token
+        )
+
+    if request.headers.get("execution-type", "sync") == "async":
+        for i, *_ in stops:
+            results[i]["status"] = 202
+        task = background_tasks.add_task(run_bulk, db, stop, stops)
+        return JSONResponse(
+            content={"results": results}, status_code=202, background=task
+        )
+    await run_bulk(db, stop, stops)
+    return JSONResponse(content={"results": results}, status_code=200)
+
+
+@router.get("/services/events")
+async def service_events_stream(
+    jupyterhub_name: Annotated[HTTPBasicCredentials, Depends(verify_user)],
+    request: Request,
+) -> StreamingResponse:
+    """
+    Server-sent events of status changes of the services of a JupyterHub.
+    Registered before /services/{service_name}, which would match as well.
+    """
+    log.debug(f"Stream service events for {jupyterhub_name}")
+
+    async def events():
+        async for event in service_events.stream(
+            jupyterhub_name, request.headers.get("last-event-id")
+        ):
+            if await request.is_disconnected():
+                break
+            yield event
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.get("/services/{service_name}")
@@ -146,40 +560,48 @@ async def delete_service(
         # before the start process has stored a state,
         # we should wait for it for max 60
         # seconds, so we have a chance to cancel it correctly.
+        # The start process notifies us once the state is stored.
         until = time.time() + 60
         state = {}
-        while time.time() < until:
-            try:
-                service = get_service(jupyterhub_name, service_name, start_id, db)
-                if service.stop_pending:
-                    # It's already stopping, no need to wait for it here.
-                    # This happens if async_start was cancelled and stops
-                    # the service itself.
-                    log.info(
-                        f"{jupyterhub_name} - {service_name} is already stopping. No need to stop it twice"
-                    )
-                    return JSONResponse(content={}, status_code=202)
-
-                if not service.state_stored:
+        with state_events.waiter(jupyterhub_name, service_name, start_id) as stored:
+            while time.time() < until:
+                try:
+                    service = get_service(jupyterhub_name, service_name, start_id, db)
+                    if service.stop_pending:
+                        # It's already stopping, no need to wait for it here.
+                        # This happens if async_start was cancelled and stops
+                        # the service itself.
+                        log.info(
+                            f"{jupyterhub_name} - {service_name} is already stopping. No need to stop it twice"
+                        )
+                        return JSONResponse(content={}, status_code=202)
+
+                    if service.state_stored:
+                        log.debug(
+                            f"{jupyterhub_name}-{service_name} - Load state: {decrypt(service.state)}"
+                        )
+                        state = decrypt(service.state)
+                        log.info(
+                            f"{jupyterhub_name}-{service_name} - Service fully loaded. Forward with cancel."
+                        )
+                        break
                     log.debug(
                         f"{jupyterhub_name}-{service_name} - State not stored yet"
                     )
-                    await asyncio.sleep(1)
-                    continue
-                log.debug(
-                    f"{jupyterhub_name}-{service_name} - Load state: {decrypt(service.state)}"
-                )
-                state = decrypt(service.state)
-            except:
-                log.exception(
-                    f"{jupyterhub_name}-{service_name} - Could not load service"
-                )
-                await asyncio.sleep(1)
-            else:
-                log.info(
-                    f"{jupyterhub_name}-{service_name} - Service fully loaded. Forward with cancel."
-                )
-                break
+                except:
+                    log.exception(
+                        f"{jupyterhub_name}-{service_name} - Could not load service"
+                    )
+                # Release the database connection while waiting
+                db.commit()
+                # Check the database again from time to time, in case the
+                # notification came from a worker we cannot listen to
+                timeout = min(until - time.time(), state_stored_recheck_interval)
+                try:
+                    await asyncio.wait_for(stored.wait(), max(timeout, 0))
+                except asyncio.TimeoutError:
+                    pass
+                stored.clear()
 
         log.info(f"{jupyterhub_name}-{service_name} - Forward {state} to stop")
 
@@ -269,8 +691,9 @@ async def add_service(
     d["jupyterhub"] = jupyterhub
 
     new_service = service_model.Service(**d)
-    db.add(new_service)
-    db.commit()
+    with tracing.span("db.add_service"):
+        db.add(new_service)
+        db.commit()
 
     start_id = service.start_id
     remove_spawner(jupyterhub_name, service.name, start_id)
@@ -317,7 +740,11 @@ async def add_service(
             flavor_update_url,
             flavor_update_token,
         )
-        return JSONResponse(content={"service": ret}, status_code=200)
+        content = {"service": ret}
+        wrapper = get_wrapper()
+        if wrapper.return_start_timings:
+            content["timings"] = spawner._outpostspawner_start_timings.to_dict()
+        return JSONResponse(content=content, status_code=200)
 
 
 @router.post("/userflavors")
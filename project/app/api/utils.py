@@ -1,20 +1,28 @@
+import copy
 import datetime
+import json
 import logging
 import os
 import traceback
+from collections import defaultdict
 
 import spawner.utils
+from database import models as service_model
+from database import state_events
 from database.schemas import decrypt
 from database.utils import get_service
 from spawner import get_spawner
 from spawner import get_wrapper
 from spawner import remove_spawner
+from sqlalchemy import func
+from tracing import traced
 
 
 logger_name = os.environ.get("LOGGER_NAME", "JupyterHubOutpost")
 log = logging.getLogger(logger_name)
 
 
+@traced()
 async def async_start(
     service,
     jupyterhub_name,
@@ -24,6 +32,7 @@ async def async_start(
     flavor_update_url,
     flavor_update_token,
     sync=True,
+    send_flavor_update=True,
 ):
     # remove spawner from wrapper to ensure it's using the current config
     wrapper = get_wrapper()
@@ -42,7 +51,12 @@ async def async_start(
                 "progress": 100,
                 "html_message": f"<details><summary>{now}: JupyterHub Outpost could not start service: {str(e)}</summary>{details}</details>",
             }
-            await spawner._outpostspawner_send_event(event)
+            try:
+                await spawner._outpostspawner_notify_event(db, event)
+            except:
+                log.exception(
+                    f"{jupyterhub_name} - {service.name} - Could not send failed event"
+                )
         try:
             await full_stop_and_remove(
                 jupyterhub_name,
@@ -50,6 +64,7 @@ async def async_start(
                 service.start_id,
                 db,
                 request,
+                send_flavor_update=send_flavor_update,
             )
         except:
             log.exception(
@@ -59,13 +74,14 @@ async def async_start(
             # Send flavor update also for failed start attempts. Otherwise hubs
             # will never retrieve the correct flavors, if their init_configuration
             # is not set correctly
-            await wrapper._outpostspawner_send_flavor_update(
-                db,
-                service.name,
-                jupyterhub_name,
-                flavor_update_url,
-                flavor_update_token,
-            )
+            if send_flavor_update:
+                await wrapper._outpostspawner_send_flavor_update(
+                    db,
+                    service.name,
+                    jupyterhub_name,
+                    flavor_update_url,
+                    flavor_update_token,
+                )
         except:
             pass
         raise e
@@ -74,47 +90,47 @@ async def async_start(
         service_.start_pending = False
         db.add(service_)
         db.commit()
-        await wrapper._outpostspawner_send_flavor_update(
-            db, service.name, jupyterhub_name, flavor_update_url, flavor_update_token
-        )
+        if send_flavor_update:
+            await wrapper._outpostspawner_send_flavor_update(
+                db,
+                service.name,
+                jupyterhub_name,
+                flavor_update_url,
+                flavor_update_token,
+            )
         return ret
 
 
-# Flavor Validation must check a few things
-# 1. Is flavor set? With JupyterHub Outpost 2.0 a flavor is mandatory
-# 2. Flavors may have a limit per user
-# 3. Flavors may have a global limit
-# 4. Outpost may have an overall limit for a user
-async def validate_flavor(service, jupyterhub_name, request, db):
-    if not spawner.utils.get_flavors_from_disk():
-        # Flavor not defined, accept everything
-        return
-
-    request_json = await request.json()
-    user_authentication = request_json.get("authentication", {})
-    wrapper = get_wrapper()
-
-    # 1. Is flavor set?
+def get_flavor(service):
     flavor = service.flavor
     if not flavor:
         dec_body = decrypt(service.body)
         flavor = dec_body.pop("user_options", {}).get("flavor", None)
+    return flavor
 
-    # Get the current flavor usage and global flavor limit
-    current_flavor_values = await wrapper._outpostspawner_get_flavor_values(
-        db, jupyterhub_name, user_authentication
-    )
 
+def get_user_id(service):
     dec_body = decrypt(service.body)
-    user_id = int(dec_body.get("env", {}).get("JUPYTERHUB_USER_ID", "0"))
+    return int(dec_body.get("env", {}).get("JUPYTERHUB_USER_ID", "0"))
+
 
+# Flavor Validation must check a few things
+# 1. Is flavor set? With JupyterHub Outpost 2.0 a flavor is mandatory
+# 2. Flavors may have a limit per user
+# 3. Flavors may have a global limit
+# 4. Outpost may have an overall limit for a user
+def check_flavor_limits(
+    service,
+    jupyterhub_name,
+    flavor,
+    user_id,
+    current_flavor_values,
+    user_servers_flavor,
+    user_global_count,
+):
+    wrapper = get_wrapper()
     if flavor in current_flavor_values.keys():
         current_flavor_value = current_flavor_values.get(flavor, {}).get("current", 0)
-        user_servers_flavor = (
-            await wrapper._outpostspawner_flavor_max_user_flavor_validation(
-                db, jupyterhub_name, flavor, user_id
-            )
-        )
         flavor_max_per_user = current_flavor_values.get(flavor, {}).get(
             "maxPerUser", None
         )
@@ -136,9 +152,6 @@ async def validate_flavor(service, jupyterhub_name, request, db):
         )
 
     # Unrelated to the flavor, each user should have a maximum list of servers
-    user_global_count = await wrapper._outpostspawner_flavor_max_user_validation(
-        db, jupyterhub_name, user_id
-    )
     if (
         wrapper.global_max_per_user != -1
         and user_global_count >= wrapper.global_max_per_user
@@ -150,6 +163,107 @@ async def validate_flavor(service, jupyterhub_name, request, db):
     return current_flavor_values[flavor]
 
 
+@traced()
+async def validate_flavor(service, jupyterhub_name, request, db):
+    if not spawner.utils.get_flavors_from_disk():
+        # Flavor not defined, accept everything
+        return
+
+    request_json = await request.json()
+    user_authentication = request_json.get("authentication", {})
+    wrapper = get_wrapper()
+
+    # 1. Is flavor set?
+    flavor = get_flavor(service)
+
+    # Get the current flavor usage and global flavor limit
+    current_flavor_values = await wrapper._outpostspawner_get_flavor_values(
+        db, jupyterhub_name, user_authentication
+    )
+
+    user_id = get_user_id(service)
+    user_servers_flavor = 0
+    if flavor in current_flavor_values.keys():
+        user_servers_flavor = (
+            await wrapper._outpostspawner_flavor_max_user_flavor_validation(
+                db, jupyterhub_name, flavor, user_id
+            )
+        )
+    user_global_count = await wrapper._outpostspawner_flavor_max_user_validation(
+        db, jupyterhub_name, user_id
+    )
+    return check_flavor_limits(
+        service,
+        jupyterhub_name,
+        flavor,
+        user_id,
+        current_flavor_values,
+        user_servers_flavor,
+        user_global_count,
+    )
+
+
+@traced()
+async def validate_flavors_bulk(items, jupyterhub_name, db):
+    """
+    validate_flavor for a batch of (service, user_authentication) tuples.
+    Counts the services of the JupyterHub once and adds each accepted
+    service to these counts, so the limits apply to the batch as a whole.
+    Returns the flavor or the exception for each item.
+    """
+    if not spawner.utils.get_flavors_from_disk():
+        return [None] * len(items)
+
+    wrapper = get_wrapper()
+    Service = service_model.Service
+    user_flavor_counts = defaultdict(int)
+    user_counts = defaultdict(int)
+    for user_id, flavor, count in (
+        db.query(Service.jupyterhub_user_id, Service.flavor, func.count(Service.id))
+        .filter(Service.jupyterhub_username == jupyterhub_name)
+        .filter(Service.stop_pending == False)
+        .group_by(Service.jupyterhub_user_id, Service.flavor)
+    ):
+        user_flavor_counts[(user_id, flavor)] = count
+        user_counts[user_id] += count
+
+    # Flavor values per user authentication, most batches share one
+    flavor_values = {}
+    added = defaultdict(int)
+    results = []
+    for service, user_authentication in items:
+        try:
+            key = json.dumps(user_authentication, sort_keys=True)
+            if key not in flavor_values:
+                flavor_values[key] = await wrapper._outpostspawner_get_flavor_values(
+                    db, jupyterhub_name, user_authentication
+                )
+            current_flavor_values = copy.deepcopy(flavor_values[key])
+            for name, count in added.items():
+                if name in current_flavor_values:
+                    current_flavor_values[name]["current"] += count
+            flavor = get_flavor(service)
+            user_id = get_user_id(service)
+            results.append(
+                check_flavor_limits(
+                    service,
+                    jupyterhub_name,
+                    flavor,
+                    user_id,
+                    current_flavor_values,
+                    user_flavor_counts[(user_id, flavor)],
+                    user_counts[user_id],
+                )
+            )
+            added[flavor] += 1
+            user_flavor_counts[(user_id, flavor)] += 1
+            user_counts[user_id] += 1
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+@traced()
 async def full_stop_and_remove(
     jupyterhub_name,
     service_name,
@@ -160,6 +274,7 @@ async def full_stop_and_remove(
     state={},
     run_async=False,
     collect_logs=False,
+    send_flavor_update=True,
 ):
     if not run_async:
         try:
@@ -179,6 +294,7 @@ async def full_stop_and_remove(
         service.stop_pending = True
         db.add(service)
         db.commit()
+        state_events.notify(db, jupyterhub_name, service_name, start_id)
         body = decrypt(service.body)
     wrapper = get_wrapper()
     if request:
@@ -213,6 +329,9 @@ async def full_stop_and_remove(
             f"{jupyterhub_name}-{service_name} - Could not delete service from database"
         )
 
+    if not send_flavor_update:
+        return logs
+
     # Send update after service was deleted from db
     try:
         await wrapper._outpostspawner_send_flavor_update(
@@ -17,6 +17,12 @@ db_url = ""
 # recycle – If set to a value other than -1, number of seconds between connection recycling, which means upon checkout, if this timeout is surpassed the connection will be closed and replaced with a newly opened connection. Defaults to -1.
 # pre_ping - if True, the pool will emit a “ping” (typically “SELECT 1”, but is dialect-specific) on the connection upon checkout, to test if the connection is alive or not. If not, the connection is transparently re-connected and upon success, all other pooled connections established prior to that timestamp are invalidated. Requires that a dialect is passed as well to interpret the disconnection error.
 engine_kwargs = {"pool_recycle": 300, "pool_pre_ping": True}
+# Each request holds one connection while it's handled. If all connections
+# (pool_size + max_overflow, default: 5 + 10) are in use, further requests wait.
+if os.getenv("SQL_POOL_SIZE"):
+    engine_kwargs["pool_size"] = int(os.getenv("SQL_POOL_SIZE"))
+if os.getenv("SQL_MAX_OVERFLOW"):
+    engine_kwargs["max_overflow"] = int(os.getenv("SQL_MAX_OVERFLOW"))
 
 if SQL_TYPE in ["sqlite", "sqlite+pysqlite"]:
     db_url = f"{SQL_TYPE}:///{SQL_DATABASE_URL}"
@@ -35,8 +41,14 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 from database.models import Base
 from database.models import JupyterHub
+from database.models import Notification
 from database.models import Service
+from database.models import ServiceChanges
+from database.models import ServiceEvent
 
 Base.metadata.create_all(engine)
 JupyterHub.metadata.create_all(engine)
 Service.metadata.create_all(engine)
+Notification.metadata.create_all(engine)
+ServiceChanges.metadata.create_all(engine)
+ServiceEvent.metadata.create_all(engine)
@@ -44,3 +44,51 @@ class Service(Base):
     jupyterhub: Mapped["JupyterHub"] = relationship(back_populates="services")
     jupyterhub_user_id = Column(Integer, default=0)
     flavor = Column(String, default=None)
+
+
+class ServiceChanges(Base):
+    __tablename__ = "service_changes"
+
+    # Incremented with each flush, which changes services of the JupyterHub
+    jupyterhub_name: Mapped[str] = mapped_column(primary_key=True)
+    counter = Column(Integer, default=0)
+    # Incremented if the number of services per flavor may have changed
+    flavor_counter = Column(Integer, default=0)
+
+
+class Notification(Base):
+    __tablename__ = "notification"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    jupyterhub_name = Column(String)
+    kind = Column(String)
+    url = Column(String)
+    # Notifications with the same key replace each other
+    dedup_key = Column(String, default=None, index=True)
+    # encrypted headers and body
+    payload = Column(LargeBinary, default=None)
+    attempts = Column(Integer, default=0)
+    created = Column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
+    )
+    next_attempt = Column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
+    )
+    last_error = Column(String, default=None)
+
+
+class ServiceEvent(Base):
+    __tablename__ = "service_event"
+
+    # Events for streams of other workers, which load them by id (see
+    # service_events.publish). Kept for service_events.retention seconds.
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    jupyterhub_name = Column(String)
+    event_id = Column(String)
+    event_type = Column(String)
+    data = Column(String)
+    created = Column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+        index=True,
+    )
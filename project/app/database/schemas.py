@@ -1,8 +1,8 @@
-import json
 import os
 from datetime import datetime
 from datetime import timezone
 
+import json_codec
 from cryptography.fernet import Fernet
 from pydantic import BaseModel
 from pydantic import ConfigDict
@@ -14,7 +14,7 @@ def encrypt(data):
 
     fernet = Fernet(os.environ.get("OUTPOST_CRYPT_KEY"))
     if type(data) == dict:
-        data = json.dumps(data)
+        data = json_codec.dumps(data)
     if type(data) == str:
         data = data.encode()
     return fernet.encrypt(data)
@@ -27,7 +27,7 @@ def decrypt(bytes_data, return_type="dict"):
     fernet = Fernet(os.environ.get("OUTPOST_CRYPT_KEY"))
     ret = fernet.decrypt(bytes_data)
     if return_type == "dict":
-        ret = json.loads(ret)
+        ret = json_codec.loads(ret)
     elif return_type == "str":
         ret = ret.decode()
     return ret
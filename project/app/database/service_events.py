@@ -0,0 +1,170 @@
+"""
+Stream of service status changes per JupyterHub (see GET /services/events).
+
+`publish` adds an event to the ring buffer of the JupyterHub and wakes up
+all streams of it. Streams resume after the event given in the
+`Last-Event-ID` header, as long as it's still in the buffer. Otherwise
+they start with a `reset` event, after which clients should fetch the
+full state (GET /services/) again.
+
+With PostgreSQL events are also stored in the service_event table and
+their row id is sent via NOTIFY, so streams connected to other worker
+processes load and receive them as well (see state_events.start_listener).
+NOTIFY payloads are limited to 8000 bytes, events (e.g. flavors) may be
+larger.
+"""
+import asyncio
+import json
+import logging
+import os
+from collections import deque
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+
+import json_codec
+from database import models
+from database import SessionLocal
+from sqlalchemy import delete
+from sqlalchemy import insert
+from sqlalchemy import text
+
+from . import state_events
+
+logger_name = os.environ.get("LOGGER_NAME", "JupyterHubOutpost")
+log = logging.getLogger(logger_name)
+
+channel = "outpost_service_events"
+
+# Events kept per JupyterHub for clients resuming with Last-Event-ID
+buffer_size = int(os.environ.get("SERVICE_EVENTS_BUFFER_SIZE", "1000"))
+# Seconds between comments sent to keep idle connections open
+keepalive_interval = 15
+# Seconds events are kept in the database for other workers
+retention = 300
+
+# Event ids are unique across workers and restarts
+_origin = os.urandom(4).hex()
+
+# jupyterhub name -> deque of (seq, event id, event type, json data)
+_buffers = {}
+# jupyterhub name -> number of the last event in the buffer
+_seqs = {}
+# jupyterhub name -> asyncio.Event, replaced after each publish
+_changed = {}
+
+
+def _get_buffer(jupyterhub_name):
+    if jupyterhub_name not in _buffers:
+        _buffers[jupyterhub_name] = deque(maxlen=buffer_size)
+        _seqs[jupyterhub_name] = 0
+    return _buffers[jupyterhub_name]
+
+
+def _append(jupyterhub_name, event_id, event_type, data):
+    buffer = _get_buffer(jupyterhub_name)
+    _seqs[jupyterhub_name] += 1
+    seq = _seqs[jupyterhub_name]
+    if event_id is None:
+        event_id = f"{_origin}-{seq}"
+    buffer.append((seq, event_id, event_type, data))
+    changed = _changed.pop(jupyterhub_name, None)
+    if changed is not None:
+        changed.set()
+    return event_id
+
+
+def publish(db, jupyterhub_name, event_type, data):
+    """
+    Call after the change was committed. The event is shared with its own
+    connection, pending changes of `db` are neither committed nor rolled back.
+    """
+    data = json_codec.dumps_str(data, default=str)
+    event_id = _append(jupyterhub_name, None, event_type, data)
+    if db is not None and db.get_bind().dialect.name == "postgresql":
+        try:
+            _share(db.get_bind(), jupyterhub_name, event_id, event_type, data)
+        except:
+            log.exception(
+                f"Could not send {event_type} event of {jupyterhub_name} to other workers"
+            )
+
+
+def _share(engine, jupyterhub_name, event_id, event_type, data):
+    table = models.ServiceEvent.__table__
+    now = datetime.now(timezone.utc)
+    # Rolled back on errors. Listeners are notified on commit, when the
+    # event can be loaded.
+    with engine.begin() as connection:
+        row_id = connection.execute(
+            insert(table)
+            .values(
+                jupyterhub_name=jupyterhub_name,
+                event_id=event_id,
+                event_type=event_type,
+                data=data,
+                created=now,
+            )
+            .returning(table.c.id)
+        ).scalar_one()
+        connection.execute(
+            delete(table).where(table.c.created < now - timedelta(seconds=retention))
+        )
+        connection.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": channel, "payload": json.dumps([row_id, event_id])},
+        )
+
+
+def _receive(payload):
+    row_id, event_id = json.loads(payload)
+    if event_id.startswith(f"{_origin}-"):
+        # Sent by this worker, already in the buffer
+        return
+    db = SessionLocal()
+    try:
+        event = db.get(models.ServiceEvent, row_id)
+    finally:
+        db.close()
+    if event is None:
+        log.warning(f"Event {event_id} of another worker is no longer stored")
+        return
+    _append(event.jupyterhub_name, event.event_id, event.event_type, event.data)
+
+
+state_events.channel_handlers[channel] = _receive
+
+
+def format_event(event_id, event_type, data):
+    return f"id: {event_id}\nevent: {event_type}\ndata: {data}\n\n"
+
+
+async def stream(jupyterhub_name, last_event_id=None):
+    """
+    Yields the events of a JupyterHub in the text/event-stream format,
+    until it's closed.
+    """
+    buffer = _get_buffer(jupyterhub_name)
+    last_seq = _seqs[jupyterhub_name]
+    if last_event_id:
+        for seq, event_id, _, _ in buffer:
+            if event_id == last_event_id:
+                last_seq = seq
+                break
+        else:
+            yield format_event("", "reset", "{}")
+    while True:
+        # Before yielding, so no publish gets lost in between
+        changed = _changed.setdefault(jupyterhub_name, asyncio.Event())
+        if buffer and buffer[0][0] > last_seq + 1:
+            # Events were dropped from the buffer, before they were sent
+            yield format_event("", "reset", "{}")
+            last_seq = buffer[-1][0]
+        for seq, event_id, event_type, data in list(buffer):
+            if seq > last_seq:
+                last_seq = seq
+                yield format_event(event_id, event_type, data)
+        try:
+            await asyncio.wait_for(changed.wait(), keepalive_interval)
+        except asyncio.TimeoutError:
+            yield ": keepalive\n\n"
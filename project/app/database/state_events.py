@@ -0,0 +1,194 @@
+"""
+Notifications for "state of a service was stored".
+
+`_outpostspawner_db_start_call` calls `notify` after it committed the state
+of a service. Requests waiting for this state (see api.services.delete_service)
+are woken up immediately instead of polling the database.
+
+Waiters of the same process are woken up directly. With PostgreSQL the
+notification is also sent via NOTIFY, so waiters in other worker processes
+(see `start_listener`) are woken up as well. Other modules may listen on
+their own channels of the same connection (see `channel_handlers`).
+"""
+import asyncio
+import json
+import logging
+import os
+from contextlib import contextmanager
+
+from sqlalchemy import text
+
+logger_name = os.environ.get("LOGGER_NAME", "JupyterHubOutpost")
+log = logging.getLogger(logger_name)
+
+channel = "outpost_state_stored"
+
+# key -> set of asyncio.Event
+_waiters = {}
+
+
+def _key(jupyterhub_name, service_name, start_id):
+    return (jupyterhub_name, service_name, str(start_id))
+
+
+def _wake_up(key):
+    for event in _waiters.get(key, set()):
+        event.set()
+
+
+@contextmanager
+def waiter(jupyterhub_name, service_name, start_id):
+    """
+    Yields an asyncio.Event which will be set, when the state of the given
+    service was stored (or it started stopping). Register the waiter before
+    checking the database, so no notification gets lost in between.
+    """
+    key = _key(jupyterhub_name, service_name, start_id)
+    event = asyncio.Event()
+    _waiters.setdefault(key, set()).add(event)
+    try:
+        yield event
+    finally:
+        _waiters[key].discard(event)
+        if not _waiters[key]:
+            del _waiters[key]
+
+
+def notify(db, jupyterhub_name, service_name, start_id):
+    """
+    Call after the change was committed. The notification is sent with its
+    own connection, pending changes of `db` are neither committed nor rolled
+    back.
+    """
+    key = _key(jupyterhub_name, service_name, start_id)
+    _wake_up(key)
+    if db.get_bind().dialect.name == "postgresql":
+        try:
+            # Rolled back on errors
+            with db.get_bind().begin() as connection:
+                connection.execute(
+                    text("SELECT pg_notify(:channel, :payload)"),
+                    {"channel": channel, "payload": json.dumps(key)},
+                )
+        except:
+            log.exception(f"Could not send notification for {key} to other workers")
+
+
+def _receive(payload):
+    _wake_up(tuple(json.loads(payload)))
+
+
+# channel -> function called with the payload of each notification
+channel_handlers = {channel: _receive}
+
+
+def _dispatch(connection):
+    while connection.notifies:
+        notify = connection.notifies.pop(0)
+        try:
+            channel_handlers[notify.channel](notify.payload)
+        except:
+            log.warning(
+                f"Received invalid notification on {notify.channel}: {notify.payload}"
+            )
+
+
+class Listener:
+    """
+    Dedicated connection outside of the pool, listening on all channels of
+    `channel_handlers`. If the connection is lost, it reconnects with
+    backoff. Notifications sent in between are missed, waiters check the
+    database periodically anyway and are woken up after reconnecting.
+    """
+
+    max_backoff = 60
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.connection = None
+        self.fileno = None
+        self.reconnect_task = None
+
+    def connect(self):
+        dialect = self.engine.dialect
+        cargs, cparams = dialect.create_connect_args(self.engine.url)
+        connection = dialect.loaded_dbapi.connect(*cargs, **cparams)
+        try:
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                for name in channel_handlers.keys():
+                    cursor.execute(f"LISTEN {name};")
+        except:
+            connection.close()
+            raise
+        self.fileno = connection.fileno()
+        asyncio.get_running_loop().add_reader(self.fileno, self._handle_notifies)
+        self.connection = connection
+        log.debug(
+            f"Listening for notifications on {', '.join(channel_handlers.keys())}"
+        )
+
+    def _handle_notifies(self):
+        try:
+            self.connection.poll()
+        except self.engine.dialect.loaded_dbapi.Error as e:
+            log.warning(f"Lost connection for notifications of other workers: {e}")
+            self.disconnect()
+            self.reconnect_task = asyncio.create_task(self._reconnect())
+            return
+        _dispatch(self.connection)
+
+    async def _reconnect(self):
+        backoff = 1
+        while True:
+            await asyncio.sleep(backoff)
+            try:
+                self.connect()
+            except Exception as e:
+                backoff = min(backoff * 2, self.max_backoff)
+                log.warning(
+                    f"Could not reconnect for notifications of other workers: {e}. Retry in {backoff} seconds"
+                )
+                continue
+            log.info("Reconnected for notifications of other workers")
+            # Notifications may have been missed, let waiters check the database
+            for key in list(_waiters.keys()):
+                _wake_up(key)
+            return
+
+    def disconnect(self):
+        connection, self.connection = self.connection, None
+        if connection is None:
+            return
+        # fileno() fails, if the connection is closed already
+        asyncio.get_running_loop().remove_reader(self.fileno)
+        try:
+            connection.close()
+        except:
+            pass
+
+    def stop(self):
+        if self.reconnect_task is not None:
+            self.reconnect_task.cancel()
+        self.disconnect()
+
+
+def start_listener(engine):
+    """
+    Listen for notifications of other workers. Only supported for PostgreSQL.
+    Returns the Listener or None.
+    """
+    if engine.dialect.name != "postgresql":
+        return None
+    listener = Listener(engine)
+    listener.connect()
+    return listener
+
+
+def stop_listener(listener):
+    if listener is None:
+        return
+    try:
+        listener.stop()
+    except:
+        log.exception(f"Could not stop listening on {channel}")
@@ -5,7 +5,14 @@ from database import models as service_model
 from database import schemas as service_schema
 from database import SessionLocal
 from fastapi import HTTPException
+from sqlalchemy import event
+from sqlalchemy import inspect
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.orm import attributes
 from sqlalchemy.orm import Session
+from tracing import traced
 
 
 logger_name = os.environ.get("LOGGER_NAME", "JupyterHubOutpost")
@@ -20,6 +27,7 @@ def get_db():
         db.close()
 
 
+@traced("db.get_or_create_jupyterhub")
 def get_or_create_jupyterhub(
     jupyterhub_name: str, db: Session
 ) -> service_schema.JupyterHub:
@@ -41,6 +49,7 @@ def get_or_create_jupyterhub(
     return jhub
 
 
+@traced("db.get_service")
 def get_service(
     jupyterhub_name, service_name: str, start_id: str, db: Session
 ) -> service_schema.Service:
@@ -61,6 +70,149 @@ def get_service(
     return service
 
 
+def changes_flavor_count(obj, session):
+    if obj in session.new or obj in session.deleted:
+        return True
+    return any(
+        attributes.get_history(obj, key).has_changes()
+        for key in ("flavor", "stop_pending", "jupyterhub_username")
+    )
+
+
+def changes_service(obj, session):
+    if obj in session.new or obj in session.deleted:
+        return True
+    # Polls refresh last_update of running services, that alone is no change
+    return any(
+        attr.history.has_changes()
+        for attr in inspect(obj).attrs
+        if attr.key != "last_update"
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def count_service_changes(session, flush_context):
+    """
+    Increments the change counter of each JupyterHub, whose services were
+    added, changed or deleted in this flush, and its flavor counter, if
+    the number of services per flavor may have changed. Runs in the same
+    transaction, so the counters only change if the services do.
+    Uses an upsert, workers may add the first change of a JupyterHub at
+    the same time. Flushes which only update `last_update` are not counted.
+    """
+    jupyterhub_names = {}
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if (
+            isinstance(obj, service_model.Service)
+            and obj.jupyterhub_username
+            and changes_service(obj, session)
+        ):
+            jupyterhub_names[obj.jupyterhub_username] = jupyterhub_names.get(
+                obj.jupyterhub_username, False
+            ) or changes_flavor_count(obj, session)
+    if not jupyterhub_names:
+        return
+    connection = session.connection()
+    if connection.dialect.name == "postgresql":
+        insert = postgresql.insert
+    else:
+        insert = sqlite.insert
+    table = service_model.ServiceChanges.__table__
+    for jupyterhub_name, flavors_changed in sorted(jupyterhub_names.items()):
+        values = {"counter": table.c.counter + 1}
+        if flavors_changed:
+            values["flavor_counter"] = table.c.flavor_counter + 1
+        connection.execute(
+            insert(table)
+            .values(jupyterhub_name=jupyterhub_name, counter=1, flavor_counter=1)
+            .on_conflict_do_update(
+                index_elements=[table.c.jupyterhub_name], set_=values
+            )
+        )
+
+
+def get_services_version(jupyterhub_name, db: Session, flavors=False) -> int:
+    """
+    Change counter of the services of a JupyterHub. With `flavors`, the
+    counter of changes of its flavor counts.
+    """
+    if flavors:
+        column = service_model.ServiceChanges.flavor_counter
+    else:
+        column = service_model.ServiceChanges.counter
+    return (
+        db.execute(
+            select(column).where(
+                service_model.ServiceChanges.jupyterhub_name == jupyterhub_name
+            )
+        ).scalar()
+        or 0
+    )
+
+
+def service_to_dict(service):
+    return {
+        "name": service.name,
+        "start_id": service.start_id,
+        "start_date": service.start_date,
+        "end_date": service.end_date,
+        "jupyterhub": service.jupyterhub_username,
+        "jupyterhub_userid": str(service.jupyterhub_user_id),
+        "last_update": service.last_update,
+        "state_stored": service.state_stored,
+        "start_pending": service.start_pending,
+        "stop_pending": service.stop_pending,
+    }
+
+
+@traced("db.get_services_page")
+def get_services_page(
+    jupyterhub_name,
+    db: Session,
+    limit=None,
+    cursor=None,
+    flavor=None,
+    user_id=None,
+    start_pending=None,
+    stop_pending=None,
+    updated_since=None,
+):
+    """
+    Services of one JupyterHub, ordered by their id, in one query.
+    Returns the services and the cursor of the next page (None on the
+    last page).
+    """
+    Service = service_model.Service
+    query = (
+        db.query(Service)
+        .filter(Service.jupyterhub_username == jupyterhub_name)
+        .populate_existing()
+    )
+    if cursor is not None:
+        query = query.filter(Service.id > cursor)
+    if flavor is not None:
+        query = query.filter(Service.flavor == flavor)
+    if user_id is not None:
+        query = query.filter(Service.jupyterhub_user_id == user_id)
+    if start_pending is not None:
+        query = query.filter(Service.start_pending == start_pending)
+    if stop_pending is not None:
+        query = query.filter(Service.stop_pending == stop_pending)
+    if updated_since is not None:
+        query = query.filter(Service.last_update >= updated_since)
+    query = query.order_by(Service.id)
+    if limit is not None:
+        # One more, to know if there's a next page
+        services = query.limit(limit + 1).all()
+        if len(services) > limit:
+            services = services[:limit]
+            return [service_to_dict(s) for s in services], services[-1].id
+    else:
+        services = query.all()
+    return [service_to_dict(s) for s in services], None
+
+
+@traced("db.get_services_all")
 def get_services_all(jupyterhub_name=None, db=None) -> service_schema.Service:
     if not db:
         return []
@@ -76,18 +228,5 @@ def get_services_all(jupyterhub_name=None, db=None) -> service_schema.Service:
     service_list = []
     for service in services:
         db.refresh(service)
-        service_list.append(
-            {
-                "name": service.name,
-                "start_id": service.start_id,
-                "start_date": service.start_date,
-                "end_date": service.end_date,
-                "jupyterhub": service.jupyterhub_username,
-                "jupyterhub_userid": str(service.jupyterhub_user_id),
-                "last_update": service.last_update,
-                "state_stored": service.state_stored,
-                "start_pending": service.start_pending,
-                "stop_pending": service.stop_pending,
-            }
-        )
+        service_list.append(service_to_dict(service))
     return service_list
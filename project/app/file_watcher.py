@@ -0,0 +1,113 @@
+"""
+Watches a file in the background and calls a function when it may have
+changed, e.g. to reload the logging configuration.
+
+On Linux the directory of the file is watched with inotify (via libc, no
+extra dependency). Watching the directory instead of the file itself also
+notices files replaced by renames, like Kubernetes does when a mounted
+ConfigMap changes. If inotify is not available, the file is checked every
+`interval` seconds.
+"""
+import asyncio
+import ctypes
+import logging
+import os
+
+logger_name = os.environ.get("LOGGER_NAME", "JupyterHubOutpost")
+log = logging.getLogger(logger_name)
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+
+watch_mask = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+)
+
+
+class Inotify:
+    def __init__(self, directory):
+        libc = ctypes.CDLL(None, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify not available")
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), watch_mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"Could not watch {directory}")
+
+    def drain(self):
+        # Only the fact that something changed is used, not the events
+        try:
+            while os.read(self.fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def close(self):
+        os.close(self.fd)
+
+
+async def watch(path, callback, interval=5, debounce=0.5, recheck_interval=60):
+    """
+    Calls `callback` whenever `path` may have changed. Runs until it's
+    cancelled. `callback` has to check itself, if the file really changed.
+    With inotify, `callback` is also called every `recheck_interval`
+    seconds, in case the watched directory itself was replaced.
+    """
+    try:
+        inotify = Inotify(os.path.dirname(os.path.abspath(path)))
+    except OSError as e:
+        log.debug(f"Check {path} every {interval} seconds ({e})")
+        inotify = None
+
+    if inotify is None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                callback()
+            except Exception:
+                log.exception(f"Could not handle change of {path}")
+
+    log.debug(f"Watch {path} with inotify")
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+
+    def on_event():
+        inotify.drain()
+        changed.set()
+
+    loop.add_reader(inotify.fd, on_event)
+    try:
+        while True:
+            try:
+                await asyncio.wait_for(changed.wait(), recheck_interval)
+                # Editors and ConfigMap updates produce multiple events
+                await asyncio.sleep(debounce)
+            except asyncio.TimeoutError:
+                pass
+            changed.clear()
+            try:
+                callback()
+            except Exception:
+                log.exception(f"Could not handle change of {path}")
+    finally:
+        loop.remove_reader(inotify.fd)
+        inotify.close()
@@ -0,0 +1,103 @@
+"""
+JSON encoding and decoding used for API responses, requests to JupyterHub
+and the encrypted database columns.
+
+Uses orjson if it's installed, the json module of the standard library
+otherwise. Set `OUTPOST_JSON_BACKEND` to "orjson" or "json" to choose one
+explicitly. Both produce compact JSON and read each other's output.
+
+Both serialize datetimes as ISO 8601 strings, like jsonable_encoder does.
+Responses of plain dicts and lists can skip jsonable_encoder, which is much
+slower than the serialization itself (see benchmarks/json_serialization.py).
+"""
+import json
+import logging
+import os
+from datetime import date
+
+from fastapi.responses import JSONResponse as _JSONResponse
+
+logger_name = os.environ.get("LOGGER_NAME", "JupyterHubOutpost")
+log = logging.getLogger(logger_name)
+
+supported_backends = ["auto", "orjson", "json"]
+
+
+def orjson_available():
+    try:
+        import orjson  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _get_backend():
+    backend = os.environ.get("OUTPOST_JSON_BACKEND", "auto")
+    if backend not in supported_backends:
+        raise ValueError(
+            f"JSON backend {backend} not supported. Use one of {supported_backends}."
+        )
+    if backend == "auto":
+        backend = "orjson" if orjson_available() else "json"
+    return backend
+
+
+backend = _get_backend()
+
+if backend == "orjson":
+    import orjson
+
+    _orjson_options = orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj, default=None) -> bytes:
+        """
+        Returns `obj` as UTF-8 encoded JSON. Objects which are not JSON
+        serializable are passed to `default`, if given.
+        """
+        return orjson.dumps(obj, default=default, option=_orjson_options)
+
+    loads = orjson.loads
+
+else:
+
+    def _default(obj):
+        # datetime is a subclass of date
+        if isinstance(obj, date):
+            return obj.isoformat()
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+    _encoder = json.JSONEncoder(
+        ensure_ascii=False, separators=(",", ":"), default=_default
+    )
+
+    def dumps(obj, default=None) -> bytes:
+        """
+        Returns `obj` as UTF-8 encoded JSON. Objects which are not JSON
+        serializable are passed to `default`, if given.
+        """
+        if default is None:
+            return _encoder.encode(obj).encode()
+
+        def _default_chain(obj):
+            if isinstance(obj, date):
+                return obj.isoformat()
+            return default(obj)
+
+        return json.dumps(
+            obj, default=_default_chain, ensure_ascii=False, separators=(",", ":")
+        ).encode()
+
+    loads = json.loads
+
+
+def dumps_str(obj, default=None) -> str:
+    return dumps(obj, default=default).decode()
+
+
+class JSONResponse(_JSONResponse):
+    """
+    fastapi.responses.JSONResponse, rendered with the configured backend.
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
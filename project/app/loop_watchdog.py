@@ -0,0 +1,112 @@
+"""
+Detects synchronous calls which block the event loop.
+
+A coroutine in the event loop updates a heartbeat every `interval` seconds.
+A thread checks the heartbeat. If it's older than `threshold` seconds, the
+event loop is blocked: the thread logs the current stack of the event loop
+and counts it in the metric `outpost_event_loop_blocked` with the location
+of the innermost frame outside of the standard library and installed
+packages (e.g. `spawner_config.py:my_pre_spawn_hook`).
+"""
+import asyncio
+import logging
+import os
+import sys
+import sysconfig
+import threading
+import time
+import traceback
+
+import metrics
+
+logger_name = os.environ.get("LOGGER_NAME", "JupyterHubOutpost")
+log = logging.getLogger(logger_name)
+
+_library_paths = tuple(
+    {
+        os.path.realpath(sysconfig.get_paths()[key])
+        for key in ["stdlib", "platstdlib", "purelib", "platlib"]
+    }
+)
+
+
+def get_location(frame):
+    """
+    Returns `<file>:<function>` of the innermost frame which is not part of
+    the standard library or an installed package.
+    """
+    innermost = frame
+    while frame is not None:
+        filename = os.path.realpath(frame.f_code.co_filename)
+        if not filename.startswith(_library_paths) and not filename.startswith("<"):
+            break
+        frame = frame.f_back
+    frame = frame or innermost
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}"
+
+
+class EventLoopWatchdog:
+    def __init__(self, threshold=0.5, interval=0.1):
+        self.threshold = threshold
+        self.interval = interval
+        self.last_report = None
+        self._last_beat = time.monotonic()
+        self._loop_thread_id = None
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """
+        Start watching the running event loop.
+        """
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(
+            target=self._watch, name="EventLoopWatchdog", daemon=True
+        )
+        self._thread.start()
+        log.debug(
+            f"EventLoopWatchdog - Started (threshold={self.threshold}s, interval={self.interval}s)"
+        )
+
+    def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+
+    async def _heartbeat(self):
+        while True:
+            self._last_beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def _watch(self):
+        blocked_since = None
+        while not self._stop.wait(self.interval):
+            last_beat = self._last_beat
+            lag = time.monotonic() - last_beat - self.interval
+            if lag > self.threshold:
+                if blocked_since != last_beat:
+                    blocked_since = last_beat
+                    self._report(lag)
+            elif blocked_since is not None:
+                duration = last_beat - blocked_since - self.interval
+                metrics.event_loop_block_duration.observe(duration)
+                log.info(
+                    f"EventLoopWatchdog - Event loop was blocked for {duration:.3f}s"
+                )
+                blocked_since = None
+
+    def _report(self, lag):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+        location = get_location(frame)
+        stack = "".join(traceback.format_stack(frame))
+        del frame
+        self.last_report = {"location": location, "lag": lag, "stack": stack}
+        metrics.event_loop_blocked.labels(location=location).inc()
+        log.warning(
+            f"EventLoopWatchdog - Event loop blocked for more than {lag:.3f}s in {location}:\n{stack}"
+        )
@@ -3,21 +3,33 @@ import datetime
 import inspect
 import logging
 import os
+import time
 from contextlib import asynccontextmanager
-
-import requests
+from typing import Annotated
+
+import file_watcher
+import json_codec
+import metrics
+import tracing
+import users
+from api.admin import router as admin_router
 from api.services import full_stop_and_remove
 from api.services import router as services_router
 from database import models
+from database import service_events
+from database import state_events
 from database.schemas import decrypt
 from database.utils import get_services_all
 from exceptions import SpawnerException
+from fastapi import Depends
 from fastapi import FastAPI
 from fastapi import Request
+from fastapi import Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from json_codec import JSONResponse
+from loop_watchdog import EventLoopWatchdog
 from spawner import get_wrapper
-from tornado.httpclient import AsyncHTTPClient
+from spawner import http_client
 from tornado.httpclient import HTTPRequest
 
 
@@ -67,6 +79,7 @@ async def check_running_services(sleep_timer=1800):
                 f"PeriodicCheck - Values at index {i}: {jhub_cleanup_names[i]} {jhub_cleanup_urls_list[i]} {bool(jhub_cleanup_tokens_list[i])}"
             )
         while True:
+            start = time.perf_counter()
             try:
                 db = SessionLocal()
                 running_services_in_jhub = {}
@@ -115,16 +128,20 @@ async def check_running_services(sleep_timer=1800):
                         )
                     # call request, check if it's running
                     try:
-                        r = requests.get(
-                            jhub_cleanup_urls_list[i],
+                        req = HTTPRequest(
+                            url=jhub_cleanup_urls_list[i],
                             headers={
                                 "Authorization": f"token {jhub_cleanup_tokens_list[i]}",
                                 "Accept": "application/json",
                             },
-                            timeout=3,
+                            request_timeout=3,
+                            # The shared client does not validate by default
+                            validate_cert=True,
+                        )
+                        r = await http_client.fetch(req)
+                        running_services_in_jhub[jhub_cleanup_name] = json_codec.loads(
+                            r.body
                         )
-                        r.raise_for_status()
-                        running_services_in_jhub[jhub_cleanup_name] = r.json()
                     except:
                         log.warning(
                             f"PeriodicCheck - Could not check running services for {jhub_cleanup_name}"
@@ -219,6 +236,9 @@ async def check_running_services(sleep_timer=1800):
                 )
             finally:
                 db.close()
+                metrics.background_task_duration.labels(
+                    task="check_running_services"
+                ).observe(time.perf_counter() - start)
                 await asyncio.sleep(sleep_timer)
     else:
         log.info(
@@ -238,6 +258,7 @@ async def check_enddates(sleep_timer=60):
     engine = create_engine(db_url, **engine_kwargs)
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
     while True:
+        start = time.perf_counter()
         try:
             log.debug("Periodic check for ended services")
             now = datetime.datetime.now(datetime.timezone.utc)
@@ -265,6 +286,16 @@ async def check_enddates(sleep_timer=60):
                             service["start_id"],
                             db,
                         )
+                        service_events.publish(
+                            db,
+                            service["jupyterhub"],
+                            "expired",
+                            {
+                                "name": service["name"],
+                                "start_id": service["start_id"],
+                                "end_date": end_date,
+                            },
+                        )
                     except:
                         log.exception(
                             "end_date check - Could not stop and remove service"
@@ -273,15 +304,83 @@ async def check_enddates(sleep_timer=60):
             log.exception("Exception in end date checked.")
         finally:
             db.close()
+            metrics.background_task_duration.labels(task="check_enddates").observe(
+                time.perf_counter() - start
+            )
             await asyncio.sleep(sleep_timer)
 
 
+async def dispatch_notifications(sleep_timer=2):
+    wrapper = get_wrapper()
+    from database import db_url
+    from database import engine_kwargs
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from spawner import outbox
+
+    engine = create_engine(db_url, **engine_kwargs)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    while True:
+        start = time.perf_counter()
+        db = SessionLocal()
+        try:
+            outbox.wakeup.clear()
+            delivered = await outbox.dispatch(db, wrapper)
+            if delivered:
+                log.debug(f"Outbox - Delivered {delivered} notifications")
+        except:
+            log.exception("Outbox - Unexpected error while sending notifications")
+        finally:
+            db.close()
+            metrics.background_task_duration.labels(
+                task="dispatch_notifications"
+            ).observe(time.perf_counter() - start)
+        try:
+            await asyncio.wait_for(outbox.wakeup.wait(), sleep_timer)
+        except asyncio.TimeoutError:
+            pass
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     wrapper = get_wrapper()
     wrapper.init_logging()
     wrapper.update_logging()
 
+    # Every worker may wait for stored states, so all of them listen
+    from database import engine
+
+    try:
+        state_listener = state_events.start_listener(engine)
+    except:
+        log.exception("Could not listen for state notifications of other workers")
+        state_listener = None
+
+    # Each worker has its own log handlers
+    logging_watcher = asyncio.create_task(
+        file_watcher.watch(
+            wrapper.logging_config_file,
+            wrapper.update_logging,
+            interval=wrapper.logging_config_check_interval,
+        )
+    )
+
+    users.load_users()
+    # Bearer tokens of JupyterHubs, reloaded when the file changes
+    users.update_tokens()
+    tokens_watcher = None
+    if users.get_tokens_path():
+        tokens_watcher = asyncio.create_task(
+            file_watcher.watch(users.get_tokens_path(), users.update_tokens)
+        )
+
+    loop_watchdog = None
+    if os.environ.get("EVENT_LOOP_WATCHDOG", "true").lower() in ["true", "1"]:
+        loop_watchdog = EventLoopWatchdog(
+            threshold=float(os.environ.get("EVENT_LOOP_WATCHDOG_THRESHOLD", "0.5"))
+        )
+        loop_watchdog.start()
+
     pid = os.getpid()
     lockfile = "/tmp/lifespan.lock"
 
@@ -315,6 +414,14 @@ async def lifespan(app: FastAPI):
             background_tasks.append(
                 asyncio.create_task(check_running_services(sleep_timer))
             )
+        if os.environ.get("DISPATCH_NOTIFICATIONS", "true").lower() in ["true", "1"]:
+            sleep_timer = int(os.environ.get("NOTIFICATIONS_SLEEP_TIMER", "2"))
+            print(
+                f"Starting background task for sending notifications every {sleep_timer}seconds"
+            )
+            background_tasks.append(
+                asyncio.create_task(dispatch_notifications(sleep_timer))
+            )
         print(f"Running lifespan init in first worker only ({pid}) ... done")
     else:
         print(f"Skipping lifespan init in this worker ({pid})")
@@ -324,6 +431,13 @@ async def lifespan(app: FastAPI):
 
     await asyncio.gather(*background_tasks, return_exceptions=True)
 
+    logging_watcher.cancel()
+    if tokens_watcher:
+        tokens_watcher.cancel()
+    if loop_watchdog:
+        loop_watchdog.stop()
+    state_events.stop_listener(state_listener)
+
     if is_leader:
         os.remove(lockfile)
     await shutdown_event()
@@ -331,8 +445,14 @@ async def lifespan(app: FastAPI):
 
 def create_application() -> FastAPI:
     root_path = os.environ.get("OUTPOST_BASE_PATH", "")
-    application = FastAPI(lifespan=lifespan, root_path=root_path)
+    application = FastAPI(
+        lifespan=lifespan,
+        root_path=root_path,
+        default_response_class=JSONResponse,
+    )
     application.include_router(services_router)
+    application.include_router(admin_router)
+    application.add_middleware(tracing.TracingMiddleware)
     application.add_middleware(
         CORSMiddleware,
         allow_origins=["*"],
@@ -355,20 +475,22 @@ def ping():
     return {"ping": "pong!"}
 
 
+@app.get("/metrics")
+def get_metrics(user: Annotated[str, Depends(users.verify_metrics)]):
+    data, content_type = metrics.generate()
+    return Response(content=data, media_type=content_type)
+
+
 async def recreate_tunnels():
     wrapper = get_wrapper()
 
     log.info("Recreate ssh tunnels during start up")
     from database import SessionLocal
-    import json
 
     try:
         db = SessionLocal()
         services = db.query(models.Service).all()
         headers = {"Content-Type": "application/json", "Accept": "application/json"}
-        http_client = AsyncHTTPClient(
-            force_instance=True, defaults=dict(validate_cert=False)
-        )
         background_set = set()
 
         def fetch_in_background(req, service_name):
@@ -424,7 +546,7 @@ async def recreate_tunnels():
                         api_token = body.get("env", {}).get("JUPYTERHUB_API_TOKEN", "")
                         start_response = decrypt(service.start_response)
                         if isinstance(start_response, dict):
-                            start_response = json.dumps(start_response)
+                            start_response = json_codec.dumps(start_response)
 
                         if tunnel_url and api_token:
                             headers["Authorization"] = f"token {api_token}"
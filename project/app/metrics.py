@@ -0,0 +1,199 @@
+"""
+Prometheus metrics of the Outpost, available at `/metrics`.
+
+With multiple gunicorn workers set the environment variable
+PROMETHEUS_MULTIPROC_DIR to an empty directory. Each worker writes its
+metrics into this directory and `/metrics` returns the aggregated values of
+all workers. The number of running services is read from the database
+while collecting, so it is the same in every worker.
+"""
+import functools
+import logging
+import os
+import time
+
+from prometheus_client import CollectorRegistry
+from prometheus_client import CONTENT_TYPE_LATEST
+from prometheus_client import Counter
+from prometheus_client import Gauge
+from prometheus_client import generate_latest
+from prometheus_client import Histogram
+from prometheus_client import multiprocess
+from prometheus_client import REGISTRY
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger_name = os.environ.get("LOGGER_NAME", "JupyterHubOutpost")
+log = logging.getLogger(logger_name)
+
+# Spawner calls may take minutes (e.g. pulling images)
+spawner_buckets = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, float("inf"))
+
+spawner_durations = {
+    action: Histogram(
+        f"outpost_spawner_{action}_duration_seconds",
+        f"Duration of Spawner.{action} calls",
+        ["spawner_class", "jupyterhub", "status"],
+        buckets=spawner_buckets,
+    )
+    for action in ["start", "poll", "stop"]
+}
+
+http_request_duration = Histogram(
+    "outpost_http_request_duration_seconds",
+    "Duration of requests sent to JupyterHub",
+    ["destination", "method"],
+)
+
+http_request_errors = Counter(
+    "outpost_http_request_errors",
+    "Failed requests sent to JupyterHub",
+    ["destination", "method", "code"],
+)
+
+db_query_duration = Histogram(
+    "outpost_db_query_duration_seconds",
+    "Duration of database queries",
+    ["operation"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5, float("inf")),
+)
+
+spawner_cache_size = Gauge(
+    "outpost_spawner_cache_size",
+    "Number of Spawner objects kept in memory",
+    multiprocess_mode="livesum",
+)
+
+background_task_duration = Histogram(
+    "outpost_background_task_duration_seconds",
+    "Duration of one run of a periodic background task",
+    ["task"],
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 600, float("inf")),
+)
+
+event_loop_blocked = Counter(
+    "outpost_event_loop_blocked",
+    "Number of times the event loop was blocked longer than the watchdog threshold",
+    ["location"],
+)
+
+event_loop_block_duration = Histogram(
+    "outpost_event_loop_block_duration_seconds",
+    "Duration of event loop blocks detected by the watchdog",
+    buckets=(0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf")),
+)
+
+log_records_dropped = Counter(
+    "outpost_log_records_dropped",
+    "Log records dropped because the queue of a log handler was full",
+    ["handler"],
+)
+
+
+class RunningServicesCollector:
+    """
+    Collects the number of running services per flavor and JupyterHub
+    from the database.
+    """
+
+    def collect(self):
+        from database import SessionLocal
+        from database import models
+        from sqlalchemy import func
+
+        gauge = GaugeMetricFamily(
+            "outpost_running_services",
+            "Number of running services",
+            labels=["jupyterhub", "flavor"],
+        )
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(
+                    models.Service.jupyterhub_username,
+                    models.Service.flavor,
+                    func.count(models.Service.id),
+                )
+                .group_by(models.Service.jupyterhub_username, models.Service.flavor)
+                .all()
+            )
+            for jupyterhub_name, flavor, count in rows:
+                gauge.add_metric([jupyterhub_name, flavor or ""], count)
+        except:
+            log.exception("Could not collect running services for metrics")
+        finally:
+            db.close()
+        yield gauge
+
+
+def get_registry():
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(RunningServicesCollector())
+        return registry
+    return REGISTRY
+
+
+def generate():
+    """
+    Returns the current metrics and their content type.
+    """
+    return generate_latest(get_registry()), CONTENT_TYPE_LATEST
+
+
+def spawner_timer(action):
+    """
+    Decorator for the start / poll / stop coroutines of the Spawner objects.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            start = time.perf_counter()
+            status = "failure"
+            try:
+                ret = await func(self, *args, **kwargs)
+                status = "success"
+                return ret
+            finally:
+                spawner_durations[action].labels(
+                    spawner_class=type(self).__bases__[-1].__name__,
+                    jupyterhub=self.jupyterhub_name,
+                    status=status,
+                ).observe(time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get("query_start_time")
+    if not start_times:
+        return
+    operation = statement.split(None, 1)[0].upper() if statement.strip() else ""
+    db_query_duration.labels(operation=operation).observe(
+        time.perf_counter() - start_times.pop()
+    )
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    start_times = (
+        context.connection.info.get("query_start_time") if context.connection else None
+    )
+    if start_times:
+        start_times.pop()
+
+
+if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+    # In multiprocess mode it's registered to the registry created per scrape
+    REGISTRY.register(RunningServicesCollector())
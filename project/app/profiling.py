@@ -0,0 +1,76 @@
+"""
+On-demand profiling of a running worker, used by the `/admin/profile` endpoint.
+
+cpu: samples the stacks of all threads of this worker and returns them in
+     the collapsed format (`frame;frame;frame count` per line), which can be
+     used with flamegraph.pl or speedscope.
+memory: compares two tracemalloc snapshots taken at the start and at the
+        end of the profiling time and returns the allocations which grew most.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+max_seconds = 60
+
+
+def _frame_name(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}".replace(";", ":")
+
+
+def sample_stacks(seconds, interval=0.005):
+    """
+    Blocking. Run it in a separate thread, otherwise it samples itself.
+    """
+    own_thread = threading.get_ident()
+    thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+    stacks = Counter()
+    until = time.monotonic() + seconds
+    while time.monotonic() < until:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread:
+                continue
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            names.append(thread_names.get(thread_id, str(thread_id)))
+            stacks[";".join(reversed(names))] += 1
+        time.sleep(interval)
+    return stacks
+
+
+def collapsed(stacks):
+    return "".join(
+        f"{stack} {count}\n"
+        for stack, count in sorted(stacks.items(), key=lambda x: -x[1])
+    )
+
+
+async def profile_cpu(seconds, interval=0.005):
+    stacks = await asyncio.to_thread(sample_stacks, seconds, interval)
+    return collapsed(stacks)
+
+
+async def profile_memory(seconds, limit=50):
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start(25)
+    try:
+        before = tracemalloc.take_snapshot()
+        await asyncio.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+    finally:
+        if started:
+            tracemalloc.stop()
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    stats = after.filter_traces(filters).compare_to(
+        before.filter_traces(filters), "lineno"
+    )
+    lines = [f"Top {limit} allocation differences after {seconds}s:"]
+    lines.extend(str(stat) for stat in stats[:limit])
+    return "\n".join(lines) + "\n"
@@ -31,6 +31,7 @@ async def get_spawner(
     internal_trust_bundles: dict = {},
     state: dict = {},
     user_flavor: dict = {},
+    spawner_class_config: dict = None,
 ) -> Spawner:
     if not certs and "certs" in orig_body.keys():
         certs = orig_body.pop("certs", {})
@@ -46,6 +47,7 @@ async def get_spawner(
         internal_trust_bundles,
         state,
         user_flavor,
+        spawner_class_config,
     )
     return ret
 
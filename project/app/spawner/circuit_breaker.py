@@ -0,0 +1,141 @@
+"""
+Circuit breaker for outbound requests, one per destination (scheme://host:port).
+
+closed: requests are sent. After `failure_threshold` consecutive failures
+        the circuit opens.
+open: requests fail immediately with CircuitOpenError. After
+      `reset_timeout` seconds the circuit becomes half-open.
+half_open: one probe request is sent, all others fail immediately.
+           Success closes the circuit, failure opens it again and doubles
+           the reset timeout (up to `max_reset_timeout`).
+"""
+import time
+from urllib.parse import urlsplit
+
+from tornado.httpclient import HTTPClientError
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(HTTPClientError):
+    def __init__(self, destination):
+        super().__init__(599, f"Circuit open for {destination}")
+        self.destination = destination
+
+
+def get_destination(url):
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class CircuitBreaker:
+    def __init__(
+        self, destination, failure_threshold=3, reset_timeout=10, max_reset_timeout=300
+    ):
+        self.destination = destination
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0
+        self.probe_in_flight = False
+        self._state = CLOSED
+
+    @property
+    def state(self):
+        if (
+            self._state == OPEN
+            and time.monotonic() >= self.opened_at + self.reset_timeout
+        ):
+            self._state = HALF_OPEN
+            self.probe_in_flight = False
+        return self._state
+
+    def allow_request(self):
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and not self.probe_in_flight:
+            self.probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self._state = CLOSED
+        self.failures = 0
+        self.reset_timeout = self.base_reset_timeout
+        self.probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._state == HALF_OPEN:
+            self.reset_timeout = min(self.reset_timeout * 2, self.max_reset_timeout)
+            self._open()
+        elif self._state == CLOSED and self.failures >= self.failure_threshold:
+            self._open()
+
+    def release_probe(self):
+        """
+        Call when a request ended without a result (e.g. it was cancelled),
+        so the next request may probe again.
+        """
+        self.probe_in_flight = False
+
+    def _open(self):
+        self._state = OPEN
+        self.opened_at = time.monotonic()
+        self.probe_in_flight = False
+
+    def to_dict(self):
+        state = self.state
+        ret = {
+            "state": state,
+            "failures": self.failures,
+            "reset_timeout": self.reset_timeout,
+        }
+        if state == OPEN:
+            ret["retry_in"] = round(
+                max(0, self.opened_at + self.reset_timeout - time.monotonic()), 3
+            )
+        return ret
+
+
+class CircuitBreakerRegistry:
+    failure_threshold = 3
+    reset_timeout = 10
+    max_reset_timeout = 300
+
+    def __init__(self):
+        self.breakers = {}
+
+    def configure(self, failure_threshold, reset_timeout, max_reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        for breaker in self.breakers.values():
+            breaker.failure_threshold = failure_threshold
+            breaker.base_reset_timeout = reset_timeout
+            breaker.max_reset_timeout = max_reset_timeout
+
+    def get(self, url):
+        destination = get_destination(url)
+        if destination not in self.breakers:
+            self.breakers[destination] = CircuitBreaker(
+                destination,
+                self.failure_threshold,
+                self.reset_timeout,
+                self.max_reset_timeout,
+            )
+        return self.breakers[destination]
+
+    def is_open(self, url):
+        return self.get(url).state == OPEN
+
+    def to_dict(self):
+        return {
+            destination: breaker.to_dict()
+            for destination, breaker in self.breakers.items()
+        }
@@ -0,0 +1,104 @@
+import asyncio
+
+
+class EventForwarder:
+    """
+    Forwards the progress events of one Spawner to JupyterHub.
+
+    Events are put into a bounded queue and sent by a background task, so a
+    slow JupyterHub never blocks the consumption of progress events. While a
+    request is in flight, new events pile up in the queue and will be sent
+    together in the next request (if `batch_size` > 1). If the queue is full,
+    the oldest event will be dropped. Progress events are cumulative, so
+    JupyterHub only misses intermediate steps.
+    """
+
+    _stop = object()
+
+    def __init__(self, send, log, log_name, maxsize=100, batch_size=1):
+        # send: coroutine function, receives one event (batch_size == 1)
+        # or a list of events (batch_size > 1)
+        self.send = send
+        self.log = log
+        self.log_name = log_name
+        self.batch_size = max(1, batch_size)
+        self.queue = asyncio.Queue(maxsize=max(1, maxsize))
+        self.dropped = 0
+        self.failed = False
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+        return self._task
+
+    def put(self, event):
+        """
+        Add an event without waiting. Returns False if forwarding has failed
+        and no further events should be added.
+        """
+        if self.failed:
+            return False
+        if self.queue.full():
+            try:
+                self.queue.get_nowait()
+                self.dropped += 1
+            except asyncio.QueueEmpty:
+                pass
+        self.queue.put_nowait(event)
+        return True
+
+    async def stop(self, timeout=10):
+        """
+        Send the remaining events and stop the background task. After `timeout`
+        seconds the remaining events will be dropped.
+        """
+        if not self._task:
+            return
+        try:
+            await asyncio.wait_for(self._join(), timeout)
+        except asyncio.TimeoutError:
+            self.log.warning(
+                f"{self.log_name} - Could not forward remaining {self.queue.qsize()} events in time"
+            )
+            self._task.cancel()
+        if self.dropped:
+            self.log.info(
+                f"{self.log_name} - Dropped {self.dropped} events, JupyterHub did not receive them fast enough"
+            )
+
+    async def _join(self):
+        if not self._task.done():
+            await self.queue.put(self._stop)
+        await asyncio.shield(self._task)
+
+    def _next_batch(self, first):
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                event = self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            if event is self._stop:
+                self.queue.put_nowait(event)
+                break
+            batch.append(event)
+        return batch
+
+    async def _run(self):
+        while True:
+            event = await self.queue.get()
+            if event is self._stop:
+                return
+            batch = self._next_batch(event)
+            try:
+                if self.batch_size > 1:
+                    await self.send(batch)
+                else:
+                    await self.send(batch[0])
+            except Exception:
+                last = batch[-1]
+                self.log.exception(
+                    f"{self.log_name} - Could not forward event for {self.log_name}: {last.get('html_message', last.get('message', ''))}"
+                )
+                self.failed = True
+                return
@@ -0,0 +1,170 @@
+"""
+Shared outbound HTTP layer.
+
+Every request the Outpost sends to a JupyterHub (events, flavor updates,
+tunnel restarts, cleanup checks) goes through the AsyncHTTPClient returned
+by `get_http_client`. Tornado keeps one instance per IOLoop, so all callers
+in a worker share the same client, its `max_clients` limit and, with the
+curl backend, its pool of keep-alive connections.
+
+Use `fetch` to send requests: it applies the circuit breaker of the
+destination, so requests to a JupyterHub which is known to be down fail
+immediately instead of waiting for the request timeout.
+"""
+import logging
+import os
+import socket
+import time
+
+import metrics
+import tracing
+from tornado import httputil
+from tornado.httpclient import AsyncHTTPClient
+from tornado.httpclient import HTTPClientError
+from tornado.netutil import DefaultExecutorResolver
+from tornado.netutil import Resolver
+
+from .circuit_breaker import CircuitBreakerRegistry
+from .circuit_breaker import CircuitOpenError
+
+logger_name = os.environ.get("LOGGER_NAME", "JupyterHubOutpost")
+log = logging.getLogger(logger_name)
+
+supported_backends = ["auto", "simple", "curl"]
+
+circuit_breakers = CircuitBreakerRegistry()
+
+
+class CachingResolver(Resolver):
+    """
+    Resolver which keeps successful lookups for `ttl` seconds, so repeated
+    requests to the same JupyterHub do not hit the system resolver each time.
+    """
+
+    def initialize(self, resolver=None, ttl=300):
+        self.resolver = resolver or DefaultExecutorResolver()
+        self.ttl = ttl
+        self._cache = {}
+
+    def close(self):
+        self._cache = {}
+        self.resolver.close()
+
+    async def resolve(self, host, port, family=socket.AF_UNSPEC):
+        key = (host, port, family)
+        now = time.monotonic()
+        cached = self._cache.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
+        result = await self.resolver.resolve(host, port, family)
+        self._cache[key] = (now + self.ttl, result)
+        return result
+
+
+def curl_available():
+    try:
+        import pycurl  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def configure_http_client(
+    backend="auto", max_clients=10, dns_cache_timeout=0, http2=False, defaults={}
+):
+    """
+    Configure the AsyncHTTPClient implementation used in this process.
+    Clients created before this call keep their previous configuration.
+    """
+    if backend not in supported_backends:
+        raise ValueError(
+            f"HTTP client backend {backend} not supported. Use one of {supported_backends}."
+        )
+    if backend == "auto":
+        backend = "curl" if curl_available() else "simple"
+    elif backend == "curl" and not curl_available():
+        log.warning("pycurl is not installed. Use simple HTTP client backend instead.")
+        backend = "simple"
+
+    defaults = dict(defaults)
+    kwargs = {"max_clients": max_clients}
+    if backend == "curl":
+        import pycurl
+
+        def prepare_curl_callback(curl):
+            if dns_cache_timeout:
+                curl.setopt(pycurl.DNS_CACHE_TIMEOUT, dns_cache_timeout)
+            if http2:
+                curl.setopt(pycurl.HTTP_VERSION, pycurl.CURL_HTTP_VERSION_2TLS)
+
+        defaults["prepare_curl_callback"] = prepare_curl_callback
+        impl = "tornado.curl_httpclient.CurlAsyncHTTPClient"
+    else:
+        if http2:
+            log.warning("HTTP/2 is only supported with the curl HTTP client backend.")
+        if dns_cache_timeout:
+            kwargs["resolver"] = CachingResolver(ttl=dns_cache_timeout)
+        impl = None
+    kwargs["defaults"] = defaults
+    AsyncHTTPClient.configure(impl, **kwargs)
+    log.debug(
+        f"Configured {backend} HTTP client backend (max_clients={max_clients}, dns_cache_timeout={dns_cache_timeout}, http2={http2})"
+    )
+    return backend
+
+
+def get_http_client():
+    """
+    Returns the shared AsyncHTTPClient of the current IOLoop.
+    """
+    return AsyncHTTPClient()
+
+
+async def fetch(request, **kwargs):
+    """
+    Send request with the shared client. Raises CircuitOpenError without
+    sending the request, if the circuit of the destination is open.
+    """
+    breaker = circuit_breakers.get(request.url)
+    labels = {"destination": breaker.destination, "method": request.method}
+    with tracing.span(f"HTTP {request.method}", destination=breaker.destination):
+        traceparent = tracing.current_traceparent()
+        if traceparent:
+            # Callers may share one headers dict between requests
+            request.headers = httputil.HTTPHeaders(request.headers)
+            request.headers["traceparent"] = traceparent
+        if not breaker.allow_request():
+            metrics.http_request_errors.labels(code="circuit_open", **labels).inc()
+            raise CircuitOpenError(breaker.destination)
+        start = time.perf_counter()
+        try:
+            response = await get_http_client().fetch(request, **kwargs)
+        except HTTPClientError as e:
+            metrics.http_request_errors.labels(code=e.code, **labels).inc()
+            # 599: timeout or connection error, 5xx: JupyterHub not healthy.
+            # Other errors are answers of a reachable JupyterHub.
+            if e.code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            raise
+        except Exception:
+            metrics.http_request_errors.labels(code="error", **labels).inc()
+            breaker.record_failure()
+            raise
+        except BaseException:
+            # e.g. asyncio.CancelledError. Says nothing about the JupyterHub,
+            # but a cancelled probe must not block all further requests.
+            breaker.release_probe()
+            raise
+        finally:
+            metrics.http_request_duration.labels(**labels).observe(
+                time.perf_counter() - start
+            )
+        # With raise_error=False errors are returned as responses
+        if response.code >= 500:
+            metrics.http_request_errors.labels(code=response.code, **labels).inc()
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return response
@@ -1,10 +1,18 @@
-import logging
+import json
+import logging.handlers
 import os
+import queue
+import re
+import threading
+import time
 
-from jsonformatter import JsonFormatter
+import metrics
 
 logged_logger_name = os.environ.get("LOGGER_NAME", "Outpost")
 
+logger_name = os.environ.get("LOGGER_NAME", "JupyterHubOutpost")
+log = logging.getLogger(logger_name)
+
 
 class ExtraFormatter(logging.Formatter):
     dummy = logging.LogRecord(None, None, None, None, None, None, None)
@@ -31,14 +39,271 @@ class ExtraFormatter(logging.Formatter):
         "thread",
         "threadName",
     ]
+    # Attributes of each record, everything else was added via `extra`
+    reserved_attributes = frozenset(dummy.__dict__) | frozenset(ignored_extras)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._uses_time = self._style.usesTime()
+
+    def usesTime(self):
+        # logging.Formatter searches the format string on each record
+        return self._uses_time
 
     def format(self, record):
-        extra_txt = ""
-        for k, v in record.__dict__.items():
-            if k not in self.dummy.__dict__ and k not in self.ignored_extras:
-                extra_txt += " --- {}={}".format(k, v)
         message = super().format(record)
-        return message + extra_txt
+        extras = [
+            f" --- {k}={v}"
+            for k, v in record.__dict__.items()
+            if k not in self.reserved_attributes
+        ]
+        if extras:
+            return message + "".join(extras)
+        return message
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as JSON object. `fmt` maps the keys of the object to
+    record attributes (e.g. `{"line": "lineno"}`). Values which are no record
+    attribute are used as %-style template. With `mix_extra`, attributes
+    added via `extra` are appended to the object.
+
+    Same output as jsonformatter.JsonFormatter. The JSON encoder and the
+    kind of each value are set up once, not per record. Values which are
+    not JSON serializable are converted with str().
+    """
+
+    def __init__(self, fmt, datefmt=None, mix_extra=False):
+        super().__init__(datefmt=datefmt)
+        self.json_fmt = fmt
+        self.mix_extra = mix_extra
+        self.encoder = json.JSONEncoder(default=str)
+        # (key, kind, value) in the order of fmt
+        self.fields = []
+        for key, value in fmt.items():
+            if value in ExtraFormatter.reserved_attributes:
+                self.fields.append((key, "attribute", value))
+            elif "%(" in value:
+                self.fields.append((key, "template", value))
+            else:
+                self.fields.append((key, "constant", value.replace("%%", "%")))
+
+    def record_message(self, record):
+        if not record.args and isinstance(record.msg, (int, float, bool, type(None))):
+            # keep these types in the JSON output
+            message = record.msg
+        else:
+            message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text or record.stack_info:
+            message = str(message)
+            if record.exc_text:
+                if message[-1:] != "\n":
+                    message += "\n"
+                message += record.exc_text
+            if record.stack_info:
+                if message[-1:] != "\n":
+                    message += "\n"
+                message += self.formatStack(record.stack_info)
+        return message
+
+    def format(self, record):
+        record.message = self.record_message(record)
+        record.asctime = self.formatTime(record, self.datefmt)
+        attributes = record.__dict__
+        extras = {
+            k: v
+            for k, v in attributes.items()
+            if k not in ExtraFormatter.reserved_attributes
+        }
+        result = {}
+        for key, kind, value in self.fields:
+            if self.mix_extra and key in extras:
+                result[key] = extras[key]
+            elif kind == "attribute":
+                result[key] = attributes.get(value)
+            elif kind == "template":
+                result[key] = value % attributes
+            else:
+                result[key] = value
+        if self.mix_extra:
+            for key, value in extras.items():
+                if key not in self.json_fmt:
+                    result[key] = value
+        return self.encoder.encode(result)
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # Wait for a free slot instead of failing with a full queue
+        self.queue.put(self._sentinel)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Passes records through a bounded queue to `handler`, which runs in a
+    separate thread. Logging never waits for file, SMTP or syslog I/O.
+    If the queue is full, the new record (`overflow="drop_new"`) or the
+    oldest queued record (`overflow="drop_oldest"`) is dropped.
+    """
+
+    overflow_policies = ["drop_new", "drop_oldest"]
+
+    def __init__(self, handler, queue_size=10000, overflow="drop_new"):
+        if overflow not in self.overflow_policies:
+            raise ValueError(
+                f"overflow {overflow} not supported. Use one of {self.overflow_policies}."
+            )
+        super().__init__(queue.Queue(queue_size))
+        self.handler = handler
+        self.overflow = overflow
+        self.dropped = 0
+        self.name = handler.name
+        self.setLevel(handler.level)
+        self.listener = _QueueListener(self.queue, handler, respect_handler_level=True)
+        self.listener.start()
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+        if self.overflow == "drop_oldest":
+            try:
+                self.queue.get_nowait()
+                self.queue.put_nowait(record)
+            except (queue.Empty, queue.Full):
+                pass
+        self.dropped += 1
+        metrics.log_records_dropped.labels(handler=self.name).inc()
+
+    def close(self):
+        if self.listener is not None:
+            # Handles all queued records before it returns
+            self.listener.stop()
+            self.listener = None
+            self.handler.close()
+        super().close()
+
+
+def close_handlers(handlers):
+    """
+    Close replaced handlers in a separate thread. Closing a
+    NonBlockingQueueHandler waits until all queued records are handled,
+    which must not block the event loop (e.g. when the logging config is
+    reloaded). Returns the thread.
+    """
+
+    def close():
+        for handler in handlers:
+            try:
+                for _filter in handler.filters:
+                    if isinstance(_filter, RateLimitFilter):
+                        _filter.emit_summaries(force=True)
+                handler.close()
+            except Exception:
+                log.exception(f"Could not close logging handler {handler.name}")
+
+    thread = threading.Thread(target=close, name="CloseLogHandlers", daemon=True)
+    thread.start()
+    return thread
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Limits repetitive messages of one handler. Each rule matches records by
+    a regular expression (searched in the message before it's formatted
+    with its arguments) and optionally by logger name (prefix) and level.
+    Per rule and logger, `rate` records pass in each `interval` seconds.
+    Afterwards only every `sample`-th record passes (if set). The number
+    of suppressed records is logged as summary after the interval, with
+    the next record the handler receives.
+    """
+
+    def __init__(self, handler, rules):
+        super().__init__()
+        self.handler = handler
+        self.rules = []
+        for rule in rules:
+            self.rules.append(
+                {
+                    "match": re.compile(rule["match"]),
+                    "logger": rule.get("logger", ""),
+                    "level": get_level(rule.get("level", "CRITICAL")),
+                    "rate": int(rule.get("rate", 10)),
+                    "interval": float(rule.get("interval", 60)),
+                    "sample": int(rule.get("sample", 0)),
+                }
+            )
+        # (rule index, logger name) -> [window start, count, suppressed, level]
+        self.windows = {}
+        self.lock = threading.Lock()
+        self.next_check = 0
+
+    def get_rule(self, record):
+        for i, rule in enumerate(self.rules):
+            if (
+                record.levelno <= rule["level"]
+                and record.name.startswith(rule["logger"])
+                and rule["match"].search(str(record.msg))
+            ):
+                return i, rule
+        return None, None
+
+    def filter(self, record):
+        if "suppressed" in record.__dict__:
+            # Our own summary
+            return True
+        now = time.monotonic()
+        if now >= self.next_check:
+            self.emit_summaries(now)
+        i, rule = self.get_rule(record)
+        if rule is None:
+            return True
+        with self.lock:
+            window = self.windows.setdefault((i, record.name), [now, 0, 0, 0])
+            window[1] += 1
+            if window[1] <= rule["rate"]:
+                return True
+            over = window[1] - rule["rate"]
+            if rule["sample"] and over % rule["sample"] == 0:
+                return True
+            window[2] += 1
+            window[3] = max(window[3], record.levelno)
+            return False
+
+    def emit_summaries(self, now=None, force=False):
+        """
+        Logs the summaries of all finished intervals (or all, with force).
+        """
+        if now is None:
+            now = time.monotonic()
+        summaries = []
+        with self.lock:
+            self.next_check = now + 1
+            for (i, logger_name), window in list(self.windows.items()):
+                rule = self.rules[i]
+                if force or now - window[0] >= rule["interval"]:
+                    if window[2]:
+                        summaries.append(
+                            (logger_name, window[3], window[2], now - window[0], rule)
+                        )
+                    del self.windows[(i, logger_name)]
+        for logger_name, level, suppressed, elapsed, rule in summaries:
+            record = logging.LogRecord(
+                logger_name,
+                level,
+                __file__,
+                0,
+                "Suppressed %d similar messages in the last %ds (match: %s)",
+                (suppressed, elapsed, rule["match"].pattern),
+                None,
+            )
+            record.suppressed = suppressed
+            self.handler.handle(record)
 
 
 # Translate level to int
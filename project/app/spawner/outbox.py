@@ -0,0 +1,200 @@
+"""
+Database backed outbox for notifications sent to JupyterHub.
+
+If c.JupyterHubOutpost.notification_outbox is enabled, flavor updates and
+events are stored in the `notification` table instead of being sent while
+handling the request. A background task (see main.dispatch_notifications)
+delivers them, retries failed deliveries with exponential backoff and
+keeps only the latest flavor update per JupyterHub and url.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+
+import json_codec
+from database import models
+from database.schemas import decrypt
+from database.schemas import encrypt
+from tornado.httpclient import HTTPClientError
+from tornado.httpclient import HTTPRequest
+
+from . import http_client
+from .circuit_breaker import CircuitOpenError
+
+logger_name = os.environ.get("LOGGER_NAME", "JupyterHubOutpost")
+log = logging.getLogger(logger_name)
+
+KIND_FLAVOR_UPDATE = "flavor_update"
+KIND_EVENT = "event"
+
+# Set whenever a notification was added in this process,
+# so the dispatcher does not have to wait for its next run.
+wakeup = asyncio.Event()
+
+
+def flavor_update_key(jupyterhub_name, url):
+    return f"{KIND_FLAVOR_UPDATE}:{jupyterhub_name}:{url}"
+
+
+def enqueue(db, jupyterhub_name, kind, url, headers, body, dedup_key=None):
+    notification = None
+    if dedup_key:
+        notification = (
+            db.query(models.Notification)
+            .filter(models.Notification.dedup_key == dedup_key)
+            .first()
+        )
+    if notification is None:
+        notification = models.Notification(
+            jupyterhub_name=jupyterhub_name,
+            kind=kind,
+            url=url,
+            dedup_key=dedup_key,
+        )
+    notification.payload = encrypt({"headers": headers, "body": body})
+    notification.attempts = 0
+    notification.next_attempt = datetime.now(timezone.utc)
+    notification.last_error = None
+    db.add(notification)
+    db.commit()
+    wakeup.set()
+    log.debug(f"Notification ({kind}) for {jupyterhub_name} added to outbox")
+
+
+def _retry_delay(attempts, max_delay=300):
+    return timedelta(seconds=min(2**attempts, max_delay))
+
+
+def _is_permanent(e):
+    # JupyterHub answered, but will not accept this notification
+    return (
+        isinstance(e, HTTPClientError)
+        and not isinstance(e, CircuitOpenError)
+        and 400 <= e.code < 500
+        and e.code not in [408, 429]
+    )
+
+
+def remove_outdated(db):
+    """
+    Delete flavor updates which were replaced by a newer snapshot of the same
+    JupyterHub. Only happens if multiple workers added them at the same time.
+    """
+    notifications = (
+        db.query(models.Notification)
+        .filter(models.Notification.dedup_key != None)
+        .order_by(models.Notification.id.desc())
+        .all()
+    )
+    seen = set()
+    removed = 0
+    for notification in notifications:
+        if notification.dedup_key in seen:
+            db.delete(notification)
+            removed += 1
+        seen.add(notification.dedup_key)
+    if removed:
+        db.commit()
+    return removed
+
+
+async def dispatch(db, wrapper, limit=100):
+    """
+    Send all due notifications. Returns the number of delivered notifications.
+    """
+    remove_outdated(db)
+    now = datetime.now(timezone.utc)
+    delivered = 0
+    # Keep the order of events per destination: once one notification
+    # of a url could not be sent, the following ones have to wait
+    blocked_urls = {
+        url
+        for (url,) in db.query(models.Notification.url)
+        .filter(models.Notification.next_attempt > now)
+        .distinct()
+    }
+    # Fetch in batches of `limit`, so notifications of unreachable
+    # JupyterHubs do not fill up the batch of all others
+    last_id = 0
+    while True:
+        query = db.query(models.Notification).filter(
+            models.Notification.id > last_id,
+            models.Notification.next_attempt <= now,
+        )
+        if blocked_urls:
+            query = query.filter(models.Notification.url.notin_(blocked_urls))
+        notifications = query.order_by(models.Notification.id).limit(limit).all()
+        for notification in notifications:
+            last_id = notification.id
+            if notification.url in blocked_urls:
+                continue
+            delivered += await _send(db, wrapper, notification, now, blocked_urls)
+        if len(notifications) < limit:
+            return delivered
+
+
+async def _send(db, wrapper, notification, now, blocked_urls):
+    """
+    Returns 1 if the notification was delivered, 0 otherwise.
+    """
+    delivered = 0
+    payload = decrypt(notification.payload)
+    req = HTTPRequest(
+        url=notification.url,
+        method="POST",
+        headers=payload.get("headers", {}),
+        body=json_codec.dumps(payload.get("body", {})),
+        **wrapper.get_request_kwargs(),
+    )
+    try:
+        await http_client.fetch(req)
+    except Exception as e:
+        if isinstance(e, CircuitOpenError):
+            # Not sent at all: neither counted as attempt nor dropped
+            notification.next_attempt = now + _retry_delay(notification.attempts)
+            db.add(notification)
+            blocked_urls.add(notification.url)
+            log.debug(
+                f"Notification ({notification.kind}) for {notification.jupyterhub_name} to {notification.url} postponed: {e}"
+            )
+        elif _is_permanent(e):
+            log.warning(
+                f"Notification ({notification.kind}) for {notification.jupyterhub_name} was rejected by {notification.url}: {e}. Drop it."
+            )
+            db.delete(notification)
+        elif notification.attempts + 1 >= wrapper.notification_max_attempts:
+            log.error(
+                f"Could not send notification ({notification.kind}) for {notification.jupyterhub_name} to {notification.url} after {notification.attempts + 1} attempts: {e}. Drop it."
+            )
+            db.delete(notification)
+        else:
+            notification.attempts += 1
+            notification.last_error = str(e)[:1000]
+            notification.next_attempt = now + _retry_delay(notification.attempts)
+            db.add(notification)
+            blocked_urls.add(notification.url)
+            log.info(
+                f"Could not send notification ({notification.kind}) for {notification.jupyterhub_name} to {notification.url} (attempt {notification.attempts}): {e}"
+            )
+    else:
+        db.delete(notification)
+        delivered = 1
+    db.commit()
+    return delivered
+
+
+def get_status(db):
+    ret = {}
+    for notification in db.query(models.Notification).all():
+        hub = ret.setdefault(notification.jupyterhub_name, {})
+        kind = hub.setdefault(
+            notification.kind, {"pending": 0, "failed_attempts": 0, "last_error": None}
+        )
+        kind["pending"] += 1
+        kind["failed_attempts"] += notification.attempts
+        if notification.last_error:
+            kind["last_error"] = notification.last_error
+    return ret
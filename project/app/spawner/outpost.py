@@ -3,17 +3,20 @@ import copy
 import fnmatch
 import html
 import inspect
-import json
 import logging
 import os
 import re
 import socket
 import sys
+from collections import deque
 from datetime import datetime
 from datetime import timedelta
 from datetime import timezone
 from pathlib import Path
 
+import json_codec
+import metrics
+import tracing
 import yaml
 
 if sys.version_info >= (3, 10):
@@ -21,6 +24,8 @@ if sys.version_info >= (3, 10):
 else:
     from async_generator import aclosing
 from database import models as service_model
+from database import service_events
+from database import state_events
 from database.schemas import decrypt
 from database.schemas import encrypt
 from database.utils import get_service
@@ -31,7 +36,6 @@ from jupyterhub.traitlets import EntryPointType
 from jupyterhub.utils import iterate_until
 from jupyterhub.utils import maybe_future
 from sqlalchemy import func
-from tornado.httpclient import AsyncHTTPClient
 from tornado.httpclient import HTTPClientError
 from tornado.httpclient import HTTPRequest
 from tornado.log import access_log
@@ -45,15 +49,22 @@ from traitlets import Dict
 from traitlets import Instance
 from traitlets import Integer
 from traitlets import List
+from traitlets import Unicode
 from traitlets import Union
 from traitlets.config import Application
 
+from . import http_client
 from . import logging_utils
+from . import outbox
+from .circuit_breaker import CircuitOpenError
+from .events import EventForwarder
 from .hub import certs_dir
 from .hub import OutpostJupyterHub
 from .hub import OutpostSpawner
 from .hub import OutpostUser
+from .timings import StartTimings
 from .utils import get_flavors_from_disk, get_credits_from_disk
+from .utils import get_file_version
 
 
 logger_name = os.environ.get("LOGGER_NAME", "JupyterHubOutpost")
@@ -79,6 +90,7 @@ class JupyterHubOutpost(Application):
     spawners = {}
     logging_config_cache = {}
     logging_config_last_update = 0
+    logging_config_missing = False
     logging_config_file = os.environ.get(
         "LOGGING_CONFIG_PATH", "/mnt/outpost_config/logging_config.yaml"
     )
@@ -115,7 +127,9 @@ class JupyterHubOutpost(Application):
                     f"Could not delete parent cert dir of {jupyterhub_name}-{service_name} ({start_id})."
                 )
             del self.spawners[f"{jupyterhub_name}-{service_name}-{start_id}"]
+            metrics.spawner_cache_size.set(len(self.spawners))
 
+    @tracing.traced("get_spawner")
     async def get_spawner(
         self,
         jupyterhub_name,
@@ -127,6 +141,7 @@ class JupyterHubOutpost(Application):
         internal_trust_bundles={},
         state={},
         user_flavor={},
+        spawner_class_config=None,
     ):
         if f"{jupyterhub_name}-{service_name}-{start_id}" not in self.spawners:
             self.log.debug(
@@ -142,8 +157,10 @@ class JupyterHubOutpost(Application):
                 internal_trust_bundles,
                 state,
                 user_flavor,
+                spawner_class_config,
             )
             self.spawners[f"{jupyterhub_name}-{service_name}-{start_id}"] = spawner
+            metrics.spawner_cache_size.set(len(self.spawners))
         if auth_state:
             await self.spawners[
                 f"{jupyterhub_name}-{service_name}-{start_id}"
@@ -236,6 +253,23 @@ class JupyterHubOutpost(Application):
         """,
     )
 
+    bulk_max_services = Integer(
+        default_value=500,
+        config=True,
+        help="""
+        Maximum number of services in one request to /services/bulk.
+        """,
+    )
+
+    bulk_concurrency = Integer(
+        default_value=10,
+        config=True,
+        help="""
+        Number of services of one request to /services/bulk, which are
+        started or stopped at the same time.
+        """,
+    )
+
     async def get_credits(self, jupyterhub_name):
         credits_config = get_credits_from_disk()
 
@@ -249,28 +283,36 @@ class JupyterHubOutpost(Application):
         jupyterhub_sets = []
         # check if the given jupyterhub_name is part of any jhub set
 
-        self.log.trace(f"Check for hub specific credits (hub={jupyterhub_name})...")
+        self.log.trace("Check for hub specific credits (hub=%s)...", jupyterhub_name)
         for key, value in credits_config.get("hubs", {}).items():
             config_jupyterhub_name = value.get("jupyterhub_name", [])
-            self.log.trace(f"Check {key} hub configuration")
+            self.log.trace("Check %s hub configuration", key)
             if type(config_jupyterhub_name) == list:
                 self.log.trace(
-                    f"Test if {jupyterhub_name} is in hubs.{key}.jupyterhub_name"
+                    "Test if %s is in hubs.%s.jupyterhub_name", jupyterhub_name, key
                 )
                 if jupyterhub_name in config_jupyterhub_name:
                     self.log.trace(
-                        f"{jupyterhub_name} in {config_jupyterhub_name} - Add {key} to possible hub sets"
+                        "%s in %s - Add %s to possible hub sets",
+                        jupyterhub_name,
+                        config_jupyterhub_name,
+                        key,
                     )
                     jupyterhub_sets.append((key, value.get("weight", 0)))
                     break
             elif type(config_jupyterhub_name) == str:
                 self.log.trace(
-                    f"Test if hub value ({jupyterhub_name}) matches the regex pattern {config_jupyterhub_name}"
+                    "Test if hub value (%s) matches the regex pattern %s",
+                    jupyterhub_name,
+                    config_jupyterhub_name,
                 )
                 try:
                     if re.fullmatch(config_jupyterhub_name, jupyterhub_name):
                         self.log.trace(
-                            f"{jupyterhub_name} matches {config_jupyterhub_name} - Add {key} to possible hub sets"
+                            "%s matches %s - Add %s to possible hub sets",
+                            jupyterhub_name,
+                            config_jupyterhub_name,
+                            key,
                         )
                         jupyterhub_sets.append((key, value.get("weight", 0)))
                         break
@@ -280,17 +322,24 @@ class JupyterHubOutpost(Application):
                             fnmatch.translate(config_jupyterhub_name), jupyterhub_name
                         ):
                             self.log.trace(
-                                f"{jupyterhub_name} matches {config_jupyterhub_name} - Add {key} to possible hub sets"
+                                "%s matches %s - Add %s to possible hub sets",
+                                jupyterhub_name,
+                                config_jupyterhub_name,
+                                key,
                             )
                             jupyterhub_sets.append((key, value.get("weight", 0)))
                             break
                     except:
                         self.log.trace(
-                            f"{config_jupyterhub_name} is not a valid regex. Check if strings are equal"
+                            "%s is not a valid regex. Check if strings are equal",
+                            config_jupyterhub_name,
                         )
                         if jupyterhub_name == config_jupyterhub_name:
                             self.log.trace(
-                                f"{jupyterhub_name} == {config_jupyterhub_name} - Add {key} to possible hub sets"
+                                "%s == %s - Add %s to possible hub sets",
+                                jupyterhub_name,
+                                config_jupyterhub_name,
+                                key,
                             )
                             jupyterhub_sets.append((key, value.get("weight", 0)))
                             break
@@ -301,7 +350,7 @@ class JupyterHubOutpost(Application):
 
         # jupyterhub_name is not allowed to use any credits
         if len(jupyterhub_sets) == 0:
-            self.log.trace(f"No sets for {jupyterhub_name} found. Return all credits")
+            self.log.trace("No sets for %s found. Return all credits", jupyterhub_name)
             return credits_config.get("credits", {})
 
         jupyterhub_sets = sorted(jupyterhub_sets, key=lambda x: x[1])
@@ -325,7 +374,8 @@ class JupyterHubOutpost(Application):
                 hub_specific_credits[creditName] = creditValue
 
         self.log.trace(
-            f"Check hubs.{jupyterhub_set}.creditsOverride - This allows you to override any config configured globally in credits._credit_"
+            "Check hubs.%s.creditsOverride - This allows you to override any config configured globally in credits._credit_",
+            jupyterhub_set,
         )
         for creditName, overrideDict in (
             credits_config.get("hubs", {})
@@ -340,7 +390,7 @@ class JupyterHubOutpost(Application):
                 continue
             for overrideKey, overrideValue in overrideDict.items():
                 self.log.trace(
-                    f"Override {creditName}.{overrideKey} to user specific values"
+                    "Override %s.%s to user specific values", creditName, overrideKey
                 )
                 hub_specific_credits[creditName][overrideKey] = overrideValue
 
@@ -363,28 +413,36 @@ class JupyterHubOutpost(Application):
         jupyterhub_sets = []
         # check if the given jupyterhub_name is part of any jhub set
 
-        self.log.trace(f"Check for hub specific flavors (hub={jupyterhub_name})...")
+        self.log.trace("Check for hub specific flavors (hub=%s)...", jupyterhub_name)
         for key, value in flavor_config.get("hubs", {}).items():
             config_jupyterhub_name = value.get("jupyterhub_name", [])
-            self.log.trace(f"Check {key} hub configuration")
+            self.log.trace("Check %s hub configuration", key)
             if type(config_jupyterhub_name) == list:
                 self.log.trace(
-                    f"Test if {jupyterhub_name} is in hubs.{key}.jupyterhub_name"
+                    "Test if %s is in hubs.%s.jupyterhub_name", jupyterhub_name, key
                 )
                 if jupyterhub_name in config_jupyterhub_name:
                     self.log.trace(
-                        f"{jupyterhub_name} in {config_jupyterhub_name} - Add {key} to possible hub sets"
+                        "%s in %s - Add %s to possible hub sets",
+                        jupyterhub_name,
+                        config_jupyterhub_name,
+                        key,
                     )
                     jupyterhub_sets.append((key, value.get("weight", 0)))
                     break
             elif type(config_jupyterhub_name) == str:
                 self.log.trace(
-                    f"Test if hub value ({jupyterhub_name}) matches the regex pattern {config_jupyterhub_name}"
+                    "Test if hub value (%s) matches the regex pattern %s",
+                    jupyterhub_name,
+                    config_jupyterhub_name,
                 )
                 try:
                     if re.fullmatch(config_jupyterhub_name, jupyterhub_name):
                         self.log.trace(
-                            f"{jupyterhub_name} matches {config_jupyterhub_name} - Add {key} to possible hub sets"
+                            "%s matches %s - Add %s to possible hub sets",
+                            jupyterhub_name,
+                            config_jupyterhub_name,
+                            key,
                         )
                         jupyterhub_sets.append((key, value.get("weight", 0)))
                         break
@@ -394,17 +452,24 @@ class JupyterHubOutpost(Application):
                             fnmatch.translate(config_jupyterhub_name), jupyterhub_name
                         ):
                             self.log.trace(
-                                f"{jupyterhub_name} matches {config_jupyterhub_name} - Add {key} to possible hub sets"
+                                "%s matches %s - Add %s to possible hub sets",
+                                jupyterhub_name,
+                                config_jupyterhub_name,
+                                key,
                             )
                             jupyterhub_sets.append((key, value.get("weight", 0)))
                             break
                     except:
                         self.log.trace(
-                            f"{config_jupyterhub_name} is not a valid regex. Check if strings are equal"
+                            "%s is not a valid regex. Check if strings are equal",
+                            config_jupyterhub_name,
                         )
                         if jupyterhub_name == config_jupyterhub_name:
                             self.log.trace(
-                                f"{jupyterhub_name} == {config_jupyterhub_name} - Add {key} to possible hub sets"
+                                "%s == %s - Add %s to possible hub sets",
+                                jupyterhub_name,
+                                config_jupyterhub_name,
+                                key,
                             )
                             jupyterhub_sets.append((key, value.get("weight", 0)))
                             break
@@ -415,7 +480,7 @@ class JupyterHubOutpost(Application):
 
         # jupyterhub_name is not allowed to use any flavors
         if len(jupyterhub_sets) == 0:
-            self.log.trace(f"No sets for {jupyterhub_name} found. Return all flavors")
+            self.log.trace("No sets for %s found. Return all flavors", jupyterhub_name)
             return flavor_config.get("flavors", {})
 
         jupyterhub_sets = sorted(jupyterhub_sets, key=lambda x: x[1])
@@ -439,7 +504,8 @@ class JupyterHubOutpost(Application):
                 hub_specific_flavors[flavorName] = flavorValue
 
         self.log.trace(
-            f"Check hubs.{jupyterhub_set}.flavorsOverride - This allows you to override any config configured globally in flavors._flavor_"
+            "Check hubs.%s.flavorsOverride - This allows you to override any config configured globally in flavors._flavor_",
+            jupyterhub_set,
         )
         for flavorName, overrideDict in (
             flavor_config.get("hubs", {})
@@ -454,7 +520,7 @@ class JupyterHubOutpost(Application):
                 continue
             for overrideKey, overrideValue in overrideDict.items():
                 self.log.trace(
-                    f"Override {flavorName}.{overrideKey} to user specific values"
+                    "Override %s.%s to user specific values", flavorName, overrideKey
                 )
                 hub_specific_flavors[flavorName][overrideKey] = overrideValue
 
@@ -495,6 +561,30 @@ class JupyterHubOutpost(Application):
         """,
     )
 
+    flavors_credits_cache = Bool(
+        default_value=True,
+        config=True,
+        help="""
+        Cache the responses of the /flavors/ and /credits/ endpoints per
+        JupyterHub and answer requests with a matching If-None-Match header
+        with 304. Responses are recomputed, when the flavors / credits file
+        or the number of services per flavor changes.
+
+        Disable it, if c.JupyterHubOutpost.update_user_authentication does
+        not always return the same values.
+        """,
+    )
+
+    flavors_credits_max_age = Integer(
+        default_value=0,
+        config=True,
+        help="""
+        Seconds clients may use a response of the /flavors/ and /credits/
+        endpoints without asking again (Cache-Control: max-age). With 0,
+        clients have to revalidate each response with its ETag.
+        """,
+    )
+
     async def get_flavors_update_token(self, jupyterhub_name):
         if callable(self.flavors_update_token):
             flavors_update_token = self.flavors_update_token(jupyterhub_name)
@@ -508,7 +598,10 @@ class JupyterHubOutpost(Application):
         try:
             if re.fullmatch(pattern, value):
                 self.log.trace(
-                    f"{value} matches regex {pattern} - Add {key} to possible user sets"
+                    "%s matches regex %s - Add %s to possible user sets",
+                    value,
+                    pattern,
+                    key,
                 )
                 return True
         except re.error:
@@ -518,14 +611,19 @@ class JupyterHubOutpost(Application):
             glob_pattern = fnmatch.translate(pattern)
             if re.fullmatch(glob_pattern, value):
                 self.log.trace(
-                    f"{value} matches glob {pattern} - Add {key} to possible user sets"
+                    "%s matches glob %s - Add %s to possible user sets",
+                    value,
+                    pattern,
+                    key,
                 )
                 return True
         except re.error:
             pass
 
         if value == pattern:
-            self.log.trace(f"{value} == {pattern} - Add {key} to possible user sets")
+            self.log.trace(
+                "%s == %s - Add %s to possible user sets", value, pattern, key
+            )
             return True
 
         return False
@@ -581,21 +679,24 @@ class JupyterHubOutpost(Application):
         self.log.trace("Check for user specific credits ...")
         self.log.trace(authentication)
         for key, value in credit_config.get("users", {}).items():
-            self.log.trace(f"Check {key} user configuration")
+            self.log.trace("Check %s user configuration", key)
             if "hubs" in value.keys() and jupyterhub_name not in value.get("hubs", []):
-                self.log.trace(f"{jupyterhub_name} not in users.{key}.hubs . Skip")
+                self.log.trace("%s not in users.%s.hubs . Skip", jupyterhub_name, key)
             else:
                 negate_authentication = value.get("negate_authentication", False)
                 matched = False
                 if negate_authentication:
                     self.log.trace(
-                        f"Negate logic for matching user to users.{key}.authentication. So users who don't match the authentication will use this user set"
+                        "Negate logic for matching user to users.%s.authentication. So users who don't match the authentication will use this user set",
+                        key,
                     )
                 for config_auth_key, config_auth_value in value.get(
                     "authentication", {}
                 ).items():
                     self.log.trace(
-                        f"Test if users.{key}.authentication.{config_auth_key} matches with user authentication ..."
+                        "Test if users.%s.authentication.%s matches with user authentication ...",
+                        key,
+                        config_auth_key,
                     )
                     for user_auth_key, user_auth_values in authentication.items():
                         if config_auth_key == user_auth_key:
@@ -603,7 +704,10 @@ class JupyterHubOutpost(Application):
                                 user_auth_values = [user_auth_values]
                             if type(config_auth_value) == str:
                                 self.log.trace(
-                                    f"Test if any user value in {user_auth_key} ({user_auth_values}) matches the regex pattern {config_auth_value}"
+                                    "Test if any user value in %s (%s) matches the regex pattern %s",
+                                    user_auth_key,
+                                    user_auth_values,
+                                    config_auth_value,
                                 )
                                 for user_auth_value in user_auth_values:
                                     if self.matches_pattern(
@@ -612,12 +716,18 @@ class JupyterHubOutpost(Application):
                                         matched = True
                             elif type(config_auth_value) == list:
                                 self.log.trace(
-                                    f"Test if any user value in {user_auth_key} ({user_auth_values}) is in list {config_auth_value}"
+                                    "Test if any user value in %s (%s) is in list %s",
+                                    user_auth_key,
+                                    user_auth_values,
+                                    config_auth_value,
                                 )
                                 for user_auth_value in user_auth_values:
                                     if user_auth_value in config_auth_value:
                                         self.log.trace(
-                                            f"{user_auth_value} in {config_auth_value} - Add {key} to possible user sets"
+                                            "%s in %s - Add %s to possible user sets",
+                                            user_auth_value,
+                                            config_auth_value,
+                                            key,
                                         )
                                         matched = True
                             else:
@@ -625,13 +735,18 @@ class JupyterHubOutpost(Application):
                                     f"credit users.{key}.authentication.{config_auth_key} is type {type(config_auth_value)}. Only list and str (regex or plain comparison) are supported."
                                 )
                     self.log.trace(
-                        f"Test if users.{key}.authentication.{config_auth_key} matches with user authentication ...: {matched}"
+                        "Test if users.%s.authentication.%s matches with user authentication ...: %s",
+                        key,
+                        config_auth_key,
+                        matched,
                     )
                 if (not negate_authentication) and matched:
                     user_sets.append([key, value.get("weight", 0)])
                 elif negate_authentication and (not matched):
                     self.log.trace(
-                        f"User does not match users.{key}.authentication , but since users.{key}.negatve_authentication is true, the user will be added to the user subset"
+                        "User does not match users.%s.authentication , but since users.%s.negatve_authentication is true, the user will be added to the user subset",
+                        key,
+                        key,
                     )
                     user_sets.append([key, value.get("weight", 0)])
         self.log.trace("Check for user specific credits ... done")
@@ -668,7 +783,10 @@ class JupyterHubOutpost(Application):
             credit_config.get("users", {}).get(user_set, {}).get("credits", [])
         )
         self.log.trace(
-            f"users.{user_set}.forbidden is False. Use users.{user_set}.credits ({user_credit_keys}) for this user"
+            "users.%s.forbidden is False. Use users.%s.credits (%s) for this user",
+            user_set,
+            user_set,
+            user_credit_keys,
         )
 
         for creditName, creditValue in all_credits.items():
@@ -676,7 +794,8 @@ class JupyterHubOutpost(Application):
                 user_credits[creditName] = creditValue
 
         self.log.trace(
-            f"Check users.{user_set}.creditsOverride - This allows you to override any config configured globally in credits._credit_"
+            "Check users.%s.creditsOverride - This allows you to override any config configured globally in credits._credit_",
+            user_set,
         )
         for creditName, overrideDict in (
             credit_config.get("users", {})
@@ -691,7 +810,7 @@ class JupyterHubOutpost(Application):
                 continue
             for overrideKey, overrideValue in overrideDict.items():
                 self.log.trace(
-                    f"Override {creditName}.{overrideKey} to user specific values"
+                    "Override %s.%s to user specific values", creditName, overrideKey
                 )
                 user_credits[creditName][overrideKey] = overrideValue
 
@@ -719,21 +838,24 @@ class JupyterHubOutpost(Application):
         self.log.trace("Check for user specific flavors ...")
         self.log.trace(authentication)
         for key, value in flavor_config.get("users", {}).items():
-            self.log.trace(f"Check {key} user configuration")
+            self.log.trace("Check %s user configuration", key)
             if "hubs" in value.keys() and jupyterhub_name not in value.get("hubs", []):
-                self.log.trace(f"{jupyterhub_name} not in users.{key}.hubs . Skip")
+                self.log.trace("%s not in users.%s.hubs . Skip", jupyterhub_name, key)
             else:
                 negate_authentication = value.get("negate_authentication", False)
                 matched = False
                 if negate_authentication:
                     self.log.trace(
-                        f"Negate logic for matching user to users.{key}.authentication. So users who don't match the authentication will use this user set"
+                        "Negate logic for matching user to users.%s.authentication. So users who don't match the authentication will use this user set",
+                        key,
                     )
                 for config_auth_key, config_auth_value in value.get(
                     "authentication", {}
                 ).items():
                     self.log.trace(
-                        f"Test if users.{key}.authentication.{config_auth_key} matches with user authentication ..."
+                        "Test if users.%s.authentication.%s matches with user authentication ...",
+                        key,
+                        config_auth_key,
                     )
                     for user_auth_key, user_auth_values in authentication.items():
                         if config_auth_key == user_auth_key:
@@ -741,7 +863,10 @@ class JupyterHubOutpost(Application):
                                 user_auth_values = [user_auth_values]
                             if type(config_auth_value) == str:
                                 self.log.trace(
-                                    f"Test if any user value in {user_auth_key} ({user_auth_values}) matches the regex pattern {config_auth_value}"
+                                    "Test if any user value in %s (%s) matches the regex pattern %s",
+                                    user_auth_key,
+                                    user_auth_values,
+                                    config_auth_value,
                                 )
                                 for user_auth_value in user_auth_values:
                                     if self.matches_pattern(
@@ -750,12 +875,18 @@ class JupyterHubOutpost(Application):
                                         matched = True
                             elif type(config_auth_value) == list:
                                 self.log.trace(
-                                    f"Test if any user value in {user_auth_key} ({user_auth_values}) is in list {config_auth_value}"
+                                    "Test if any user value in %s (%s) is in list %s",
+                                    user_auth_key,
+                                    user_auth_values,
+                                    config_auth_value,
                                 )
                                 for user_auth_value in user_auth_values:
                                     if user_auth_value in config_auth_value:
                                         self.log.trace(
-                                            f"{user_auth_value} in {config_auth_value} - Add {key} to possible user sets"
+                                            "%s in %s - Add %s to possible user sets",
+                                            user_auth_value,
+                                            config_auth_value,
+                                            key,
                                         )
                                         matched = True
                             else:
@@ -763,13 +894,18 @@ class JupyterHubOutpost(Application):
                                     f"Flavor users.{key}.authentication.{config_auth_key} is type {type(config_auth_value)}. Only list and str (regex or plain comparison) are supported."
                                 )
                     self.log.trace(
-                        f"Test if users.{key}.authentication.{config_auth_key} matches with user authentication ...: {matched}"
+                        "Test if users.%s.authentication.%s matches with user authentication ...: %s",
+                        key,
+                        config_auth_key,
+                        matched,
                     )
                 if (not negate_authentication) and matched:
                     user_sets.append([key, value.get("weight", 0)])
                 elif negate_authentication and (not matched):
                     self.log.trace(
-                        f"User does not match users.{key}.authentication , but since users.{key}.negatve_authentication is true, the user will be added to the user subset"
+                        "User does not match users.%s.authentication , but since users.%s.negatve_authentication is true, the user will be added to the user subset",
+                        key,
+                        key,
                     )
                     user_sets.append([key, value.get("weight", 0)])
         self.log.trace("Check for user specific flavors ... done")
@@ -802,7 +938,10 @@ class JupyterHubOutpost(Application):
             flavor_config.get("users", {}).get(user_set, {}).get("flavors", [])
         )
         self.log.trace(
-            f"users.{user_set}.forbidden is False. Use users.{user_set}.flavors ({user_flavor_keys}) for this user"
+            "users.%s.forbidden is False. Use users.%s.flavors (%s) for this user",
+            user_set,
+            user_set,
+            user_flavor_keys,
         )
 
         for flavorName, flavorValue in all_flavors.items():
@@ -810,7 +949,8 @@ class JupyterHubOutpost(Application):
                 user_flavors[flavorName] = flavorValue
 
         self.log.trace(
-            f"Check users.{user_set}.flavorsOverride - This allows you to override any config configured globally in flavors._flavor_"
+            "Check users.%s.flavorsOverride - This allows you to override any config configured globally in flavors._flavor_",
+            user_set,
         )
         for flavorName, overrideDict in (
             flavor_config.get("users", {})
@@ -825,7 +965,7 @@ class JupyterHubOutpost(Application):
                 continue
             for overrideKey, overrideValue in overrideDict.items():
                 self.log.trace(
-                    f"Override {flavorName}.{overrideKey} to user specific values"
+                    "Override %s.%s to user specific values", flavorName, overrideKey
                 )
                 user_flavors[flavorName][overrideKey] = overrideValue
 
@@ -866,11 +1006,139 @@ class JupyterHubOutpost(Application):
             send_events = self.send_events
         return send_events
 
-    http_client = Any()
+    send_events_batched = Any(
+        default_value=False,
+        config=True,
+        help="""
+        Whether JupyterHub accepts a list of events in one request at
+        JUPYTERHUB_EVENTS_URL. If true, events which were emitted while the
+        previous request was still running are sent together (up to
+        `events_batch_size` events per request).
+        This must be boolean or a callable.
+
+        May be a coroutine.
+
+        Example::
+
+            async def send_events_batched(jupyterhub_name):
+                return jupyterhub_name in ["abc"]
+            c.JupyterHubOutpost.send_events_batched = send_events_batched
+        """,
+    )
+
+    async def get_send_events_batched(self, jupyterhub_name):
+        if callable(self.send_events_batched):
+            send_events_batched = self.send_events_batched(jupyterhub_name)
+            if inspect.isawaitable(send_events_batched):
+                send_events_batched = await send_events_batched
+        else:
+            send_events_batched = self.send_events_batched
+        return send_events_batched
+
+    events_batch_size = Integer(
+        default_value=20,
+        config=True,
+        help="""
+        Maximum number of events sent in one request, if `send_events_batched` is true.
+        """,
+    )
+
+    events_queue_size = Integer(
+        default_value=100,
+        config=True,
+        help="""
+        Maximum number of events per Spawner waiting to be sent to JupyterHub.
+        If JupyterHub does not receive events fast enough, the oldest events
+        will be dropped.
+        """,
+    )
+
+    http_client_backend = Unicode(
+        default_value="auto",
+        config=True,
+        help="""
+        Implementation of the shared HTTP client, used for all requests sent
+        to JupyterHub (events, flavor updates, tunnel restarts, cleanup checks).
+
+        - "simple": tornado's SimpleAsyncHTTPClient. Opens a new connection for
+          each request.
+        - "curl": tornado's CurlAsyncHTTPClient. Reuses keep-alive connections
+          per host and supports HTTP/2. Requires `pycurl`.
+        - "auto": "curl" if `pycurl` is installed, "simple" otherwise.
+        """,
+    )
+
+    http_client_max_clients = Integer(
+        default_value=50,
+        config=True,
+        help="""
+        Maximum number of concurrent requests of the shared HTTP client.
+        Further requests will be queued.
+        """,
+    )
+
+    http_client_dns_cache_timeout = Integer(
+        default_value=300,
+        config=True,
+        help="""
+        Seconds to cache DNS lookups of the shared HTTP client. 0 disables the cache.
+        """,
+    )
+
+    http_client_http2 = Bool(
+        default_value=False,
+        config=True,
+        help="""
+        Use HTTP/2 for requests to JupyterHub if the server supports it.
+        Only available with the "curl" backend.
+        """,
+    )
+
+    circuit_breaker_failure_threshold = Integer(
+        default_value=3,
+        config=True,
+        help="""
+        Number of consecutive failed requests (timeouts, connection errors,
+        5xx responses) to a JupyterHub, before further requests to this
+        JupyterHub fail immediately without being sent.
+        """,
+    )
+
+    circuit_breaker_reset_timeout = Integer(
+        default_value=10,
+        config=True,
+        help="""
+        Seconds until a single probe request is sent to a JupyterHub which
+        was not reachable. If the probe fails, this timeout is doubled
+        (up to `circuit_breaker_max_reset_timeout`).
+        """,
+    )
+
+    circuit_breaker_max_reset_timeout = Integer(
+        default_value=300,
+        config=True,
+        help="""
+        Maximum seconds between two probe requests to an unreachable JupyterHub.
+        """,
+    )
 
-    @default("http_client")
-    def _default_http_client(self):
-        return AsyncHTTPClient(force_instance=True, defaults=dict(validate_cert=False))
+    def init_http_client(self):
+        http_client.circuit_breakers.configure(
+            self.circuit_breaker_failure_threshold,
+            self.circuit_breaker_reset_timeout,
+            self.circuit_breaker_max_reset_timeout,
+        )
+        http_client.configure_http_client(
+            backend=self.http_client_backend,
+            max_clients=self.http_client_max_clients,
+            dns_cache_timeout=self.http_client_dns_cache_timeout,
+            http2=self.http_client_http2,
+            defaults=dict(validate_cert=False),
+        )
+
+    @property
+    def http_client(self):
+        return http_client.get_http_client()
 
     async def _outpostspawner_flavor_max_user_flavor_validation(
         self, db, jupyterhub_name, flavor, user_id
@@ -974,6 +1242,55 @@ class JupyterHubOutpost(Application):
         )
         return ret
 
+    notification_outbox = Bool(
+        default_value=False,
+        config=True,
+        help="""
+        Store flavor updates and failure events for JupyterHub in the database
+        and send them in the background, instead of sending them while
+        handling the request. Failed notifications will be retried and only
+        the latest flavor update per JupyterHub will be sent.
+        """,
+    )
+
+    notification_max_attempts = Integer(
+        default_value=10,
+        config=True,
+        help="""
+        Number of attempts to send a notification from the outbox, before it is dropped.
+        """,
+    )
+
+    start_timings_history = Integer(
+        default_value=100,
+        config=True,
+        help="""
+        Number of start processes whose phase timings (pre spawn hook,
+        Spawner.start, database commit, ...) are kept in memory. They're
+        available at the admin endpoint `/admin/timings`. 0 disables it.
+        """,
+    )
+
+    return_start_timings = Bool(
+        default_value=False,
+        config=True,
+        help="""
+        Add the phase timings of the start process to the response of
+        synchronous start requests (key `timings`).
+        """,
+    )
+
+    def add_start_timings(self, timings):
+        if self.start_timings.maxlen != self.start_timings_history:
+            self.start_timings = deque(
+                self.start_timings, maxlen=self.start_timings_history
+            )
+        self.start_timings.append(timings)
+        self.log.debug(
+            f"{timings.service_name} ({timings.start_id}) for {timings.jupyterhub_name} - Start timings: {timings.phases}"
+        )
+
+    @tracing.traced("send_flavor_update")
     async def _outpostspawner_send_flavor_update(
         self,
         db,
@@ -997,30 +1314,57 @@ class JupyterHubOutpost(Application):
                 f"{service_name} - Do not send flavor update to {jupyterhub_name}"
             )
             return
-        request_header = {
-            "Authorization": f"token {token}",
-            "Content-Type": "application/json",
-            "Accept": "application/json",
-        }
+        if not self.notification_outbox and http_client.circuit_breakers.is_open(
+            flavor_update_url
+        ):
+            self.log.warning(
+                f"{service_name} - {jupyterhub_name} is not reachable. Do not send flavor update to {flavor_update_url}"
+            )
+            return
         body = await self._outpostspawner_get_flavor_values(
             db,
             jupyterhub_name,
             add_one_flavor_count=add_one_flavor_count,
             reduce_one_flavor_count=reduce_one_flavor_count,
         )
+        service_events.publish(db, jupyterhub_name, "flavors", body)
+        request_header = {
+            "Authorization": f"token {token}",
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+        }
+
+        if self.notification_outbox:
+            self.log.debug(
+                f"{service_name} - Add flavor update for {flavor_update_url} to outbox - {body}"
+            )
+            outbox.enqueue(
+                db,
+                jupyterhub_name,
+                outbox.KIND_FLAVOR_UPDATE,
+                flavor_update_url,
+                request_header,
+                body,
+                dedup_key=outbox.flavor_update_key(jupyterhub_name, flavor_update_url),
+            )
+            return
 
         req = HTTPRequest(
             url=flavor_update_url,
             method="POST",
             headers=request_header,
-            body=json.dumps(body),
+            body=json_codec.dumps(body),
             **self.get_request_kwargs(),
         )
         self.log.debug(
             f"{service_name} - Send flavor update to {flavor_update_url} - {body}"
         )
         try:
-            await self.http_client.fetch(req)
+            await http_client.fetch(req)
+        except CircuitOpenError:
+            self.log.warning(
+                f"{service_name} - {jupyterhub_name} is not reachable. Do not send flavor update to {flavor_update_url}"
+            )
         except:
             self.log.exception(
                 f"{service_name} - Could not send flavor update to {flavor_update_url}"
@@ -1038,6 +1382,7 @@ class JupyterHubOutpost(Application):
         internal_trust_bundles,
         state,
         user_flavor,
+        spawner_class_config=None,
     ):
         # self.config.get('spawner_class', LocalProcessSpawner).get()
         # spawner_class = self.config.get("JupyterHubOutpost", {}).get("spawner_class", LocalProcessSpawner)
@@ -1056,6 +1401,7 @@ class JupyterHubOutpost(Application):
             name = service_name
             log = wrapper.log
 
+            @tracing.traced("send_event")
             async def _outpostspawner_send_event(self, event):
                 request_header = {
                     "Authorization": f"token {self.get_env().get('JUPYTERHUB_API_TOKEN')}",
@@ -1063,18 +1409,51 @@ class JupyterHubOutpost(Application):
                     "Accept": "application/json",
                 }
                 event_url = self.get_env().get("JUPYTERHUB_EVENTS_URL", "")
+                # event may be a single event or a list of events
                 req = HTTPRequest(
                     url=event_url,
                     method="POST",
                     headers=request_header,
-                    body=json.dumps(event),
+                    body=json_codec.dumps(event),
                     **wrapper.get_request_kwargs(),
                 )
-                await wrapper.http_client.fetch(req)
+                await http_client.fetch(req)
+
+            async def _outpostspawner_notify_event(self, db, event):
+                # Events which are not part of the progress stream
+                event_url = self.get_env().get("JUPYTERHUB_EVENTS_URL", "")
+                if not event_url:
+                    self.log.debug(
+                        f"{self._log_name} - No events url. Do not send event"
+                    )
+                elif wrapper.notification_outbox:
+                    outbox.enqueue(
+                        db,
+                        self.jupyterhub_name,
+                        outbox.KIND_EVENT,
+                        event_url,
+                        {
+                            "Authorization": f"token {self.get_env().get('JUPYTERHUB_API_TOKEN')}",
+                            "Content-Type": "application/json",
+                            "Accept": "application/json",
+                        },
+                        event,
+                    )
+                else:
+                    await self._outpostspawner_send_event(event)
 
             async def _outpostspawner_forward_events(self):
                 # retrieve progress events from the Spawner
                 self._spawn_pending = True
+                batched = await wrapper.get_send_events_batched(self.jupyterhub_name)
+                forwarder = EventForwarder(
+                    self._outpostspawner_send_event,
+                    self.log,
+                    self._log_name,
+                    maxsize=wrapper.events_queue_size,
+                    batch_size=wrapper.events_batch_size if batched else 1,
+                )
+                forwarder.start()
                 async with aclosing(
                     iterate_until(self._spawn_future, self._generate_progress())
                 ) as events:
@@ -1083,22 +1462,18 @@ class JupyterHubOutpost(Application):
                             # don't allow events to sneakily set the 'ready' flag
                             if "ready" in event:
                                 event.pop("ready", None)
-                            try:
-                                await self._outpostspawner_send_event(event)
-                            except HTTPClientError:
-                                self.log.exception(
-                                    f"{self._log_name} - Could not forward event for {self._log_name}: {event.get('html_message', event.get('message', ''))}"
-                                )
-                                self._spawn_pending = False
-                                return
+                            if not forwarder.put(event):
+                                # JupyterHub did not accept the previous events
+                                break
                     except asyncio.CancelledError:
                         pass
                     finally:
                         self._spawn_pending = False
+                        await forwarder.stop()
                 self._spawn_pending = False
 
+            @metrics.spawner_timer("start")
             async def _outpostspawner_db_start(self, db):
-                wrapper.update_logging()
                 self.log.info(f"{self._log_name} - Start service")
 
                 forward_future = None
@@ -1121,44 +1496,78 @@ class JupyterHubOutpost(Application):
                     raise Exception(f"Start of {self._log_name} was cancelled.")
 
             async def _outpostspawner_db_start_call(self, db):
-                self.clear_state()
-                await maybe_future(self.run_pre_spawn_hook())
+                timings = StartTimings(
+                    self.jupyterhub_name,
+                    self.name,
+                    self.start_id,
+                    type(self).__bases__[-1].__name__,
+                )
+                self._outpostspawner_start_timings = timings
+                try:
+                    ret = await self._outpostspawner_db_start_phases(db, timings)
+                except BaseException:
+                    timings.finish("failure")
+                    raise
+                else:
+                    timings.finish("success")
+                    return ret
+                finally:
+                    wrapper.add_start_timings(timings)
+
+            async def _outpostspawner_db_start_phases(self, db, timings):
+                with timings.phase("clear_state"):
+                    self.clear_state()
+                with timings.phase("pre_spawn_hook"):
+                    await maybe_future(self.run_pre_spawn_hook())
                 if self.cert_paths:
-                    cert_paths = self.move_certs(self.cert_paths)
-                    if inspect.isawaitable(cert_paths):
-                        cert_paths = await cert_paths
-                    self.cert_paths = cert_paths
+                    with timings.phase("move_certs"):
+                        cert_paths = self.move_certs(self.cert_paths)
+                        if inspect.isawaitable(cert_paths):
+                            cert_paths = await cert_paths
+                        self.cert_paths = cert_paths
 
                 try:
-                    ret = await maybe_future(self.start())
-                    if inspect.isawaitable(ret):
-                        ret = await ret
-                    if wrapper.sanitize_start_response:
-                        ret = wrapper.sanitize_start_response(self, ret)
+                    with timings.phase("start"):
+                        ret = await maybe_future(self.start())
                         if inspect.isawaitable(ret):
                             ret = await ret
+                    if wrapper.sanitize_start_response:
+                        with timings.phase("sanitize_start_response"):
+                            ret = wrapper.sanitize_start_response(self, ret)
+                            if inspect.isawaitable(ret):
+                                ret = await ret
                     if type(ret) == tuple and len(ret) == 2:
                         ret = f"{ret[0]}:{ret[1]}"
                 except:
                     self.log.exception(f"{self._log_name} - Start failed")
                     raise
-                service = get_service(jupyterhub_name, self.name, self.start_id, db)
+                with timings.phase("db_commit"):
+                    service = get_service(jupyterhub_name, self.name, self.start_id, db)
 
-                runtime = False
-                try:
-                    runtime = self.flavor.get("runtime", False)
-                except:
-                    pass
-                if runtime:
-                    service.end_date = datetime.now(timezone.utc) + timedelta(**runtime)
-                    self.log.info(
-                        f"{self._log_name} - Set end_date: {service.end_date}"
-                    )
-                service.state = encrypt(self.get_state())
-                service.state_stored = True
-                service.start_response = encrypt({"service": ret})
-                db.add(service)
-                db.commit()
+                    runtime = False
+                    try:
+                        runtime = self.flavor.get("runtime", False)
+                    except:
+                        pass
+                    if runtime:
+                        service.end_date = datetime.now(timezone.utc) + timedelta(
+                            **runtime
+                        )
+                        self.log.info(
+                            f"{self._log_name} - Set end_date: {service.end_date}"
+                        )
+                    service.state = encrypt(self.get_state())
+                    service.state_stored = True
+                    service.start_response = encrypt({"service": ret})
+                    db.add(service)
+                    db.commit()
+                state_events.notify(db, jupyterhub_name, self.name, self.start_id)
+                service_events.publish(
+                    db,
+                    jupyterhub_name,
+                    "started",
+                    {"name": self.name, "start_id": self.start_id, "service": ret},
+                )
                 return ret
 
             def short_logs(self, log_list, lines):
@@ -1185,9 +1594,9 @@ class JupyterHubOutpost(Application):
                 logs_s = "<br>".join(log_list_short_escaped)
                 return f'<details open><summary style="color: red; font-weight: bold; cursor: pointer;">{summary} (click here to see logs)</summary>{logs_s}</details>'
 
+            @metrics.spawner_timer("poll")
             async def _outpostspawner_db_poll(self, db, collect_logs=False):
                 # Update from db
-                wrapper.update_logging()
                 self.log.debug(f"{self._log_name} - Poll service")
 
                 service = get_service(jupyterhub_name, self.name, self.start_id, db)
@@ -1220,6 +1629,15 @@ class JupyterHubOutpost(Application):
                 if inspect.isawaitable(ret):
                     ret = await ret
 
+                if ret is not None:
+                    # Exit status 0 is a clean exit
+                    service_events.publish(
+                        db,
+                        jupyterhub_name,
+                        "stopped" if ret == 0 else "poll_failed",
+                        {"name": self.name, "start_id": self.start_id, "status": ret},
+                    )
+
                 if ret is not None and ret != 0:
                     logs = []
                     if hasattr(self, "get_jupyter_server_logs") and callable(
@@ -1249,7 +1667,11 @@ class JupyterHubOutpost(Application):
                                     "html_message"
                                 ] = "Could not start service. No logs available."
                             try:
-                                await self._outpostspawner_send_event(event)
+                                await self._outpostspawner_notify_event(db, event)
+                            except CircuitOpenError:
+                                self.log.warning(
+                                    f"{self._log_name} - {self.jupyterhub_name} is not reachable. Could not send event for {self._log_name}"
+                                )
                             except HTTPClientError:
                                 self.log.exception(
                                     f"{self._log_name} - Could not send event for {self._log_name}: {event.get('html_message', event.get('message', ''))}"
@@ -1262,8 +1684,8 @@ class JupyterHubOutpost(Application):
                     db.commit()
                 return ret, logs
 
+            @metrics.spawner_timer("stop")
             async def _outpostspawner_db_stop(self, db, now=False, collect_logs=False):
-                wrapper.update_logging()
                 self.log.info(f"{self._log_name} - Stop service")
                 logs = []
                 if (
@@ -1313,17 +1735,19 @@ class JupyterHubOutpost(Application):
             if inspect.isawaitable(allow_override):
                 allow_override = await allow_override
 
-        # Update config file for each Spawner creation
-        config_file = os.environ.get("OUTPOST_CONFIG_FILE", "spawner_config.py")
         spawner_class_name = (
             wrapper.config.get("JupyterHubOutpost", {})
             .get("spawner_class", LocalProcessSpawner)
             .__name__
         )
-        if spawner_class_name in wrapper.config:
-            del wrapper.config[spawner_class_name]
-        wrapper.load_config_file(config_file)
-        config = wrapper.config.get(spawner_class_name, {})
+        if spawner_class_config is None:
+            # Update config file for each Spawner creation
+            spawner_class_config = wrapper.load_spawner_class_config()
+        # Overrides must not change the loaded config, it may be shared
+        config = spawner_class_config.copy()
+        for key, value in config.items():
+            if isinstance(value, dict):
+                config[key] = copy.copy(value)
         user = OutpostUser(orig_body, auth_state)
         if allow_override:
             for key, value in orig_body.get("misc", {}).items():
@@ -1505,96 +1929,195 @@ class JupyterHubOutpost(Application):
                 _log.removeHandler(_log.handlers[0])
 
             _log.setLevel(5)
+        self.update_logger_levels()
+
+    def update_logger_levels(self):
+        # Handlers filter records by their own level. Use the lowest level of
+        # all handlers for the loggers, so disabled levels (usually trace) are
+        # dropped before the message is formatted.
+        for _log in [outpost_log, self.log]:
+            levels = [handler.level or 5 for handler in _log.handlers]
+            _log.setLevel(min(levels) if levels else logging.WARNING)
+
+    def create_log_handler(self, handler_name, handler_config):
+        configuration = copy.deepcopy(handler_config)
+
+        # map some special values
+        if handler_name == "stream":
+            if configuration["stream"] == "ext://sys.stdout":
+                configuration["stream"] = sys.stdout
+            elif configuration["stream"] == "ext://sys.stderr":
+                configuration["stream"] = sys.stderr
+        elif handler_name == "syslog":
+            if configuration["socktype"] == "ext://socket.SOCK_STREAM":
+                configuration["socktype"] = socket.SOCK_STREAM
+            elif configuration["socktype"] == "ext://socket.SOCK_DGRAM":
+                configuration["socktype"] = socket.SOCK_DGRAM
+
+        _ = configuration.pop("enabled")
+        formatter_name = configuration.pop("formatter")
+        level = logging_utils.get_level(configuration.pop("level"))
+        queue_size = configuration.pop("queue_size", 10000)
+        overflow = configuration.pop("overflow", "drop_new")
+        none_keys = []
+        for key, value in configuration.items():
+            if value is None:
+                none_keys.append(key)
+        for x in none_keys:
+            _ = configuration.pop(x)
+
+        # Create handler, formatter, and add it
+        handler = logging_utils.supported_handler_classes[handler_name](**configuration)
+        formatter = logging_utils.supported_formatter_classes[formatter_name](
+            **logging_utils.supported_formatter_kwargs[formatter_name]
+        )
+        handler.name = handler_name
+        handler.setLevel(level)
+        handler.setFormatter(formatter)
+        if queue_size:
+            # Emit records in a separate thread, so slow
+            # handlers (smtp, syslog via tcp) never block
+            handler = logging_utils.NonBlockingQueueHandler(
+                handler, queue_size=queue_size, overflow=overflow
+            )
+
+        rate_limit = self.logging_config_cache.get("rate_limit", [])
+        if rate_limit:
+            handler.addFilter(logging_utils.RateLimitFilter(handler, rate_limit))
+
+        if "filename" in configuration:
+            # filename is already used in log.x(extra)
+            configuration["file_name"] = configuration["filename"]
+            del configuration["filename"]
+        return handler, configuration
+
+    logging_config_check_interval = Integer(
+        default_value=5,
+        config=True,
+        help="""
+        Seconds between checks for changes of the logging config file,
+        if inotify is not available. With inotify, changes are applied
+        immediately.
+        """,
+    )
 
     def update_logging(self):
+        """
+        Applies changes of the logging config file. Called at start and by
+        the file watcher (see `file_watcher.watch`), not in request handling.
+        """
         try:
             last_change = os.path.getmtime(self.logging_config_file)
+        except OSError:
+            if not self.logging_config_missing:
+                self.log.warning(
+                    f"Could not load logging config {self.logging_config_file}"
+                )
+                self.logging_config_missing = True
+            return
+        self.logging_config_missing = False
+        if last_change <= self.logging_config_last_update:
+            return
+
+        self.log.debug("Update logging config")
+        self.logging_config_last_update = last_change
+        try:
+            with open(self.logging_config_file, "r") as f:
+                logging_config = yaml.full_load(f)
         except:
             self.log.exception(
                 f"Could not load logging config {self.logging_config_file}"
             )
-            last_change = 0
-        if last_change > self.logging_config_last_update:
-            self.log.debug("Update logging config")
-            with open(self.logging_config_file, "r") as f:
-                ret = yaml.full_load(f)
-
-            self.logging_config_cache = ret
-
-            self.logging_config_last_update = last_change
-
-            for _log in [outpost_log, self.log]:
-                logger_handlers = _log.handlers
-                handler_names = [x.name for x in logger_handlers]
-
-                for handler_name, handler_config in self.logging_config_cache.items():
-                    if (
-                        not handler_config.get("enabled", False)
-                    ) and handler_name in handler_names:
-                        # Handler was disabled, remove it
-                        _log.debug(f"Logging handler remove ({handler_name}) ... ")
-                        _log.handlers = [
-                            x for x in logger_handlers if x.name != handler_name
-                        ]
-                        _log.debug(f"Logging handler remove ({handler_name}) ... done")
-                    elif handler_config.get("enabled", False):
-                        # Recreate handlers which has changed their config
-                        configuration = copy.deepcopy(handler_config)
-
-                        # map some special values
-                        if handler_name == "stream":
-                            if configuration["stream"] == "ext://sys.stdout":
-                                configuration["stream"] = sys.stdout
-                            elif configuration["stream"] == "ext://sys.stderr":
-                                configuration["stream"] = sys.stderr
-                        elif handler_name == "syslog":
-                            if configuration["socktype"] == "ext://socket.SOCK_STREAM":
-                                configuration["socktype"] = socket.SOCK_STREAM
-                            elif configuration["socktype"] == "ext://socket.SOCK_DGRAM":
-                                configuration["socktype"] = socket.SOCK_DGRAM
-
-                        _ = configuration.pop("enabled")
-                        formatter_name = configuration.pop("formatter")
-                        level = logging_utils.get_level(configuration.pop("level"))
-                        none_keys = []
-                        for key, value in configuration.items():
-                            if value is None:
-                                none_keys.append(key)
-                        for x in none_keys:
-                            _ = configuration.pop(x)
-
-                        # Create handler, formatter, and add it
-                        handler = logging_utils.supported_handler_classes[handler_name](
-                            **configuration
+            return
+        self.logging_config_cache = logging_config
+
+        closing = []
+        # outpost_log and self.log are usually the same logger
+        for _log in dict.fromkeys([outpost_log, self.log]):
+            handlers = []
+            replaced = []
+            added = []
+            for handler in _log.handlers:
+                if handler.name in self.logging_config_cache:
+                    replaced.append(handler)
+                else:
+                    handlers.append(handler)
+            for handler_name, handler_config in self.logging_config_cache.items():
+                if handler_name not in logging_utils.supported_handler_classes:
+                    # e.g. rate_limit
+                    continue
+                if handler_config.get("enabled", False):
+                    try:
+                        handler, configuration = self.create_log_handler(
+                            handler_name, handler_config
                         )
-                        formatter = logging_utils.supported_formatter_classes[
-                            formatter_name
-                        ](**logging_utils.supported_formatter_kwargs[formatter_name])
-                        handler.name = handler_name
-                        handler.setLevel(level)
-                        handler.setFormatter(formatter)
-                        if handler_name in handler_names:
-                            # Remove previously added handler
-                            _log.handlers = [
-                                x for x in logger_handlers if x.name != handler_name
-                            ]
-                        _log.addHandler(handler)
-
-                        if "filename" in configuration:
-                            # filename is already used in log.x(extra)
-                            configuration["file_name"] = configuration["filename"]
-                            del configuration["filename"]
-                        _log.debug(
-                            f"Logging handler added ({handler_name})",
-                            extra=configuration,
+                    except:
+                        self.log.exception(
+                            f"Could not create logging handler {handler_name}"
                         )
+                        continue
+                    handlers.append(handler)
+                    added.append((handler_name, configuration))
+
+            # Swap all handlers at once, so no record is logged twice or lost
+            _log.handlers = handlers
+            closing.extend(replaced)
+            for handler in replaced:
+                if handler.name not in [name for name, _ in added]:
+                    _log.debug(f"Logging handler removed ({handler.name})")
+            for handler_name, configuration in added:
+                _log.debug(
+                    f"Logging handler added ({handler_name})",
+                    extra=configuration,
+                )
+        if closing:
+            logging_utils.close_handlers(closing)
+        self.update_logger_levels()
+
+    # get_file_version of the config file, when it was loaded last
+    config_file_version = None
+
+    def load_config_file(self, filename, *args, **kwargs):
+        version = get_file_version(filename)
+        super().load_config_file(filename, *args, **kwargs)
+        self.config_file_version = version
+
+    def load_spawner_class_config(self):
+        """
+        Loads the config file again and returns the config of the spawner
+        class. Requests starting multiple services load it once and pass it
+        to get_spawner.
+        """
+        config_file = os.environ.get("OUTPOST_CONFIG_FILE", "spawner_config.py")
+        spawner_class_name = (
+            self.config.get("JupyterHubOutpost", {})
+            .get("spawner_class", LocalProcessSpawner)
+            .__name__
+        )
+        if spawner_class_name in self.config:
+            del self.config[spawner_class_name]
+        with tracing.span("load_config_file", config_file=config_file):
+            self.load_config_file(config_file)
+        return self.config.get(spawner_class_name, {})
+
+    def reload_config_file(self):
+        """
+        Loads the config file again, if it changed since it was loaded
+        last. Returns its version.
+        """
+        config_file = os.environ.get("OUTPOST_CONFIG_FILE", "spawner_config.py")
+        if get_file_version(config_file) != self.config_file_version:
+            self.load_config_file(config_file)
+        return self.config_file_version
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.spawners = {}
+        self.start_timings = deque(maxlen=self.start_timings_history)
         config_file = os.environ.get("OUTPOST_CONFIG_FILE", "spawner_config.py")
         self.load_config_file(config_file)
         self.init_logging()
+        self.init_http_client()
         self.log.debug(f"Load config file: {config_file}")
         self.log.info("Start JupyterHub Outpost Version <VERSION>")
 
@@ -0,0 +1,59 @@
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from datetime import timezone
+
+import tracing
+
+
+class StartTimings:
+    """
+    Duration of each phase of one start process (pre spawn hook, Spawner.start,
+    database commit, ...), to find out where slow starts spend their time.
+    """
+
+    def __init__(self, jupyterhub_name, service_name, start_id, spawner_class):
+        self.jupyterhub_name = jupyterhub_name
+        self.service_name = service_name
+        self.start_id = start_id
+        self.spawner_class = spawner_class
+        self.started = datetime.now(timezone.utc)
+        self.status = "running"
+        self.phases = []
+        self._start = time.perf_counter()
+        self._end = None
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        status = "failure"
+        try:
+            with tracing.span(f"spawner.{name}"):
+                yield
+            status = "success"
+        finally:
+            self.phases.append(
+                {
+                    "name": name,
+                    "offset": round(start - self._start, 6),
+                    "duration": round(time.perf_counter() - start, 6),
+                    "status": status,
+                }
+            )
+
+    def finish(self, status):
+        self.status = status
+        self._end = time.perf_counter()
+
+    def to_dict(self):
+        end = self._end or time.perf_counter()
+        return {
+            "jupyterhub": self.jupyterhub_name,
+            "service": self.service_name,
+            "start_id": self.start_id,
+            "spawner_class": self.spawner_class,
+            "started": self.started.isoformat(),
+            "status": self.status,
+            "duration": round(end - self._start, 6),
+            "phases": self.phases,
+        }
@@ -3,8 +3,28 @@ import os
 import yaml
 
 
+def get_credits_path():
+    return os.environ.get("OUTPOST_CREDITS_PATH", "/mnt/credits/credits.yaml")
+
+
+def get_flavors_path():
+    return os.environ.get("OUTPOST_FLAVORS_PATH", "/mnt/flavors/flavors.yaml")
+
+
+def get_file_version(path):
+    """
+    Changes whenever the file is changed or replaced. None, if it does
+    not exist.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
 def get_credits_from_disk():
-    path = os.environ.get("OUTPOST_CREDITS_PATH", "/mnt/credits/credits.yaml")
+    path = get_credits_path()
     if (not os.path.exists(path)) or (not os.path.isfile(path)):
         return {}
     with open(path, "r") as f:
@@ -13,7 +33,7 @@ def get_credits_from_disk():
 
 
 def get_flavors_from_disk():
-    path = os.environ.get("OUTPOST_FLAVORS_PATH", "/mnt/flavors/flavors.yaml")
+    path = get_flavors_path()
     if (not os.path.exists(path)) or (not os.path.isfile(path)):
         return {}
     with open(path, "r") as f:
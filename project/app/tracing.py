@@ -0,0 +1,238 @@
+"""
+Lightweight tracing, modelled after OpenTelemetry.
+
+Disabled by default. Enable it with the environment variable
+OUTPOST_TRACING_EXPORTER:
+  - "memory": keep the last OUTPOST_TRACING_MEMORY_SIZE (default: 1000) spans
+              in memory (see `get_exporter().spans`)
+  - "file": append spans as JSON lines to OUTPOST_TRACING_FILE
+            (default: /tmp/outpost_traces.jsonl)
+
+Incoming requests continue the trace of a W3C `traceparent` header
+(see TracingMiddleware), outgoing requests to JupyterHub carry the
+`traceparent` of the current span.
+"""
+import functools
+import inspect
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger_name = os.environ.get("LOGGER_NAME", "JupyterHubOutpost")
+log = logging.getLogger(logger_name)
+
+_traceparent_re = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_current_span = ContextVar("outpost_current_span", default=None)
+_exporter = None
+
+
+class Span:
+    def __init__(self, name, trace_id, parent_span_id=None, attributes={}):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent_span_id
+        self.attributes = dict(attributes)
+        self.status = "ok"
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def end(self):
+        self.duration = time.perf_counter() - self._start
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "start_time": self.start_time,
+            "duration": self.duration,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class InMemoryExporter:
+    def __init__(self, maxlen=1000):
+        self.spans = deque(maxlen=maxlen)
+
+    def export(self, span):
+        self.spans.append(span.to_dict())
+
+    def clear(self):
+        self.spans.clear()
+
+
+class FileExporter:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+
+
+def configure(exporter):
+    """
+    Set the exporter for finished spans. None disables tracing.
+    """
+    global _exporter
+    _exporter = exporter
+
+
+def configure_from_env():
+    exporter = os.environ.get("OUTPOST_TRACING_EXPORTER", "").lower()
+    if exporter == "memory":
+        maxlen = int(os.environ.get("OUTPOST_TRACING_MEMORY_SIZE", "1000"))
+        configure(InMemoryExporter(maxlen))
+    elif exporter == "file":
+        path = os.environ.get("OUTPOST_TRACING_FILE", "/tmp/outpost_traces.jsonl")
+        configure(FileExporter(path))
+    elif exporter:
+        log.warning(f"Tracing exporter {exporter} not supported. Use memory or file.")
+
+
+def get_exporter():
+    return _exporter
+
+
+def enabled():
+    return _exporter is not None
+
+
+def parse_traceparent(header):
+    """
+    Returns (trace_id, parent_span_id) of a W3C traceparent header or None.
+    """
+    match = _traceparent_re.match((header or "").strip().lower())
+    if not match or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+        return None
+    return match.group(1), match.group(2)
+
+
+def current_span():
+    return _current_span.get()
+
+
+def current_traceparent():
+    span = _current_span.get()
+    return span.traceparent if span else None
+
+
+@contextmanager
+def span(name, traceparent=None, **attributes):
+    """
+    Start a span as child of the current span. If there is no current span,
+    the trace of `traceparent` (header value) is continued or a new trace
+    is started.
+    """
+    if _exporter is None:
+        yield None
+        return
+    parent = _current_span.get()
+    if parent:
+        trace_id, parent_span_id = parent.trace_id, parent.span_id
+    else:
+        trace_id, parent_span_id = parse_traceparent(traceparent) or (
+            secrets.token_hex(16),
+            None,
+        )
+    _span = Span(name, trace_id, parent_span_id, attributes)
+    token = _current_span.set(_span)
+    try:
+        yield _span
+    except BaseException as e:
+        _span.status = "error"
+        _span.set_attribute("exception", repr(e))
+        raise
+    finally:
+        _current_span.reset(token)
+        _span.end()
+        try:
+            _exporter.export(_span)
+        except:
+            log.exception(f"Could not export span {name}")
+
+
+def traced(name=None):
+    """
+    Decorator which runs the function (or coroutine function) in a span.
+    """
+
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if _exporter is None:
+                    return await func(*args, **kwargs)
+                with span(span_name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _exporter is None:
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware, which runs each request in a span.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or _exporter is None:
+            return await self.app(scope, receive, send)
+        traceparent = None
+        for key, value in scope.get("headers", []):
+            if key == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+        with span(
+            f"{scope['method']} {scope['path']}",
+            traceparent=traceparent,
+            **{"http.method": scope["method"], "http.target": scope["path"]},
+        ) as request_span:
+
+            async def send_with_status(message):
+                if message["type"] == "http.response.start":
+                    request_span.set_attribute("http.status_code", message["status"])
+                await send(message)
+
+            await self.app(scope, receive, send_with_status)
+
+
+configure_from_env()
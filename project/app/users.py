@@ -2,52 +2,203 @@
 We're using a environment user base.
 You just have to add a semicolon separated in `usernames` 
 and `passwords`.
+Users listed in `admin_usernames` may use the /admin endpoints.
+Passwords are only kept as keyed hashes in memory.
+
+Alternatively, JupyterHubs can use bearer tokens. The sha256 hashes of
+the tokens are listed in the file at `OUTPOST_TOKENS_PATH`, together with
+the JupyterHub name and the scopes of each token. The file is reloaded
+when it changes.
 """
+import hashlib
+import hmac
 import logging
 import os
 from typing import Annotated
+from typing import Optional
 
-from database.schemas import decrypt
-from database.schemas import encrypt
+import yaml
 from fastapi import Depends
 from fastapi import HTTPException
 from fastapi import status
+from fastapi.security import HTTPAuthorizationCredentials
 from fastapi.security import HTTPBasic
 from fastapi.security import HTTPBasicCredentials
+from fastapi.security import HTTPBearer
 
 log = logging.getLogger("uvicorn")
 
 
-security = HTTPBasic()
+security = HTTPBasic(auto_error=False)
+bearer = HTTPBearer(auto_error=False)
+
+# `services`: all endpoints used by JupyterHub, `admin`: the /admin endpoints
+# and /metrics, `metrics`: only /metrics (e.g. for Prometheus)
+supported_scopes = ["services", "admin", "metrics"]
 
 
 _users = {}
 
+# Passwords are server generated secrets, so a keyed hash is enough. It
+# takes microseconds, failed attempts cannot exhaust the workers. The key
+# is created per process and never leaves the memory.
+_hash_key = os.urandom(32)
+
+
+def hash_password(username, password):
+    return hmac.digest(_hash_key, f"{username}\0{password}".encode(), "sha256")
+
+
+def load_users():
+    """
+    Reads the users of the `usernames` and `passwords` env variables.
+    Called at startup.
+    """
+    usernames_via_env = [x for x in os.environ.get("usernames", "").split(";") if x]
+    passwords_via_env = [x for x in os.environ.get("passwords", "").split(";") if x]
+    users = {}
+    for i in range(len(usernames_via_env)):
+        if i >= len(passwords_via_env):
+            log.warning(
+                f"No password available for {usernames_via_env[i]}. User not created."
+            )
+        else:
+            users[usernames_via_env[i]] = hash_password(
+                usernames_via_env[i], passwords_via_env[i]
+            )
+    _users.clear()
+    _users.update(users)
+
 
 def get_users():
-    global _users
     if not _users:
-        usernames_via_env = [x for x in os.environ.get("usernames", "").split(";") if x]
-        passwords_via_env = [x for x in os.environ.get("passwords", "").split(";") if x]
-        if usernames_via_env and passwords_via_env:
-            for i in range(len(usernames_via_env)):
-                if i >= len(passwords_via_env):
-                    log.warning(
-                        f"No password available for {usernames_via_env[i]}. User not created."
-                    )
-                else:
-                    _users[usernames_via_env[i]] = encrypt(passwords_via_env[i])
+        load_users()
     return _users
 
 
-def verify_user(credentials: Annotated[HTTPBasicCredentials, Depends(security)]):
-    users = get_users()
-    if credentials.username not in users.keys() or not credentials.password == decrypt(
-        users[credentials.username], return_type="str"
-    ):
+def check_credentials(username, password):
+    stored_hash = get_users().get(username)
+    # Unknown usernames take as long as known ones
+    valid = hmac.compare_digest(
+        hash_password(username, password), stored_hash or bytes(32)
+    )
+    return valid and stored_hash is not None
+
+
+def get_tokens_path():
+    return os.environ.get("OUTPOST_TOKENS_PATH", "")
+
+
+# sha256 hex digest of the token -> (jupyterhub name, scopes)
+_tokens = {}
+_tokens_last_update = 0
+
+
+def load_tokens(path):
+    """
+    Reads the token file:
+
+    tokens:
+      - jupyterhub_name: hub-one
+        sha256: <sha256 hex digest of the token>
+        scopes: ["services"]
+    """
+    with open(path, "r") as f:
+        config = yaml.full_load(f) or {}
+    tokens = {}
+    for entry in config.get("tokens", []):
+        scopes = entry.get("scopes", ["services"])
+        unknown = [x for x in scopes if x not in supported_scopes]
+        if unknown:
+            log.warning(
+                f"Token of {entry['jupyterhub_name']} has unknown scopes {unknown}. Supported: {supported_scopes}"
+            )
+        tokens[entry["sha256"].lower()] = (entry["jupyterhub_name"], frozenset(scopes))
+    return tokens
+
+
+def update_tokens():
+    """
+    Reloads the token file, if it changed. If it's removed, all tokens
+    are revoked. If it cannot be parsed, the previous tokens stay valid.
+    """
+    global _tokens, _tokens_last_update
+    path = get_tokens_path()
+    if not path:
+        return
+    try:
+        last_change = os.path.getmtime(path)
+    except FileNotFoundError:
+        if _tokens_last_update:
+            log.warning(f"{path} does not exist. Revoke all tokens")
+        _tokens = {}
+        _tokens_last_update = 0
+        return
+    if last_change == _tokens_last_update:
+        return
+    try:
+        tokens = load_tokens(path)
+    except:
+        log.exception(f"Could not load tokens from {path}")
+        return
+    _tokens = tokens
+    _tokens_last_update = last_change
+    log.info(f"Loaded {len(tokens)} tokens from {path}")
+
+
+def get_identity(
+    credentials: Annotated[Optional[HTTPBasicCredentials], Depends(security)],
+    token: Annotated[Optional[HTTPAuthorizationCredentials], Depends(bearer)],
+):
+    """
+    Returns the name of the JupyterHub and its scopes.
+    """
+    if token is not None:
+        identity = _tokens.get(hashlib.sha256(token.credentials.encode()).hexdigest())
+        if identity is not None:
+            return identity
+    elif credentials is not None:
+        if check_credentials(credentials.username, credentials.password):
+            scopes = {"services"}
+            if credentials.username in get_admin_users():
+                scopes.add("admin")
+            return credentials.username, scopes
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Incorrect username or password",
+        headers={"WWW-Authenticate": "Basic"},
+    )
+
+
+def get_admin_users():
+    return [x for x in os.environ.get("admin_usernames", "").split(";") if x]
+
+
+def verify_user(identity: Annotated[tuple, Depends(get_identity)]):
+    username, scopes = identity
+    if "services" not in scopes:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Scope services required",
+        )
+    return username
+
+
+def verify_admin(identity: Annotated[tuple, Depends(get_identity)]):
+    username, scopes = identity
+    if "admin" not in scopes:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin permissions required",
+        )
+    return username
+
+
+def verify_metrics(identity: Annotated[tuple, Depends(get_identity)]):
+    username, scopes = identity
+    if not scopes & {"metrics", "admin"}:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Incorrect username or password",
-            headers={"WWW-Authenticate": "Basic"},
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Scope metrics required",
         )
-    return credentials.username
+    return username
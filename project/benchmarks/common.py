@@ -0,0 +1,209 @@
+"""
+Helpers shared by the benchmarks.
+
+The benchmarks import the modules of `project/app` directly. The database
+module reads its configuration at import time, so call `setup_environment`
+before importing anything from the app.
+"""
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+from datetime import timezone
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+project_dir = os.path.dirname(benchmarks_dir)
+app_dir = os.path.join(project_dir, "app")
+
+supported_databases = ["sqlite", "postgresql"]
+
+
+def add_database_argument(parser):
+    parser.add_argument(
+        "--db",
+        choices=supported_databases,
+        default="sqlite",
+        help="sqlite uses a new file in a temporary directory. postgresql uses the SQL_HOST, SQL_PORT, SQL_USER, SQL_PASSWORD and SQL_DATABASE environment variables. Use a dedicated database, its tables will be modified.",
+    )
+
+
+def add_output_arguments(parser, default_keys="p95"):
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument(
+        "--baseline",
+        help="JSON file of a previous run. Exit with 1, if a result regressed by more than --threshold",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Allowed regression compared to --baseline (default: 0.2 = 20%%)",
+    )
+    parser.add_argument(
+        "--regression-keys",
+        default=default_keys,
+        help=f"Comma separated result keys compared to --baseline (default: {default_keys})",
+    )
+
+
+def finish(args, benchmark, results, columns=("count", "p50", "p95", "p99", "max")):
+    """
+    Print and store results, compare them with the baseline.
+    """
+    print_results(results, columns)
+    if args.output:
+        write_json(args.output, benchmark, vars(args), results)
+    if args.baseline:
+        regressions = check_regressions(
+            results, args.baseline, args.threshold, args.regression_keys.split(",")
+        )
+        report_regressions(regressions, args.threshold)
+
+
+logging_config_template = """
+stream:
+  enabled: true
+  level: {level}
+  formatter: simple
+  stream: ext://sys.stderr
+"""
+
+
+def setup_environment(db="sqlite", log_level="ERROR"):
+    """
+    Configure database, encryption key and logging for the app modules and
+    make them importable. Returns a temporary directory for the benchmark.
+    """
+    from cryptography.fernet import Fernet
+
+    tmp_dir = tempfile.mkdtemp(prefix="outpost-benchmark-")
+    os.environ.setdefault("OUTPOST_CRYPT_KEY", Fernet.generate_key().decode())
+    if db == "sqlite":
+        os.environ["SQL_TYPE"] = "sqlite"
+        os.environ["SQL_DATABASE_URL"] = os.path.join(tmp_dir, "sqlite.db")
+    elif db == "postgresql":
+        missing = [
+            key
+            for key in ["SQL_HOST", "SQL_USER", "SQL_PASSWORD", "SQL_DATABASE"]
+            if not os.environ.get(key)
+        ]
+        if missing:
+            raise SystemExit(f"Set {', '.join(missing)} to use postgresql.")
+        os.environ["SQL_TYPE"] = "postgresql"
+    else:
+        raise SystemExit(
+            f"Database {db} not supported. Use one of {supported_databases}."
+        )
+    # Benchmarks should measure the Outpost, not the terminal
+    if "LOGGING_CONFIG_PATH" not in os.environ:
+        logging_config = os.path.join(tmp_dir, "logging_config.yaml")
+        with open(logging_config, "w") as f:
+            f.write(logging_config_template.format(level=log_level))
+        os.environ["LOGGING_CONFIG_PATH"] = logging_config
+    if app_dir not in sys.path:
+        sys.path.insert(0, app_dir)
+    return tmp_dir
+
+
+def percentile(sorted_values, p):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(durations, elapsed=None, errors=0):
+    """
+    Statistics of a list of durations (in seconds). Times in the result
+    are in milliseconds.
+    """
+    values = sorted(durations)
+    ret = {
+        "count": len(values),
+        "errors": errors,
+        "mean": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+        "p50": round(percentile(values, 50) * 1000, 3),
+        "p95": round(percentile(values, 95) * 1000, 3),
+        "p99": round(percentile(values, 99) * 1000, 3),
+        "max": round(values[-1] * 1000, 3) if values else 0.0,
+    }
+    if elapsed:
+        ret["throughput"] = round(len(values) / elapsed, 3)
+    return ret
+
+
+def time_call(func, *args, repeat=5, **kwargs):
+    """
+    Run func `repeat` times, returns the durations in seconds.
+    """
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def print_results(results, columns=("count", "p50", "p95", "p99", "max")):
+    name_width = max([len(name) for name in results] + [4])
+    print(f"{'name':<{name_width}}  " + "  ".join(f"{c:>12}" for c in columns))
+    for name, values in results.items():
+        print(
+            f"{name:<{name_width}}  "
+            + "  ".join(f"{values.get(c, ''):>12}" for c in columns)
+        )
+
+
+def write_json(path, benchmark, parameters, results):
+    data = {
+        "benchmark": benchmark,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": parameters,
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+    print(f"Results written to {path}")
+
+
+def check_regressions(results, baseline_path, threshold, keys=("p95",)):
+    """
+    Compare results with the results of a previous run (JSON file written by
+    `write_json`). Returns a list of regressions. Lower values are better
+    for all keys except `throughput` and `ops_per_sec`.
+    """
+    with open(baseline_path, "r") as f:
+        baseline = json.load(f).get("results", {})
+    regressions = []
+    for name, values in results.items():
+        for key in keys:
+            if key not in values or key not in baseline.get(name, {}):
+                continue
+            old, new = baseline[name][key], values[key]
+            if not old:
+                continue
+            if key in ["throughput", "ops_per_sec"]:
+                regressed = new < old * (1 - threshold)
+            else:
+                regressed = new > old * (1 + threshold)
+            if regressed:
+                regressions.append(f"{name} {key}: {old} -> {new}")
+    return regressions
+
+
+def report_regressions(regressions, threshold):
+    if regressions:
+        print(f"Regressions (threshold {threshold:.0%}):")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print(f"No regressions (threshold {threshold:.0%})")
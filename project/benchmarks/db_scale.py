@@ -0,0 +1,279 @@
+"""
+Scale benchmark of the service table.
+
+Seeds the database with a growing number of services, spread across
+JupyterHubs, flavors and users, and times the code paths which read the
+service table:
+
+get_service        lookup of single services (random, existing ones)
+get_services_all   all services of one JupyterHub and of all JupyterHubs
+flavor_group_by    current flavor usage of one JupyterHub
+check_enddates     one iteration of the background end date check
+                   (no service expired)
+recreate_tunnels   tunnel recreation at start up, with ssh_recreate_at_start
+                   enabled (services have no tunnel url, no requests are sent)
+
+Examples:
+    python benchmarks/db_scale.py --sizes 1000,10000,100000
+    python benchmarks/db_scale.py --db postgresql --sizes 1000,1000000 --output db.json
+    python benchmarks/db_scale.py --skip get_services_all --sizes 1000000
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from unittest.mock import patch
+
+from common import add_database_argument
+from common import add_output_arguments
+from common import finish
+from common import setup_environment
+from common import summarize
+
+operations = [
+    "get_service",
+    "get_services_all",
+    "flavor_group_by",
+    "check_enddates",
+    "recreate_tunnels",
+]
+
+
+class StopBenchmark(Exception):
+    pass
+
+
+async def stop_loop(*args, **kwargs):
+    raise StopBenchmark()
+
+
+def reset_database():
+    from database import SessionLocal
+    from database import models
+
+    db = SessionLocal()
+    try:
+        db.query(models.Service).delete()
+        db.query(models.JupyterHub).delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+def seed(start, end, args, blobs):
+    """
+    Add the services start..end-1. Uses bulk inserts, the ORM would
+    dominate the seeding time.
+    """
+    from database import SessionLocal
+    from database import models
+    from sqlalchemy import insert
+
+    now = datetime.now(timezone.utc)
+    db = SessionLocal()
+    try:
+        if start == 0:
+            db.execute(
+                insert(models.JupyterHub),
+                [{"name": f"hub-{i}"} for i in range(args.hubs)],
+            )
+        for batch_start in range(start, end, args.batch_size):
+            rows = []
+            for i in range(batch_start, min(end, batch_start + args.batch_size)):
+                rows.append(
+                    {
+                        "name": f"user{i % args.users}-server{i}",
+                        "start_id": f"{i:08x}",
+                        "jupyterhub_username": f"hub-{i % args.hubs}",
+                        "jupyterhub_user_id": i % args.users,
+                        "flavor": f"flavor{i % args.flavors}",
+                        "last_update": now,
+                        "start_date": now - timedelta(seconds=i),
+                        "end_date": now + timedelta(days=1),
+                        "state_stored": True,
+                        "start_pending": False,
+                        "stop_pending": i % 50 == 0,
+                        "body": blobs["body"],
+                        "state": blobs["state"],
+                        "start_response": blobs["start_response"],
+                    }
+                )
+            db.execute(insert(models.Service), rows)
+            db.commit()
+    finally:
+        db.close()
+
+
+def encrypted_blobs():
+    """
+    Encrypted values of typical size, shared by all rows.
+    """
+    from database.schemas import encrypt
+
+    body = {
+        "name": "server",
+        "flavor": "flavor0",
+        "env": {
+            "JUPYTERHUB_API_TOKEN": "x" * 32,
+            "JUPYTERHUB_USER": "user",
+            "JUPYTERHUB_SERVICE_URL": "http://127.0.0.1:8888/user/user/server/",
+            **{f"EXTRA_ENV_{i}": "value" * 4 for i in range(20)},
+        },
+        "user_options": {"profile": "default", "image": "jupyter/base-notebook"},
+    }
+    return {
+        "body": encrypt(body),
+        "state": encrypt({"pod_name": "jupyter-user-server", "namespace": "outpost"}),
+        "start_response": encrypt({"service": "127.0.0.1:8888"}),
+    }
+
+
+async def run_operation(operation, size, args, rnd):
+    import main
+    from database import SessionLocal
+    from database.utils import get_service
+    from database.utils import get_services_all
+    from spawner import get_wrapper
+
+    wrapper = get_wrapper()
+    durations = {}
+
+    def timed(name, func, repeat):
+        values = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            values.append(time.perf_counter() - start)
+        durations[name] = values
+
+    async def timed_async(name, func, repeat):
+        values = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            await func()
+            values.append(time.perf_counter() - start)
+        durations[name] = values
+
+    db = SessionLocal()
+    try:
+        if operation == "get_service":
+
+            def lookup():
+                i = rnd.randrange(size)
+                get_service(
+                    f"hub-{i % args.hubs}",
+                    f"user{i % args.users}-server{i}",
+                    f"{i:08x}",
+                    db,
+                )
+
+            timed("get_service", lookup, args.lookups)
+        elif operation == "get_services_all":
+            timed(
+                "get_services_all[hub]",
+                lambda: get_services_all("hub-0", db),
+                args.repeat,
+            )
+            timed(
+                "get_services_all[all]",
+                lambda: get_services_all(None, db),
+                args.repeat,
+            )
+        elif operation == "flavor_group_by":
+            await timed_async(
+                "flavor_group_by",
+                lambda: wrapper._outpostspawner_get_flavor_values(db, "hub-0"),
+                args.repeat,
+            )
+        elif operation == "check_enddates":
+
+            async def check_enddates():
+                # Leave the endless loop at its first sleep
+                with patch.object(asyncio, "sleep", stop_loop):
+                    try:
+                        await main.check_enddates()
+                    except StopBenchmark:
+                        pass
+
+            await timed_async("check_enddates", check_enddates, args.repeat)
+        elif operation == "recreate_tunnels":
+            wrapper.ssh_recreate_at_start = True
+            await timed_async("recreate_tunnels", main.recreate_tunnels, args.repeat)
+    finally:
+        db.close()
+    return {f"{name}[n={size}]": values for name, values in durations.items()}
+
+
+async def run(args):
+    rnd = random.Random(args.seed)
+    sizes = sorted(int(x) for x in args.sizes.split(","))
+    skip = set(args.skip.split(",")) if args.skip else set()
+
+    reset_database()
+    blobs = encrypted_blobs()
+    results = {}
+    seeded = 0
+    for size in sizes:
+        start = time.perf_counter()
+        seed(seeded, size, args, blobs)
+        print(f"Seeded {size - seeded} services in {time.perf_counter() - start:.2f}s")
+        seeded = size
+        for operation in operations:
+            if operation in skip:
+                continue
+            for name, durations in (
+                await run_operation(operation, size, args, rnd)
+            ).items():
+                results[name] = summarize(durations)
+                print(f"{name}: p50 {results[name]['p50']} ms")
+    if not args.keep:
+        reset_database()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    add_database_argument(parser)
+    parser.add_argument(
+        "--sizes",
+        default="1000,10000,100000",
+        help="Comma separated numbers of services. The table grows from one size to the next",
+    )
+    parser.add_argument("--hubs", type=int, default=5)
+    parser.add_argument("--flavors", type=int, default=10)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Runs of each operation, except get_service",
+    )
+    parser.add_argument("--lookups", type=int, default=200, help="Runs of get_service")
+    parser.add_argument(
+        "--skip",
+        default="",
+        help=f"Comma separated operations to skip ({', '.join(operations)})",
+    )
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--keep", action="store_true", help="Keep the seeded services at the end"
+    )
+    add_output_arguments(parser, default_keys="p50,p95")
+    args = parser.parse_args()
+
+    tmp_dir = setup_environment(args.db)
+    os.environ.setdefault("OUTPOST_CONFIG_FILE", os.path.join(tmp_dir, "empty.py"))
+    open(os.environ["OUTPOST_CONFIG_FILE"], "a").close()
+    results = asyncio.run(run(args))
+    finish(args, "db_scale", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import asyncio
+
+from jupyterhub.spawner import Spawner
+from traitlets import Float
+from traitlets import Integer
+
+
+class FakeSpawner(Spawner):
+    """
+    Spawner without a backend. start, poll and stop only wait for the
+    configured latency, so the benchmarks measure the Outpost itself.
+    """
+
+    start_latency = Float(0.1, help="Seconds Spawner.start takes").tag(config=True)
+    poll_latency = Float(0.01, help="Seconds Spawner.poll takes").tag(config=True)
+    stop_latency = Float(0.05, help="Seconds Spawner.stop takes").tag(config=True)
+    progress_events = Integer(3, help="Number of progress events during start").tag(
+        config=True
+    )
+
+    async def start(self):
+        await asyncio.sleep(self.start_latency)
+        return ("127.0.0.1", 8888)
+
+    async def poll(self):
+        await asyncio.sleep(self.poll_latency)
+        return None
+
+    async def stop(self, now=False):
+        await asyncio.sleep(self.stop_latency)
+
+    async def progress(self):
+        for i in range(self.progress_events):
+            await asyncio.sleep(self.start_latency / (self.progress_events + 1))
+            yield {
+                "progress": int((i + 1) / (self.progress_events + 1) * 100),
+                "message": f"Fake progress event {i + 1}",
+            }
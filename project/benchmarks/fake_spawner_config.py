@@ -0,0 +1,13 @@
+# Outpost configuration used by load_test.py
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_spawner import FakeSpawner
+
+c.JupyterHubOutpost.spawner_class = FakeSpawner
+c.FakeSpawner.start_latency = float(os.environ.get("FAKE_SPAWNER_START_LATENCY", "0.1"))
+c.FakeSpawner.poll_latency = float(os.environ.get("FAKE_SPAWNER_POLL_LATENCY", "0.01"))
+c.FakeSpawner.stop_latency = float(os.environ.get("FAKE_SPAWNER_STOP_LATENCY", "0.05"))
+c.FakeSpawner.progress_events = int(os.environ.get("FAKE_SPAWNER_EVENTS", "3"))
@@ -0,0 +1,138 @@
+"""
+JSON serialization of large service listings (GET /services/) and of the
+encrypted database columns.
+
+Renders lists of services, as returned by GET /services/, with the
+JSONResponse of starlette (json module of the standard library) and the
+JSONResponse of the Outpost (json_codec, orjson if installed). `encode` is
+the jsonable_encoder step FastAPI runs before rendering, it's the same for
+both. `render[json_codec:...,raw]` renders the services without it, like
+GET /services/ does. `encrypt` and `decrypt` compare the json module with json_codec for
+a typical start request body, including Fernet.
+
+Run it once more with OUTPOST_JSON_BACKEND=json to compare the backends
+of json_codec.
+
+Examples:
+    python benchmarks/json_serialization.py --sizes 100,1000,10000
+    OUTPOST_JSON_BACKEND=json python benchmarks/json_serialization.py --output json.json
+"""
+import argparse
+import json
+import os
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+
+from common import add_output_arguments
+from common import finish
+from common import setup_environment
+from common import summarize
+from common import time_call
+
+
+def create_services(size):
+    """
+    Same keys and types as database.utils.service_to_dict.
+    """
+    now = datetime.now(timezone.utc)
+    return [
+        {
+            "name": f"user{i % 1000}-server{i}",
+            "start_id": f"{i:08x}",
+            "start_date": now - timedelta(seconds=i),
+            "end_date": now + timedelta(days=1),
+            "jupyterhub": f"hub-{i % 5}",
+            "jupyterhub_userid": str(i % 1000),
+            "last_update": now,
+            "state_stored": True,
+            "start_pending": False,
+            "stop_pending": i % 50 == 0,
+        }
+        for i in range(size)
+    ]
+
+
+def create_body():
+    return {
+        "name": "server",
+        "flavor": "flavor0",
+        "env": {
+            "JUPYTERHUB_API_TOKEN": "x" * 32,
+            "JUPYTERHUB_USER": "user",
+            "JUPYTERHUB_SERVICE_URL": "http://127.0.0.1:8888/user/user/server/",
+            **{f"EXTRA_ENV_{i}": "value" * 4 for i in range(20)},
+        },
+        "user_options": {"profile": "default", "image": "jupyter/base-notebook"},
+    }
+
+
+def run(args):
+    import json_codec
+    from cryptography.fernet import Fernet
+    from database.schemas import decrypt
+    from database.schemas import encrypt
+    from fastapi.encoders import jsonable_encoder
+    from starlette.responses import JSONResponse
+
+    codec = f"json_codec:{json_codec.backend}"
+    results = {}
+    for size in sorted(int(x) for x in args.sizes.split(",")):
+        services = create_services(size)
+        content = jsonable_encoder(services)
+        durations = {
+            "encode": time_call(jsonable_encoder, services, repeat=args.repeat),
+            "render[stdlib]": time_call(JSONResponse, content, repeat=args.repeat),
+            f"render[{codec}]": time_call(
+                json_codec.JSONResponse, content, repeat=args.repeat
+            ),
+            f"render[{codec},raw]": time_call(
+                json_codec.JSONResponse, services, repeat=args.repeat
+            ),
+        }
+        for name, values in durations.items():
+            name = f"{name}[n={size}]"
+            results[name] = summarize(values)
+            print(f"{name}: p50 {results[name]['p50']} ms")
+
+    fernet = Fernet(os.environ.get("OUTPOST_CRYPT_KEY"))
+    body = create_body()
+    blob = encrypt(body)
+    durations = {
+        "encrypt[stdlib]": time_call(
+            lambda: fernet.encrypt(json.dumps(body).encode()), repeat=args.lookups
+        ),
+        f"encrypt[{codec}]": time_call(encrypt, body, repeat=args.lookups),
+        "decrypt[stdlib]": time_call(
+            lambda: json.loads(fernet.decrypt(blob)), repeat=args.lookups
+        ),
+        f"decrypt[{codec}]": time_call(decrypt, blob, repeat=args.lookups),
+    }
+    for name, values in durations.items():
+        results[name] = summarize(values)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--sizes",
+        default="100,1000,10000",
+        help="Comma separated numbers of services per listing",
+    )
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per listing size")
+    parser.add_argument(
+        "--lookups", type=int, default=2000, help="Runs of encrypt and decrypt"
+    )
+    add_output_arguments(parser, default_keys="p50,p95")
+    args = parser.parse_args()
+
+    setup_environment()
+    results = run(args)
+    finish(args, "json_serialization", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Load test of the Outpost API.
+
+Runs the FastAPI app in-process with a FakeSpawner (configurable start, poll
+and stop latencies) and a stub JupyterHub, which receives the progress
+events and flavor updates. Each cycle starts a service, polls it and stops
+it again. Reports throughput and p50 / p95 / p99 latencies per endpoint.
+
+Examples:
+    python benchmarks/load_test.py --cycles 2000 --concurrency 200 --pool-size 200
+    python benchmarks/load_test.py --db postgresql --output results.json
+    python benchmarks/load_test.py --baseline results.json --threshold 0.2
+"""
+import argparse
+import asyncio
+import base64
+import os
+import time
+from collections import defaultdict
+
+from common import add_database_argument
+from common import add_output_arguments
+from common import benchmarks_dir
+from common import finish
+from common import setup_environment
+from common import summarize
+
+username = "benchmark"
+password = "benchmark"
+
+
+class StubJupyterHub:
+    """
+    Accepts progress events and flavor updates like JupyterHub would.
+    """
+
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.received = defaultdict(int)
+        self.server = None
+        self.url = None
+
+    def start(self):
+        from tornado.httpserver import HTTPServer
+        from tornado.netutil import bind_sockets
+        from tornado.web import Application
+        from tornado.web import RequestHandler
+
+        hub = self
+
+        class Handler(RequestHandler):
+            async def post(self, kind):
+                if hub.latency:
+                    await asyncio.sleep(hub.latency)
+                hub.received[kind] += 1
+                self.set_status(204)
+
+        sockets = bind_sockets(0, "127.0.0.1")
+        port = sockets[0].getsockname()[1]
+        self.server = HTTPServer(Application([(r"/hub/api/(\w+).*", Handler)]))
+        self.server.add_sockets(sockets)
+        self.url = f"http://127.0.0.1:{port}/hub/api"
+
+    def stop(self):
+        self.server.stop()
+
+
+def write_flavors(path):
+    import yaml
+
+    flavors = {
+        "flavors": {
+            f"flavor{i}": {
+                "max": -1,
+                "weight": i,
+                "display_name": f"Flavor {i}",
+                "runtime": {"hours": 2},
+            }
+            for i in range(3)
+        },
+        "hubs": {
+            "benchmark": {
+                "jupyterhub_name": [username],
+                "flavors": ["flavor0", "flavor1", "flavor2"],
+            }
+        },
+    }
+    with open(path, "w") as f:
+        yaml.dump(flavors, f)
+
+
+async def run(args):
+    import httpx
+    from main import app
+
+    hub = StubJupyterHub(args.hub_latency)
+    hub.start()
+
+    auth = base64.b64encode(f"{username}:{password}".encode()).decode()
+    headers = {"Authorization": f"Basic {auth}"}
+    durations = defaultdict(list)
+    errors = defaultdict(int)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def timed(client, name, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, headers=headers, **kwargs)
+            ok = response.status_code < 400
+        except Exception:
+            ok = False
+        durations[name].append(time.perf_counter() - start)
+        if not ok:
+            errors[name] += 1
+
+    async def cycle(client, i):
+        async with semaphore:
+            name = f"benchmark-{i}"
+            body = {
+                "name": name,
+                "flavor": f"flavor{i % 3}",
+                "env": {
+                    "JUPYTERHUB_USER": f"user{i % args.users}",
+                    "JUPYTERHUB_USER_ID": str(i % args.users),
+                    "JUPYTERHUB_API_TOKEN": "secret",
+                    "JUPYTERHUB_EVENTS_URL": f"{hub.url}/events/{name}",
+                    "JUPYTERHUB_FLAVORS_UPDATE_URL": f"{hub.url}/flavors",
+                    "JUPYTERHUB_FLAVORS_UPDATE_TOKEN": "secret",
+                },
+            }
+            await timed(client, "POST /services", "POST", "/services", json=body)
+            for _ in range(args.polls):
+                await timed(client, "GET /services/{name}", "GET", f"/services/{name}")
+            await timed(
+                client, "DELETE /services/{name}", "DELETE", f"/services/{name}"
+            )
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://outpost", timeout=None
+    ) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*[cycle(client, i) for i in range(args.cycles)])
+        elapsed = time.perf_counter() - start
+    hub.stop()
+
+    results = {
+        name: summarize(values, elapsed, errors[name])
+        for name, values in durations.items()
+    }
+    results["cycles"] = {
+        "count": args.cycles,
+        "throughput": round(args.cycles / elapsed, 3),
+        "errors": sum(errors.values()),
+    }
+    print(f"{args.cycles} cycles in {elapsed:.2f}s, hub received {dict(hub.received)}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    add_database_argument(parser)
+    parser.add_argument("--cycles", type=int, default=1000)
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=10,
+        help="Concurrent cycles. Above the database pool size (see --pool-size) requests wait for a connection",
+    )
+    parser.add_argument(
+        "--pool-size",
+        type=int,
+        help="Sets SQL_POOL_SIZE (default of the Outpost: 5, plus 10 overflow connections)",
+    )
+    parser.add_argument("--polls", type=int, default=3, help="Polls per cycle")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--start-latency", type=float, default=0.1)
+    parser.add_argument("--poll-latency", type=float, default=0.01)
+    parser.add_argument("--stop-latency", type=float, default=0.05)
+    parser.add_argument(
+        "--events", type=int, default=3, help="Progress events per start"
+    )
+    parser.add_argument(
+        "--hub-latency",
+        type=float,
+        default=0,
+        help="Seconds the stub JupyterHub needs to answer",
+    )
+    add_output_arguments(parser, default_keys="p95,throughput")
+    args = parser.parse_args()
+
+    tmp_dir = setup_environment(args.db)
+    if args.pool_size:
+        os.environ["SQL_POOL_SIZE"] = str(args.pool_size)
+    os.environ["OUTPOST_CONFIG_FILE"] = os.path.join(
+        benchmarks_dir, "fake_spawner_config.py"
+    )
+    os.environ["FAKE_SPAWNER_START_LATENCY"] = str(args.start_latency)
+    os.environ["FAKE_SPAWNER_POLL_LATENCY"] = str(args.poll_latency)
+    os.environ["FAKE_SPAWNER_STOP_LATENCY"] = str(args.stop_latency)
+    os.environ["FAKE_SPAWNER_EVENTS"] = str(args.events)
+    os.environ["usernames"] = username
+    os.environ["passwords"] = password
+    flavors_path = os.path.join(tmp_dir, "flavors.yaml")
+    write_flavors(flavors_path)
+    os.environ["OUTPOST_FLAVORS_PATH"] = flavors_path
+
+    results = asyncio.run(run(args))
+    finish(
+        args,
+        "load_test",
+        results,
+        columns=("count", "errors", "throughput", "p50", "p95", "p99"),
+    )
+
+
+if __name__ == "__main__":
+    main()
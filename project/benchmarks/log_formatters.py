@@ -0,0 +1,147 @@
+"""
+Throughput of the log formatters (`simple` and `json`) of the logging
+config file.
+
+Formats records without extras, with extras (like `log.debug(..., extra=...)`)
+and with an exception. If jsonformatter is installed, its JsonFormatter
+is measured for comparison. `handler` writes the records through a
+StreamHandler to /dev/null, `queue` through the NonBlockingQueueHandler
+of the Outpost.
+
+Examples:
+    python benchmarks/log_formatters.py
+    python benchmarks/log_formatters.py --records 100000 --output formatters.json
+"""
+import argparse
+import copy
+import logging
+import os
+import sys
+import time
+
+from common import add_output_arguments
+from common import finish
+from common import setup_environment
+
+
+def create_records():
+    try:
+        raise ValueError("Benchmark exception")
+    except ValueError:
+        exc_info = sys.exc_info()
+
+    def record(msg, args=(), exc_info=None, **extra):
+        ret = logging.LogRecord(
+            "JupyterHubOutpost",
+            logging.DEBUG,
+            "/home/jovyan/app/spawner/outpost.py",
+            1234,
+            msg,
+            args,
+            exc_info,
+            func="_outpostspawner_db_poll",
+        )
+        ret.__dict__.update(extra)
+        return ret
+
+    return {
+        "plain": record("%s - Poll service (start_id=%s)", ("hub-user", "0")),
+        "extras": record(
+            "Logging handler added (stream)",
+            uuidcode="0b8f5c0c3f2a4b3c9d1e",
+            jupyterhub_name="hub",
+            service_name="user-server",
+            start_id="0",
+            config={"level": "DEBUG", "formatter": "simple"},
+        ),
+        "exception": record("Could not poll service", exc_info=exc_info),
+    }
+
+
+def measure(func, record, count):
+    # Formatters cache e.g. exception texts in the record, use fresh ones
+    copies = [copy.copy(record) for _ in range(count)]
+    start = time.perf_counter()
+    for item in copies:
+        func(item)
+    elapsed = time.perf_counter() - start
+    return {
+        "count": count,
+        "ops_per_sec": round(count / elapsed, 1),
+        "mean_us": round(elapsed / count * 1e6, 3),
+    }
+
+
+def run(args):
+    from spawner import logging_utils
+
+    formatters = {
+        name: logging_utils.supported_formatter_classes[name](
+            **logging_utils.supported_formatter_kwargs[name]
+        )
+        for name in ["simple", "json"]
+    }
+    try:
+        import jsonformatter
+
+        formatters["jsonformatter"] = jsonformatter.JsonFormatter(
+            **logging_utils.supported_formatter_kwargs["json"]
+        )
+    except ImportError:
+        pass
+
+    records = create_records()
+    results = {}
+    for formatter_name, formatter in formatters.items():
+        for record_name, record in records.items():
+            name = f"{formatter_name}[{record_name}]"
+            results[name] = measure(formatter.format, record, args.records)
+            print(f"{name}: {results[name]['ops_per_sec']} records/s")
+
+    devnull = open(os.devnull, "w")
+    try:
+        for formatter_name in ["simple", "json"]:
+            handler = logging.StreamHandler(devnull)
+            handler.setFormatter(formatters[formatter_name])
+            name = f"handler[{formatter_name}]"
+            results[name] = measure(handler.handle, records["extras"], args.records)
+
+            queue_handler = logging_utils.NonBlockingQueueHandler(
+                handler, queue_size=args.records
+            )
+            name = f"queue[{formatter_name}]"
+            start = time.perf_counter()
+            results[name] = measure(
+                queue_handler.handle, records["extras"], args.records
+            )
+            # Includes the time to write all queued records
+            queue_handler.close()
+            elapsed = time.perf_counter() - start
+            results[name]["drained_per_sec"] = round(args.records / elapsed, 1)
+    finally:
+        devnull.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--records", type=int, default=50000, help="Records per benchmark"
+    )
+    add_output_arguments(parser, default_keys="ops_per_sec")
+    args = parser.parse_args()
+
+    setup_environment()
+    results = run(args)
+    finish(
+        args,
+        "log_formatters",
+        results,
+        columns=("count", "ops_per_sec", "mean_us", "drained_per_sec"),
+    )
+
+
+if __name__ == "__main__":
+    main()
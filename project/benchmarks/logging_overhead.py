@@ -0,0 +1,121 @@
+"""
+Cost of disabled trace logging in the flavor and credit resolution.
+
+Runs flavors_per_user and credits_per_user (configuration in memory) with a
+log handler at INFO level, which writes to /dev/null, in three setups:
+
+filtered  logger at TRACE level, the handler drops trace records. Each
+          trace call creates a log record (the behavior before the logger
+          level followed the handler levels)
+gated     logger level follows the handler level, trace calls return
+          without creating a record
+trace     handler at TRACE level, all trace messages are formatted and
+          written
+
+Examples:
+    python benchmarks/logging_overhead.py
+    python benchmarks/logging_overhead.py --user-sets 1000 --auth-size 100
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+from unittest.mock import patch
+
+from common import add_output_arguments
+from common import finish
+from common import setup_environment
+from policy import generate_authentication
+from policy import generate_config
+from policy import measure
+
+jupyterhub_name = "hub-3"
+
+
+async def run(args):
+    from spawner import get_wrapper
+    from spawner import logging_utils
+    from spawner import outpost
+
+    wrapper = get_wrapper()
+    flavors = generate_config("flavors", args.user_sets, args.entries, args.seed)
+    credits = generate_config("credits", args.user_sets, args.entries, args.seed)
+    authentication = generate_authentication(
+        args.auth_size, args.user_sets, random.Random(args.seed)
+    )
+
+    devnull = open(os.devnull, "w")
+    handler = logging.StreamHandler(devnull)
+    handler.setFormatter(
+        logging_utils.ExtraFormatter(
+            **logging_utils.supported_formatter_kwargs["simple"]
+        )
+    )
+    handlers = list(wrapper.log.handlers)
+    wrapper.log.handlers = [handler]
+
+    results = {}
+    try:
+        with patch.object(
+            outpost, "get_flavors_from_disk", return_value=flavors
+        ), patch.object(outpost, "get_credits_from_disk", return_value=credits):
+            for setup in ["filtered", "gated", "trace"]:
+                handler.setLevel(5 if setup == "trace" else logging.INFO)
+                wrapper.update_logger_levels()
+                if setup == "filtered":
+                    wrapper.log.setLevel(5)
+                for name, func in [
+                    ("flavors_per_user", wrapper.flavors_per_user),
+                    ("credits_per_user", wrapper.credits_per_user),
+                ]:
+                    result = await measure(
+                        lambda: func(jupyterhub_name, authentication),
+                        args.min_time,
+                        args.max_iterations,
+                    )
+                    results[f"{name}[{setup}]"] = result
+    finally:
+        wrapper.log.handlers = handlers
+        wrapper.update_logger_levels()
+        devnull.close()
+
+    for name in ["flavors_per_user", "credits_per_user"]:
+        before = results[f"{name}[filtered]"]["mean"]
+        after = results[f"{name}[gated]"]["mean"]
+        print(
+            f"{name}: {before} ms -> {after} ms per request ({(before - after) / before:.0%} saved)"
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--user-sets", type=int, default=100)
+    parser.add_argument("--auth-size", type=int, default=10)
+    parser.add_argument("--entries", type=int, default=20)
+    parser.add_argument(
+        "--min-time", type=float, default=2.0, help="Seconds per benchmark"
+    )
+    parser.add_argument("--max-iterations", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    add_output_arguments(parser, default_keys="ops_per_sec")
+    args = parser.parse_args()
+
+    tmp_dir = setup_environment()
+    os.environ.setdefault("OUTPOST_CONFIG_FILE", os.path.join(tmp_dir, "empty.py"))
+    open(os.environ["OUTPOST_CONFIG_FILE"], "a").close()
+
+    results = asyncio.run(run(args))
+    finish(
+        args,
+        "logging_overhead",
+        results,
+        columns=("count", "ops_per_sec", "mean", "p50", "p95", "alloc_peak_kib"),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""
+Microbenchmarks of the flavor and credit resolution.
+
+Generates flavor and credit configurations with a growing number of user
+sets (regex, glob and list matchers, overrides with nested values) and
+authentication payloads of different sizes. Measures `flavors_per_user`,
+`credits_per_user`, `get_flavors`, `get_credits` and `matches_pattern` of
+JupyterHubOutpost. Reports operations per second, latencies and the peak
+memory allocated by a single call (tracemalloc).
+
+By default the configuration is read from disk on each call, like in
+production. Use --in-memory to measure the resolution only.
+
+Examples:
+    python benchmarks/policy.py
+    python benchmarks/policy.py --user-sets 10,100,1000,10000 --auth-sizes 1,100
+    python benchmarks/policy.py --in-memory --output policy.json
+    python benchmarks/policy.py --baseline policy.json --threshold 0.2
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+import tracemalloc
+
+from common import add_output_arguments
+from common import finish
+from common import setup_environment
+from common import summarize
+
+jupyterhub_name = "hub-3"
+
+
+def generate_flavors(count):
+    return {
+        f"flavor{i}": {
+            "max": -1,
+            "weight": i,
+            "display_name": f"{2**(i % 6)}GB RAM, {i % 4 + 1}VCPU",
+            "description": f"Generated flavor {i}",
+            "runtime": {"hours": i % 24 + 1},
+            "resources": {
+                "limits": {"cpu": i % 4 + 1, "memory": f"{2**(i % 6)}Gi"},
+                "nodeSelector": {"zone": f"zone-{i % 3}"},
+            },
+        }
+        for i in range(count)
+    }
+
+
+def generate_credits(count):
+    return {
+        f"credit{i}": {
+            "cap": 100 * (i + 1),
+            "grant_value": 10 * (i + 1),
+            "grant_interval": 86400,
+            "details": {"project": f"project-{i}", "labels": {"tier": i % 3}},
+        }
+        for i in range(count)
+    }
+
+
+def generate_hubs(kind, names, count=10):
+    """
+    One hub set for each kind of matcher: list, regex, glob and plain string.
+    """
+    hubs = {}
+    for i in range(count):
+        if i % 4 == 0:
+            matcher = [f"hub-{i}", f"hub-{i}-staging"]
+        elif i % 4 == 1:
+            matcher = f"hub-{i}(-.*)?"
+        elif i % 4 == 2:
+            # Not a valid regex, matched as glob
+            matcher = f"*hub-{i}"
+        else:
+            matcher = f"hub-{i}"
+        hubs[f"hubset{i}"] = {
+            "jupyterhub_name": matcher,
+            "weight": i,
+            kind: names[: len(names) // 2 + i],
+            f"{kind}Override": {
+                names[0]: {"max": 10 + i, "runtime": {"hours": i + 1}},
+            },
+        }
+    return hubs
+
+
+def generate_user_sets(kind, names, count, rnd):
+    """
+    User sets matching the `groups` or `entitlements` of the authentication.
+    Matchers rotate between regex, glob and list.
+    """
+    users = {}
+    for i in range(count):
+        if i % 3 == 0:
+            authentication = {"groups": f"group-{i}(-[a-z]+)?"}
+        elif i % 3 == 1:
+            authentication = {"entitlements": f"*:entitlement:{i}"}
+        else:
+            authentication = {"groups": [f"group-{i}", f"group-{i}-admin"]}
+        user_set = {"authentication": authentication, "weight": i}
+        if i % 5 == 0:
+            user_set["hubs"] = [f"hub-{j}" for j in range(5)]
+        if i % 50 == 49:
+            user_set["negate_authentication"] = True
+        if i % 100 == 99:
+            user_set["forbidden"] = True
+        user_set[kind] = rnd.sample(names, k=max(1, len(names) // 2))
+        user_set[f"{kind}Override"] = {
+            name: {
+                "max": rnd.randint(1, 10),
+                "runtime": {"hours": rnd.randint(1, 48)},
+                "resources": {"limits": {"memory": f"{rnd.randint(1, 64)}Gi"}},
+            }
+            for name in user_set[kind][:3]
+        }
+        users[f"userset{i}"] = user_set
+    return users
+
+
+def generate_config(kind, user_sets, entries, seed):
+    rnd = random.Random(seed)
+    if kind == "flavors":
+        values = generate_flavors(entries)
+    else:
+        values = generate_credits(entries)
+    names = list(values.keys())
+    return {
+        kind: values,
+        "hubs": generate_hubs(kind, names),
+        "users": generate_user_sets(kind, names, user_sets, rnd),
+    }
+
+
+def generate_authentication(size, user_sets, rnd):
+    """
+    Authentication with `size` groups and entitlements. One group matches
+    a user set, all others match nothing.
+    """
+    match = rnd.randrange(user_sets)
+    groups = [f"other-group-{i}" for i in range(size - 1)] + [f"group-{match}"]
+    entitlements = [f"urn:other:{i}" for i in range(size)]
+    rnd.shuffle(groups)
+    return {
+        "name": "user@example.org",
+        "groups": groups,
+        "entitlements": entitlements,
+    }
+
+
+def write_yaml(path, data):
+    import yaml
+
+    with open(path, "w") as f:
+        yaml.dump(data, f)
+
+
+async def measure(func, min_time, max_iterations):
+    durations = []
+    start = time.perf_counter()
+    while len(durations) < max_iterations:
+        call_start = time.perf_counter()
+        await func()
+        durations.append(time.perf_counter() - call_start)
+        if call_start - start > min_time:
+            break
+    elapsed = time.perf_counter() - start
+    ret = summarize(durations)
+    ret["ops_per_sec"] = round(len(durations) / elapsed, 3)
+
+    # Allocations of a single call
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    await func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    ret["alloc_peak_kib"] = round((peak - before) / 1024, 1)
+    return ret
+
+
+async def run(args, tmp_dir):
+    from unittest.mock import patch
+
+    from spawner import get_wrapper
+    from spawner import outpost
+
+    wrapper = get_wrapper()
+    rnd = random.Random(args.seed)
+    user_sets_list = [int(x) for x in args.user_sets.split(",")]
+    auth_sizes = [int(x) for x in args.auth_sizes.split(",")]
+    results = {}
+
+    async def bench(name, func):
+        results[name] = await measure(func, args.min_time, args.max_iterations)
+        print(
+            f"{name}: {results[name]['ops_per_sec']} ops/s, {results[name]['alloc_peak_kib']} KiB"
+        )
+
+    for user_sets in user_sets_list:
+        flavors = generate_config("flavors", user_sets, args.entries, args.seed)
+        credits = generate_config("credits", user_sets, args.entries, args.seed)
+        patches = []
+        if not args.in_memory:
+            flavors_path = os.path.join(tmp_dir, f"flavors_{user_sets}.yaml")
+            credits_path = os.path.join(tmp_dir, f"credits_{user_sets}.yaml")
+            write_yaml(flavors_path, flavors)
+            write_yaml(credits_path, credits)
+            os.environ["OUTPOST_FLAVORS_PATH"] = flavors_path
+            os.environ["OUTPOST_CREDITS_PATH"] = credits_path
+        else:
+            # The resolution of one user set always writes the same override
+            # values into the config, so it can be reused between calls.
+            patches = [
+                patch.object(outpost, "get_flavors_from_disk", return_value=flavors),
+                patch.object(outpost, "get_credits_from_disk", return_value=credits),
+            ]
+        for p in patches:
+            p.start()
+        try:
+            await bench(
+                f"get_flavors[sets={user_sets}]",
+                lambda: wrapper.get_flavors(jupyterhub_name),
+            )
+            await bench(
+                f"get_credits[sets={user_sets}]",
+                lambda: wrapper.get_credits(jupyterhub_name),
+            )
+            for size in auth_sizes:
+                authentication = generate_authentication(size, user_sets, rnd)
+                await bench(
+                    f"flavors_per_user[sets={user_sets},auth={size}]",
+                    lambda: wrapper.flavors_per_user(jupyterhub_name, authentication),
+                )
+                await bench(
+                    f"credits_per_user[sets={user_sets},auth={size}]",
+                    lambda: wrapper.credits_per_user(jupyterhub_name, authentication),
+                )
+        finally:
+            for p in patches:
+                p.stop()
+
+    patterns = {
+        "regex": ("group-1(-[a-z]+)?", "group-1-admin"),
+        "glob": ("*:entitlement:1", "urn:example:entitlement:1"),
+        "plain": ("group-1", "group-1"),
+        "no_match": ("group-1(-[a-z]+)?", "other-group"),
+    }
+    for kind, (pattern, value) in patterns.items():
+
+        async def matches_pattern():
+            for _ in range(100):
+                wrapper.matches_pattern(pattern, "userset1", value)
+
+        # 100 calls per operation, the timer overhead would dominate otherwise
+        result = await measure(matches_pattern, args.min_time, args.max_iterations)
+        result["ops_per_sec"] = round(result["ops_per_sec"] * 100, 3)
+        results[f"matches_pattern[{kind}]"] = result
+        print(f"matches_pattern[{kind}]: {result['ops_per_sec']} ops/s")
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--user-sets",
+        default="10,100,1000",
+        help="Comma separated numbers of user sets in the generated configurations",
+    )
+    parser.add_argument(
+        "--auth-sizes",
+        default="1,10,100",
+        help="Comma separated numbers of groups and entitlements in the authentication",
+    )
+    parser.add_argument(
+        "--entries", type=int, default=20, help="Flavors / credits per configuration"
+    )
+    parser.add_argument(
+        "--in-memory",
+        action="store_true",
+        help="Parse the configuration once instead of on each call",
+    )
+    parser.add_argument(
+        "--min-time", type=float, default=1.0, help="Seconds per benchmark"
+    )
+    parser.add_argument("--max-iterations", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--log-level",
+        default="ERROR",
+        help="Level of the Outpost's logger. Use TRACE to include log formatting costs",
+    )
+    add_output_arguments(parser, default_keys="ops_per_sec,alloc_peak_kib")
+    args = parser.parse_args()
+
+    tmp_dir = setup_environment(log_level=args.log_level)
+    os.environ.setdefault("OUTPOST_CONFIG_FILE", os.path.join(tmp_dir, "empty.py"))
+    open(os.environ["OUTPOST_CONFIG_FILE"], "a").close()
+
+    results = asyncio.run(run(args, tmp_dir))
+    finish(
+        args,
+        "policy",
+        results,
+        columns=("count", "ops_per_sec", "p50", "p95", "alloc_peak_kib"),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -43,6 +43,13 @@ elif [ "${SQL_TYPE:-sqlite}" == "sqlite" ]; then
     chmod 666 ${SQL_DATABASE_URL:-/tmp/sqlite.db}
 fi
 
+# Prometheus multiprocess mode: remove metrics of previous runs
+if [[ -n "${PROMETHEUS_MULTIPROC_DIR}" ]]; then
+    rm -rf ${PROMETHEUS_MULTIPROC_DIR}
+    mkdir -p ${PROMETHEUS_MULTIPROC_DIR}
+    chown ${USERNAME}:users ${PROMETHEUS_MULTIPROC_DIR}
+fi
+
 cd ${HOME}/app
 su ${USERNAME}
 
@@ -4,6 +4,7 @@ from typing import Any
 from typing import Generator
 
 import pytest
+from app.api.admin import router as admin_router
 from app.api.services import router as service_router
 from fastapi import FastAPI
 from fastapi.testclient import TestClient
@@ -14,6 +15,7 @@ from sqlalchemy.orm import sessionmaker
 def start_application(root_path=""):
     app = FastAPI(root_path=root_path)
     app.include_router(service_router)
+    app.include_router(admin_router)
     return app
 
 
@@ -0,0 +1,15 @@
+from jupyterhub.spawner import SimpleLocalProcessSpawner
+
+c.JupyterHubOutpost.spawner_class = SimpleLocalProcessSpawner
+c.SimpleLocalProcessSpawner.port = 4567
+c.SimpleLocalProcessSpawner.cmd = "/bin/echo"
+c.SimpleLocalProcessSpawner.args = "Hello World"
+
+c.JupyterHubOutpost.notification_outbox = True
+
+
+async def flavors_update_token(jupyterhub_name):
+    return "secret1"
+
+
+c.JupyterHubOutpost.flavors_update_token = flavors_update_token
@@ -0,0 +1,8 @@
+from jupyterhub.spawner import SimpleLocalProcessSpawner
+
+c.JupyterHubOutpost.spawner_class = SimpleLocalProcessSpawner
+c.SimpleLocalProcessSpawner.port = 4567
+c.SimpleLocalProcessSpawner.cmd = "/bin/echo"
+c.SimpleLocalProcessSpawner.args = "Hello World"
+
+c.JupyterHubOutpost.return_start_timings = True
@@ -0,0 +1,80 @@
+import pytest
+from tests.conftest import auth_user2_b64
+from tests.conftest import auth_user_b64
+
+headers_auth_user = {"Authorization": f"Basic {auth_user_b64}"}
+
+headers_auth_user2 = {"Authorization": f"Basic {auth_user2_b64}"}
+
+simple_timings = "./tests/test_routes/simple_timings.py"
+
+
+@pytest.fixture(scope="function")
+def admin_user(monkeypatch):
+    monkeypatch.setenv("admin_usernames", "authenticated")
+
+
+@pytest.mark.parametrize("spawner_config", [None])
+def test_admin_forbidden(client, admin_user):
+    response = client.get("/admin/circuits", headers=headers_auth_user2)
+    assert response.status_code == 403
+
+
+@pytest.mark.parametrize("spawner_config", [None])
+def test_admin_circuits(client, admin_user, monkeypatch):
+    from spawner import http_client
+    from spawner.circuit_breaker import CircuitBreakerRegistry
+
+    registry = CircuitBreakerRegistry()
+    registry.get("http://hub1:8000/hub/api/events").record_success()
+    monkeypatch.setattr(http_client, "circuit_breakers", registry)
+    response = client.get("/admin/circuits", headers=headers_auth_user)
+    assert response.status_code == 200
+    assert response.json() == {
+        "http://hub1:8000": {"state": "closed", "failures": 0, "reset_timeout": 10}
+    }
+
+
+@pytest.mark.parametrize("spawner_config", [simple_timings])
+def test_admin_start_timings(client, admin_user):
+    service_data = {"name": "user-servername"}
+    response = client.post("/services", json=service_data, headers=headers_auth_user)
+    assert response.status_code == 200, response.text
+    timings = response.json()["timings"]
+    assert timings["status"] == "success"
+    assert [phase["name"] for phase in timings["phases"]] == [
+        "clear_state",
+        "pre_spawn_hook",
+        "start",
+        "db_commit",
+    ]
+
+    response = client.get("/admin/timings", headers=headers_auth_user)
+    assert response.status_code == 200, response.text
+    assert response.json() == [timings]
+
+
+@pytest.mark.parametrize("spawner_config", [None])
+def test_admin_profile(client, admin_user):
+    response = client.get(
+        "/admin/profile", params={"seconds": 0.2}, headers=headers_auth_user
+    )
+    assert response.status_code == 200, response.text
+    lines = response.text.splitlines()
+    assert lines
+    stack, count = lines[0].rsplit(" ", 1)
+    assert int(count) > 0
+    assert ";" in stack
+
+    response = client.get(
+        "/admin/profile",
+        params={"seconds": 0.1, "mode": "memory"},
+        headers=headers_auth_user,
+    )
+    assert response.status_code == 200, response.text
+    assert response.text.startswith("Top 50 allocation differences")
+
+    response = client.get(
+        "/admin/profile", params={"seconds": 3600}, headers=headers_auth_user
+    )
+    assert response.status_code == 400
@@ -0,0 +1,65 @@
+from unittest.mock import patch
+
+import pytest
+from prometheus_client import REGISTRY
+from tests.test_routes.test_services import headers_auth_user
+from tests.test_routes.test_services import simple
+from tests.test_routes.test_services import simple_flavors
+
+
+@pytest.mark.parametrize("spawner_config", [simple])
+def test_metrics(client, db_session, monkeypatch):
+    import database
+    import metrics
+
+    labels = {
+        "spawner_class": "SimpleLocalProcessSpawner",
+        "jupyterhub": "authenticated",
+        "status": "success",
+    }
+    before = (
+        REGISTRY.get_sample_value(
+            "outpost_spawner_start_duration_seconds_count", labels
+        )
+        or 0
+    )
+    service_data = {"name": "user-servername", "flavor": "typea"}
+    with patch(
+        "spawner.outpost.get_flavors_from_disk", return_value=simple_flavors
+    ), patch("spawner.utils.get_flavors_from_disk", return_value=simple_flavors):
+        response = client.post(
+            "/services", json=service_data, headers=headers_auth_user
+        )
+    assert response.status_code == 200, response.text
+    assert (
+        REGISTRY.get_sample_value(
+            "outpost_spawner_start_duration_seconds_count", labels
+        )
+        == before + 1
+    )
+    assert REGISTRY.get_sample_value("outpost_spawner_cache_size") == 1
+    assert REGISTRY.get_sample_value(
+        "outpost_db_query_duration_seconds_count", {"operation": "INSERT"}
+    )
+
+    monkeypatch.setattr(database, "SessionLocal", lambda: db_session)
+    data, content_type = metrics.generate()
+    assert content_type.startswith("text/plain")
+    assert (
+        b'outpost_running_services{flavor="typea",jupyterhub="authenticated"} 1.0'
+        in data
+    )
+
+    # Registered on the app of main.py
+    import main
+    from fastapi.testclient import TestClient
+
+    main_client = TestClient(main.app)
+    response = main_client.get("/metrics")
+    assert response.status_code == 401
+    response = main_client.get("/metrics", headers=headers_auth_user)
+    assert response.status_code == 403
+    monkeypatch.setenv("admin_usernames", "authenticated")
+    response = main_client.get("/metrics", headers=headers_auth_user)
+    assert response.status_code == 200
+    assert b"outpost_running_services" in response.content
@@ -0,0 +1,140 @@
+import asyncio
+import json
+from unittest.mock import patch
+
+import pytest
+from tests.conftest import auth_user_b64
+from tests.test_routes.test_services import simple
+from tests.test_routes.test_services import simple_flavors
+from tests.test_routes.test_services import simple_outbox
+
+headers_auth_user = {"Authorization": f"Basic {auth_user_b64}"}
+
+
+def parse(event):
+    fields = dict(line.split(": ", 1) for line in event.strip().split("\n"))
+    return fields["event"], json.loads(fields["data"]), fields["id"]
+
+
+async def next_event(stream):
+    return parse(await asyncio.wait_for(stream.__anext__(), 1))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("spawner_config", [None])
+async def test_stream_resume(app):
+    from database import service_events
+
+    for i in range(3):
+        service_events.publish(None, "hub-resume", "started", {"name": f"server{i}"})
+    first_id = service_events._buffers["hub-resume"][0][1]
+
+    stream = service_events.stream("hub-resume", first_id)
+    try:
+        assert (await next_event(stream))[:2] == ("started", {"name": "server1"})
+        assert (await next_event(stream))[:2] == ("started", {"name": "server2"})
+        waiting = asyncio.ensure_future(next_event(stream))
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+        service_events.publish(None, "hub-resume", "expired", {"name": "server0"})
+        assert (await waiting)[:2] == ("expired", {"name": "server0"})
+    finally:
+        await stream.aclose()
+
+    # Unknown ids (e.g. after a restart) start with a reset
+    stream = service_events.stream("hub-resume", "unknown-1")
+    try:
+        assert (await next_event(stream))[0] == "reset"
+    finally:
+        await stream.aclose()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("spawner_config", [None])
+async def test_stream_buffer_overflow(app, monkeypatch):
+    from database import service_events
+
+    monkeypatch.setattr(service_events, "buffer_size", 2)
+    service_events.publish(None, "hub-overflow", "started", {"name": "server0"})
+    last_id = service_events._buffers["hub-overflow"][-1][1]
+    for i in range(1, 4):
+        service_events.publish(None, "hub-overflow", "started", {"name": f"server{i}"})
+
+    stream = service_events.stream("hub-overflow", last_id)
+    try:
+        assert (await next_event(stream))[0] == "reset"
+    finally:
+        await stream.aclose()
+
+
+@pytest.mark.parametrize("spawner_config", [simple_outbox])
+def test_flavor_events(client, app):
+    from database import service_events
+
+    # Must not be handled as service name
+    paths = [route.path for route in app.routes]
+    assert paths.index("/services/events") < paths.index("/services/{service_name}")
+
+    buffer = service_events._get_buffer("authenticated")
+    for i, env in enumerate([{}, {"JUPYTERHUB_FLAVORS_UPDATE_URL": "mock_url"}]):
+        seq = service_events._seqs["authenticated"]
+        service_data = {"name": f"user-servername-{i}", "env": env, "flavor": "typea"}
+        with patch(
+            "spawner.outpost.get_flavors_from_disk", return_value=simple_flavors
+        ), patch("spawner.utils.get_flavors_from_disk", return_value=simple_flavors):
+            response = client.post(
+                "/services", json=service_data, headers=headers_auth_user
+            )
+        assert response.status_code == 200, response.text
+        events = [event[2] for event in buffer if event[0] > seq]
+        # Only published together with a flavor update
+        assert ("flavors" in events) == bool(env)
+
+
+@pytest.mark.parametrize("spawner_config", [simple])
+def test_poll_clean_exit_event(client):
+    from database import service_events
+
+    buffer = service_events._get_buffer("authenticated")
+    seq = service_events._seqs["authenticated"]
+    service_data = {"name": "user-servername", "env": {"JUPYTERHUB_USER": "user1"}}
+    with patch("spawner.outpost.get_flavors_from_disk", return_value={}), patch(
+        "spawner.utils.get_flavors_from_disk", return_value={}
+    ):
+        response = client.post(
+            "/services", json=service_data, headers=headers_auth_user
+        )
+        assert response.status_code == 200, response.text
+        response = client.get("/services/user-servername", headers=headers_auth_user)
+    assert response.json()["status"] == 0
+    events = [event[2] for event in buffer if event[0] > seq]
+    # Exit status 0 is no failure
+    assert "stopped" in events
+    assert "poll_failed" not in events
+
+
+@pytest.mark.parametrize("spawner_config", [None])
+def test_receive_loads_event(db_session, monkeypatch):
+    from database import service_events
+    from database.models import ServiceEvent
+
+    monkeypatch.setattr(service_events, "SessionLocal", lambda: db_session)
+    buffer = service_events._get_buffer("hub-receive")
+    event = ServiceEvent(
+        jupyterhub_name="hub-receive",
+        event_id="other-1",
+        event_type="flavors",
+        data=json.dumps({"typea": {"current": 1}}),
+    )
+    db_session.add(event)
+    db_session.commit()
+    # Only the row id is sent via NOTIFY
+    service_events._receive(json.dumps([event.id, "other-1"]))
+    assert list(buffer)[-1][1:] == ("other-1", "flavors", event.data)
+
+    # Own events are in the buffer already
+    own_id = f"{service_events._origin}-1"
+    service_events._receive(json.dumps([event.id, own_id]))
+    # Removed from the database already
+    service_events._receive(json.dumps([event.id + 1, "other-2"]))
+    assert len(buffer) == 1
@@ -32,6 +32,7 @@ simple_flavors_global_max_0 = "./tests/test_routes/simple_flavors_global_max_0.p
 simple_flavors_global_max_1 = "./tests/test_routes/simple_flavors_global_max_1.py"
 simple_flavors_auth_exception = "./tests/test_routes/simple_flavors_exception.py"
 simple_override = "./tests/test_routes/simple_override.py"
+simple_outbox = "./tests/test_routes/simple_outbox.py"
 
 simple_flavors = {
     "flavors": {
@@ -873,8 +874,10 @@ async def test_flavor_hub_specific_allowance(client, db_session, monkeypatch):
         nonlocal calls
         mock_args = args
         calls += 1
+        return HTTPResponse(args[0], 200)
 
     from tornado.httpclient import AsyncHTTPClient
+    from tornado.httpclient import HTTPResponse
 
     monkeypatch.setattr(AsyncHTTPClient, "fetch", mock_fetch)
 
@@ -1049,8 +1052,10 @@ async def test_flavor_auth_exception(client, db_session, monkeypatch):
         nonlocal calls
         mock_args = args
         calls += 1
+        return HTTPResponse(args[0], 200)
 
     from tornado.httpclient import AsyncHTTPClient
+    from tornado.httpclient import HTTPResponse
 
     monkeypatch.setattr(AsyncHTTPClient, "fetch", mock_fetch)
 
@@ -1072,3 +1077,538 @@ async def test_flavor_auth_exception(client, db_session, monkeypatch):
         )
     assert response.status_code == 200, response.text
     assert calls == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("spawner_config", [simple_outbox])
+async def test_flavor_update_outbox(client, db_session, monkeypatch):
+    calls = 0
+
+    async def mock_fetch(self, *args, **kwargs):
+        nonlocal calls
+        calls += 1
+        return HTTPResponse(args[0], 200)
+
+    from tornado.httpclient import AsyncHTTPClient
+    from tornado.httpclient import HTTPResponse
+    from database.models import Notification
+
+    monkeypatch.setattr(AsyncHTTPClient, "fetch", mock_fetch)
+
+    for i in range(2):
+        service_data = {
+            "name": f"user-servername-{i}",
+            "env": {
+                "JUPYTERHUB_USER": "user1",
+                "JUPYTERHUB_FLAVORS_UPDATE_URL": "mock_url",
+            },
+            "flavor": "typea",
+        }
+        with patch(
+            "spawner.outpost.get_flavors_from_disk", return_value=simple_flavors
+        ), patch("spawner.utils.get_flavors_from_disk", return_value=simple_flavors):
+            response = client.post(
+                "/services", json=service_data, headers=headers_auth_user
+            )
+        assert response.status_code == 200, response.text
+
+    # Not sent during the request, only the latest snapshot is stored
+    assert calls == 0
+    notifications = db_session.query(Notification).all()
+    assert len(notifications) == 1
+    assert notifications[0].url == "mock_url"
+    body = decrypt(notifications[0].payload)["body"]
+    assert body["typea"]["current"] == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("spawner_config", [simple])
+async def test_async_delete_waits_for_state_notification(
+    app, client, db_session, monkeypatch
+):
+    import asyncio
+    import httpx
+    from api import services
+    from database import state_events
+
+    service_name = "user-servername"
+    service_data = {"name": service_name, "flavor": "typea"}
+    with patch(
+        "spawner.outpost.get_flavors_from_disk", return_value=simple_flavors
+    ), patch("spawner.utils.get_flavors_from_disk", return_value=simple_flavors):
+        response = client.post(
+            "/services", json=service_data, headers=headers_auth_user
+        )
+    assert response.status_code == 200, response.text
+
+    # Simulate a start process which has not stored its state yet
+    service = get_service(jupyterhub_name, service_name, "0", db_session)
+    service.state_stored = False
+    db_session.commit()
+    # Do not fall back to checking the database during this test
+    monkeypatch.setattr(services, "state_stored_recheck_interval", 60)
+
+    headers = copy.deepcopy(headers_auth_user)
+    headers["execution-type"] = "async"
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+        delete = asyncio.create_task(
+            ac.delete(f"/services/{service_name}", headers=headers)
+        )
+        await asyncio.sleep(0.5)
+        assert not delete.done()
+
+        service.state_stored = True
+        db_session.commit()
+        state_events.notify(db_session, jupyterhub_name, service_name, "0")
+        response = await asyncio.wait_for(delete, 5)
+    assert response.status_code == 202, response.text
+    assert state_events._waiters == {}
+
+
+@pytest.mark.parametrize("spawner_config", [None])
+def test_state_notify_own_transaction(app):
+    from unittest.mock import MagicMock
+
+    from database import state_events
+
+    db = MagicMock()
+    db.get_bind().dialect.name = "postgresql"
+    connection = db.get_bind().begin().__enter__()
+    state_events.notify(db, jupyterhub_name, "server", "0")
+    sql, params = connection.execute.call_args.args
+    assert "pg_notify" in str(sql)
+    assert params["payload"] == f'["{jupyterhub_name}", "server", "0"]'
+    # Pending changes of the caller stay untouched
+    db.commit.assert_not_called()
+    db.execute.assert_not_called()
+
+    # Errors are logged, the transaction is rolled back on exit
+    connection.execute.side_effect = Exception("connection lost")
+    state_events.notify(db, jupyterhub_name, "server", "0")
+    db.rollback.assert_not_called()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("spawner_config", [None])
+async def test_state_listener_reconnects(app, monkeypatch):
+    import asyncio
+    import os
+    from types import SimpleNamespace
+
+    from database import state_events
+
+    class OperationalError(Exception):
+        pass
+
+    connections = []
+
+    class Cursor:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            pass
+
+        def execute(self, sql):
+            pass
+
+    class Connection:
+        def __init__(self, fail_connect):
+            if fail_connect:
+                raise OperationalError("connection refused")
+            self.read_fd, self.write_fd = os.pipe()
+            self.notifies = []
+            self.broken = False
+            self.closed = False
+            connections.append(self)
+
+        def cursor(self):
+            return Cursor()
+
+        def fileno(self):
+            return self.read_fd
+
+        def poll(self):
+            os.read(self.read_fd, 1)
+            if self.broken:
+                raise OperationalError("server closed the connection")
+
+        def close(self):
+            self.closed = True
+            os.close(self.read_fd)
+            os.close(self.write_fd)
+
+    attempts = []
+
+    def connect():
+        attempts.append(1)
+        # The first reconnect fails
+        return Connection(fail_connect=len(attempts) == 2)
+
+    dbapi = SimpleNamespace(Error=OperationalError, connect=connect)
+    engine = SimpleNamespace(
+        url=None,
+        dialect=SimpleNamespace(
+            name="postgresql",
+            loaded_dbapi=dbapi,
+            create_connect_args=lambda url: ([], {}),
+        ),
+    )
+    monkeypatch.setattr(state_events.Listener, "max_backoff", 0.01)
+    sleep = asyncio.sleep
+
+    async def short_sleep(delay):
+        await sleep(min(delay, 0.01))
+
+    monkeypatch.setattr(state_events.asyncio, "sleep", short_sleep)
+
+    listener = state_events.start_listener(engine)
+    try:
+        with state_events.waiter("hub", "server", "0") as stored:
+            first = connections[0]
+            first.broken = True
+            os.write(first.write_fd, b"x")
+            await asyncio.wait_for(stored.wait(), 5)
+        assert first.closed
+        assert len(attempts) == 3
+        assert listener.connection is connections[1]
+        assert not connections[1].closed
+    finally:
+        state_events.stop_listener(listener)
+    assert connections[1].closed
+
+
+@pytest.mark.parametrize("spawner_config", [None])
+def test_list_pagination_filters_etag(client, db_session):
+    from database.models import Service
+
+    for i in range(5):
+        db_session.add(
+            Service(
+                name=f"server{i}",
+                jupyterhub_username=jupyterhub_name,
+                jupyterhub_user_id=i % 2,
+                flavor="typea" if i < 3 else "typeb",
+                start_pending=False,
+            )
+        )
+    db_session.commit()
+
+    response = client.get("/services/?limit=2", headers=headers_auth_user)
+    assert [s["name"] for s in response.json()] == ["server0", "server1"]
+    cursor = response.headers["X-Next-Cursor"]
+    response = client.get(
+        f"/services/?limit=3&cursor={cursor}", headers=headers_auth_user
+    )
+    assert [s["name"] for s in response.json()] == ["server2", "server3", "server4"]
+    assert "X-Next-Cursor" not in response.headers
+
+    response = client.get(
+        "/services/?flavor=typea&user_id=0", headers=headers_auth_user
+    )
+    assert [s["name"] for s in response.json()] == ["server0", "server2"]
+
+    response = client.get("/services/", headers=headers_auth_user)
+    assert response.status_code == 200, response.text
+    etag = response.headers["ETag"]
+    response = client.get(
+        "/services/", headers={**headers_auth_user, "If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    # Other filters, other ETag
+    response = client.get(
+        "/services/?flavor=typeb", headers={**headers_auth_user, "If-None-Match": etag}
+    )
+    assert response.status_code == 200
+
+    service = db_session.query(Service).filter(Service.name == "server4").first()
+    service.stop_pending = True
+    db_session.commit()
+    response = client.get(
+        "/services/?stop_pending=true",
+        headers={**headers_auth_user, "If-None-Match": etag},
+    )
+    assert [s["name"] for s in response.json()] == ["server4"]
+    response = client.get(
+        "/services/", headers={**headers_auth_user, "If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+    # Polls only refresh last_update, no change
+    etag = response.headers["ETag"]
+    service.last_update = service.last_update + timedelta(minutes=1)
+    db_session.commit()
+    response = client.get(
+        "/services/", headers={**headers_auth_user, "If-None-Match": etag}
+    )
+    assert response.status_code == 304
+
+
+@pytest.mark.parametrize("spawner_config", [None])
+def test_service_changes_concurrent_first_insert(client, db_session):
+    from database.models import Service
+    from database.utils import get_services_version
+    from sqlalchemy import event
+
+    inserted = False
+
+    # Another worker adds the first change of the JupyterHub right before
+    def insert_first(conn, cursor, statement, parameters, context, executemany):
+        nonlocal inserted
+        if statement.startswith("INSERT INTO service_changes") and not inserted:
+            inserted = True
+            cursor.execute(
+                "INSERT INTO service_changes (jupyterhub_name, counter, flavor_counter) VALUES (?, 5, 5)",
+                (jupyterhub_name,),
+            )
+
+    event.listen(db_session.get_bind(), "before_cursor_execute", insert_first)
+    db_session.add(
+        Service(name="server", jupyterhub_username=jupyterhub_name, flavor="typea")
+    )
+    try:
+        db_session.commit()
+    finally:
+        event.remove(db_session.get_bind(), "before_cursor_execute", insert_first)
+    assert inserted
+    # Same increments as for a JupyterHub without concurrent changes
+    db_session.add(
+        Service(name="server", jupyterhub_username=jupyterhub_name2, flavor="typea")
+    )
+    db_session.commit()
+    increments = get_services_version(jupyterhub_name2, db_session)
+    assert increments > 0
+    assert get_services_version(jupyterhub_name, db_session) == 5 + increments
+    assert (
+        get_services_version(jupyterhub_name, db_session, flavors=True)
+        == 5 + increments
+    )
+
+
+@pytest.mark.parametrize("spawner_config", [simple_flavors_max_0])
+def test_flavors_endpoint_cache(client, db_session, tmp_path, monkeypatch):
+    import yaml
+    from api import services
+    from database.models import Service
+    from spawner import get_wrapper
+
+    path = tmp_path / "flavors.yaml"
+    path.write_text(yaml.dump(simple_flavors))
+    monkeypatch.setenv("OUTPOST_FLAVORS_PATH", str(path))
+    monkeypatch.setattr(services, "response_cache", {})
+    wrapper = get_wrapper()
+
+    response = client.get("/flavors/", headers=headers_auth_user)
+    assert response.json() == expected_flavors
+    assert response.headers["Cache-Control"] == "no-cache"
+    etag = response.headers["ETag"]
+
+    async def not_cached(*args, **kwargs):
+        raise AssertionError("Flavor values not cached")
+
+    with monkeypatch.context() as m:
+        m.setattr(wrapper, "_outpostspawner_get_flavor_values", not_cached)
+        response = client.get(
+            "/flavors/", headers={**headers_auth_user, "If-None-Match": etag}
+        )
+        assert response.status_code == 304
+        m.setattr(wrapper, "flavors_credits_max_age", 60)
+        response = client.get("/flavors/", headers=headers_auth_user)
+        assert response.json() == expected_flavors
+        assert response.headers["Cache-Control"] == "private, max-age=60"
+
+    # New flavor counts, new response
+    db_session.add(
+        Service(name="server", jupyterhub_username=jupyterhub_name, flavor="typea")
+    )
+    db_session.commit()
+    response = client.get(
+        "/flavors/", headers={**headers_auth_user, "If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.json()["typea"]["current"] == 1
+    assert response.headers["ETag"] != etag
+
+
+@pytest.mark.parametrize("spawner_config", [simple_flavors_max_0])
+def test_flavors_endpoint_cache_config_file(client, tmp_path, monkeypatch):
+    import os
+
+    import yaml
+    from api import services
+    from spawner import get_wrapper
+
+    path = tmp_path / "flavors.yaml"
+    path.write_text(yaml.dump(simple_flavors))
+    monkeypatch.setenv("OUTPOST_FLAVORS_PATH", str(path))
+    monkeypatch.setattr(services, "response_cache", {})
+    wrapper = get_wrapper()
+    # Restored after the test
+    monkeypatch.setattr(wrapper, "flavors_credits_max_age", 0)
+    monkeypatch.setattr(wrapper, "config_file_version", None)
+    with open(simple_flavors_max_0) as f:
+        config = f.read()
+    config_path = tmp_path / "spawner_config.py"
+    config_path.write_text(config)
+    monkeypatch.setenv("OUTPOST_CONFIG_FILE", str(config_path))
+
+    response = client.get("/flavors/", headers=headers_auth_user)
+    assert response.headers["Cache-Control"] == "no-cache"
+    etag = response.headers["ETag"]
+
+    config_path.write_text(
+        config + "\nc.JupyterHubOutpost.flavors_credits_max_age = 60\n"
+    )
+    os.utime(config_path, ns=(0, 1))
+    response = client.get(
+        "/flavors/", headers={**headers_auth_user, "If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.headers["Cache-Control"] == "private, max-age=60"
+
+
+@pytest.mark.parametrize("spawner_config", [simple])
+def test_bulk_start_stop(client, db_session):
+    from database.models import Service
+
+    flavors = copy.deepcopy(simple_flavors)
+    flavors["flavors"]["typea"]["max"] = 2
+    services = [
+        {"name": f"server{i}", "misc": {"cmd": "sleep", "args": "5"}, "flavor": flavor}
+        for i, flavor in enumerate(["typea", "typea", "typea", "unknown"])
+    ]
+    with patch("spawner.outpost.get_flavors_from_disk", return_value=flavors), patch(
+        "spawner.utils.get_flavors_from_disk", return_value=flavors
+    ):
+        # Parameterized routes must not match
+        response = client.post(
+            "/services/bulk",
+            json={"services": services + [{"name": "invalid", "env": "no dict"}]},
+            headers=headers_auth_user,
+        )
+        assert response.status_code == 200, response.text
+        results = response.json()["results"]
+        assert [r["status"] for r in results] == [200, 200, 403, 403, 400]
+        assert "Maximum (2) already reached" in results[2]["error"]
+        assert (
+            db_session.query(Service).filter(Service.stop_pending == False).count() == 2
+        )
+
+        response = client.request(
+            "DELETE",
+            "/services/bulk",
+            json={
+                "services": [
+                    {"name": "server0"},
+                    {"name": "server1", "start_id": "0"},
+                    {"name": "server2"},
+                ]
+            },
+            headers=headers_auth_user,
+        )
+    assert response.status_code == 200, response.text
+    assert [r["status"] for r in response.json()["results"]] == [200, 200, 404]
+    assert db_session.query(Service).count() == 0
+
+
+@pytest.mark.parametrize("spawner_config", [simple])
+def test_bulk_start_duplicates(client, db_session):
+    from database.models import Service
+
+    services = [
+        {"name": name, "misc": {"cmd": "sleep", "args": "5"}, "flavor": "typea"}
+        for name in ["server0", "server1", "server1"]
+    ]
+    with patch(
+        "spawner.outpost.get_flavors_from_disk", return_value=simple_flavors
+    ), patch("spawner.utils.get_flavors_from_disk", return_value=simple_flavors):
+        response = client.post(
+            "/services/bulk", json={"services": services}, headers=headers_auth_user
+        )
+        assert response.status_code == 200, response.text
+        assert [r["status"] for r in response.json()["results"]] == [200, 200, 409]
+
+        # Already stored
+        response = client.post(
+            "/services/bulk",
+            json={"services": services[:1] + [dict(services[0], name="server2")]},
+            headers=headers_auth_user,
+        )
+        assert response.status_code == 200, response.text
+        assert [r["status"] for r in response.json()["results"]] == [409, 200]
+        assert db_session.query(Service).count() == 3
+
+        response = client.request(
+            "DELETE",
+            "/services/bulk",
+            json={"services": [{"name": f"server{i}"} for i in range(3)]},
+            headers=headers_auth_user,
+        )
+    assert [r["status"] for r in response.json()["results"]] == [200, 200, 200]
+
+
+@pytest.mark.parametrize("spawner_config", [simple])
+def test_bulk_start_loads_config_once(client, monkeypatch):
+    from spawner import get_wrapper
+
+    wrapper = get_wrapper()
+    calls = {"load": 0, "flavor_update": 0}
+    load_spawner_class_config = wrapper.load_spawner_class_config
+
+    def counting_load():
+        calls["load"] += 1
+        return load_spawner_class_config()
+
+    async def counting_flavor_update(*args, **kwargs):
+        calls["flavor_update"] += 1
+
+    monkeypatch.setattr(wrapper, "load_spawner_class_config", counting_load)
+    monkeypatch.setattr(
+        wrapper, "_outpostspawner_send_flavor_update", counting_flavor_update
+    )
+    services = [
+        {"name": f"server{i}", "misc": {"cmd": "sleep", "args": str(i + 5)}}
+        for i in range(3)
+    ]
+    with patch("spawner.outpost.get_flavors_from_disk", return_value={}), patch(
+        "spawner.utils.get_flavors_from_disk", return_value={}
+    ):
+        response = client.post(
+            "/services/bulk", json={"services": services}, headers=headers_auth_user
+        )
+        assert response.status_code == 200, response.text
+        assert [r["status"] for r in response.json()["results"]] == [200, 200, 200]
+        assert calls == {"load": 1, "flavor_update": 1}
+        # Overrides of one service do not change the shared config
+        for i in range(3):
+            spawner = wrapper.spawners[f"{jupyterhub_name}-server{i}-0"]
+            assert spawner.args == [str(i + 5)]
+        assert wrapper.config.SimpleLocalProcessSpawner.args == "Hello World"
+
+        response = client.request(
+            "DELETE",
+            "/services/bulk",
+            json={"services": [{"name": f"server{i}"} for i in range(3)]},
+            headers=headers_auth_user,
+        )
+    assert [r["status"] for r in response.json()["results"]] == [200, 200, 200]
+
+
+@pytest.mark.parametrize("spawner_config", [simple])
+def test_bulk_limit(client, monkeypatch):
+    from spawner import get_wrapper
+
+    monkeypatch.setattr(get_wrapper(), "bulk_max_services", 1)
+    response = client.post(
+        "/services/bulk",
+        json={"services": [{"name": "server0"}, {"name": "server1"}]},
+        headers=headers_auth_user,
+    )
+    assert response.status_code == 413
+    response = client.post(
+        "/services/bulk", json={"name": "server0"}, headers=headers_auth_user
+    )
+    assert response.status_code == 422
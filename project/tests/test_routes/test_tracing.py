@@ -0,0 +1,59 @@
+import pytest
+import tracing
+from tests.test_routes.test_services import headers_auth_user
+from tests.test_routes.test_services import simple
+
+trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+parent_span_id = "00f067aa0ba902b7"
+
+
+@pytest.fixture(scope="function")
+def exporter(app, monkeypatch):
+    exporter = tracing.InMemoryExporter()
+    monkeypatch.setattr(tracing, "_exporter", exporter)
+    app.add_middleware(tracing.TracingMiddleware)
+    yield exporter
+
+
+@pytest.mark.parametrize("spawner_config", [None])
+def test_parse_traceparent(app):
+    assert tracing.parse_traceparent(f"00-{trace_id}-{parent_span_id}-01") == (
+        trace_id,
+        parent_span_id,
+    )
+    assert tracing.parse_traceparent(f"00-{'0' * 32}-{parent_span_id}-01") is None
+    assert tracing.parse_traceparent("invalid") is None
+    assert tracing.parse_traceparent(None) is None
+
+
+@pytest.mark.parametrize("spawner_config", [simple])
+def test_tracing_start(exporter, client):
+    headers = dict(headers_auth_user)
+    headers["traceparent"] = f"00-{trace_id}-{parent_span_id}-01"
+    service_data = {"name": "user-servername"}
+    response = client.post("/services", json=service_data, headers=headers)
+    assert response.status_code == 200, response.text
+
+    spans = {span["name"]: span for span in exporter.spans}
+    assert {span["trace_id"] for span in exporter.spans} == {trace_id}
+    request_span = spans["POST /services"]
+    assert request_span["parent_span_id"] == parent_span_id
+    assert request_span["attributes"]["http.status_code"] == 200
+    for name in [
+        "validate_flavor",
+        "db.add_service",
+        "get_spawner",
+        "load_config_file",
+        "async_start",
+        "spawner.start",
+    ]:
+        assert name in spans
+    assert spans["async_start"]["parent_span_id"] == request_span["span_id"]
+    assert spans["spawner.start"]["status"] == "ok"
+
+
+@pytest.mark.parametrize("spawner_config", [simple])
+def test_tracing_disabled(client):
+    assert not tracing.enabled()
+    with tracing.span("noop") as span:
+        assert span is None
@@ -0,0 +1,61 @@
+import hashlib
+
+import pytest
+from tests.conftest import auth_username
+from tests.conftest import auth_username2
+from tests.conftest import auth_username_passwd
+
+
+@pytest.mark.parametrize("spawner_config", [None])
+def test_check_credentials(app):
+    import users
+
+    users.load_users()
+    # Only keyed hashes are stored
+    assert auth_username_passwd.encode() not in users.get_users()[auth_username]
+
+    assert not users.check_credentials(auth_username, f"{auth_username_passwd}w")
+    assert not users.check_credentials("unknown", auth_username_passwd)
+    assert users.check_credentials(auth_username, auth_username_passwd)
+    # Same password, other user
+    assert not users.check_credentials(auth_username2, auth_username_passwd)
+
+
+tokens_config = """
+tokens:
+  - jupyterhub_name: authenticated
+    sha256: {services}
+  - jupyterhub_name: admin-hub
+    sha256: {admin}
+    scopes: ["services", "admin"]
+"""
+
+
+@pytest.mark.parametrize("spawner_config", [None])
+def test_bearer_tokens(client, tmp_path, monkeypatch):
+    import users
+
+    path = tmp_path / "tokens.yaml"
+    path.write_text(
+        tokens_config.format(
+            services=hashlib.sha256(b"services-token").hexdigest(),
+            admin=hashlib.sha256(b"admin-token").hexdigest(),
+        )
+    )
+    monkeypatch.setenv("OUTPOST_TOKENS_PATH", str(path))
+    monkeypatch.setattr(users, "_tokens", {})
+    monkeypatch.setattr(users, "_tokens_last_update", 0)
+    users.update_tokens()
+
+    services = {"Authorization": "Bearer services-token"}
+    admin = {"Authorization": "Bearer admin-token"}
+    assert client.get("/services/", headers=services).status_code == 200
+    assert client.get("/admin/circuits", headers=services).status_code == 403
+    assert client.get("/admin/circuits", headers=admin).status_code == 200
+    response = client.get("/services/", headers={"Authorization": "Bearer wrong"})
+    assert response.status_code == 401
+
+    # Removed file revokes all tokens
+    path.unlink()
+    users.update_tokens()
+    assert client.get("/services/", headers=services).status_code == 401
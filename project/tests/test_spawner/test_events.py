@@ -0,0 +1,82 @@
+import asyncio
+import logging
+
+import pytest
+from spawner.events import EventForwarder
+from tornado.httpclient import HTTPClientError
+
+log = logging.getLogger("test")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("spawner_config", [None])
+async def test_event_forwarder_single(app):
+    sent = []
+
+    async def send(event):
+        sent.append(event)
+
+    forwarder = EventForwarder(send, log, "test")
+    forwarder.start()
+    for i in range(5):
+        assert forwarder.put({"progress": i})
+    await forwarder.stop()
+    assert sent == [{"progress": i} for i in range(5)]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("spawner_config", [None])
+async def test_event_forwarder_batched_slow_hub(app):
+    sent = []
+    release = asyncio.Event()
+
+    async def send(events):
+        await release.wait()
+        sent.append(events)
+
+    forwarder = EventForwarder(send, log, "test", maxsize=100, batch_size=3)
+    forwarder.start()
+    forwarder.put({"progress": 0})
+    await asyncio.sleep(0)
+    # first request is in flight, following events must not block
+    for i in range(1, 6):
+        assert forwarder.put({"progress": i})
+    release.set()
+    await forwarder.stop()
+    assert sent == [
+        [{"progress": 0}],
+        [{"progress": 1}, {"progress": 2}, {"progress": 3}],
+        [{"progress": 4}, {"progress": 5}],
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("spawner_config", [None])
+async def test_event_forwarder_drop_oldest(app):
+    sent = []
+
+    async def send(event):
+        sent.append(event)
+
+    forwarder = EventForwarder(send, log, "test", maxsize=2)
+    for i in range(4):
+        forwarder.put({"progress": i})
+    assert forwarder.dropped == 2
+    forwarder.start()
+    await forwarder.stop()
+    assert sent == [{"progress": 2}, {"progress": 3}]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("spawner_config", [None])
+async def test_event_forwarder_failed(app):
+    async def send(event):
+        raise HTTPClientError(404)
+
+    forwarder = EventForwarder(send, log, "test")
+    forwarder.start()
+    forwarder.put({"progress": 0})
+    await asyncio.sleep(0.01)
+    assert forwarder.failed
+    assert not forwarder.put({"progress": 1})
+    await forwarder.stop()
@@ -0,0 +1,186 @@
+import asyncio
+import socket
+
+import pytest
+from spawner import http_client
+
+spawner_config_good = "./tests/test_spawner/spawner_config_good.py"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("spawner_config", [spawner_config_good])
+async def test_http_client_shared(app):
+    import spawner
+
+    wrapper = spawner.get_wrapper()
+    assert wrapper.http_client is wrapper.http_client
+    assert wrapper.http_client is http_client.get_http_client()
+    assert wrapper.http_client.max_clients == wrapper.http_client_max_clients
+    assert wrapper.http_client.defaults["validate_cert"] is False
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("spawner_config", [None])
+async def test_http_client_unsupported_backend(app):
+    with pytest.raises(ValueError, match="Use one of"):
+        http_client.configure_http_client(backend="unknown")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("spawner_config", [None])
+async def test_caching_resolver(app):
+    calls = 0
+
+    class CountingResolver:
+        async def resolve(self, host, port, family=socket.AF_UNSPEC):
+            nonlocal calls
+            calls += 1
+            return [(socket.AF_INET, ("127.0.0.1", port))]
+
+    resolver = http_client.CachingResolver(resolver=CountingResolver(), ttl=60)
+    first = await resolver.resolve("hub.example.org", 443)
+    second = await resolver.resolve("hub.example.org", 443)
+    assert first == second
+    assert calls == 1
+
+    await resolver.resolve("other.example.org", 443)
+    assert calls == 2
+
+    resolver.ttl = 0
+    resolver._cache = {}
+    await resolver.resolve("hub.example.org", 443)
+    await resolver.resolve("hub.example.org", 443)
+    assert calls == 4
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("spawner_config", [None])
+async def test_circuit_breaker(app, monkeypatch):
+    from spawner.circuit_breaker import CircuitBreaker
+
+    now = 1000.0
+    monkeypatch.setattr("spawner.circuit_breaker.time.monotonic", lambda: now)
+    breaker = CircuitBreaker(
+        "http://hub", failure_threshold=2, reset_timeout=10, max_reset_timeout=15
+    )
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow_request()
+
+    # half open: only one probe
+    now += 10
+    assert breaker.state == "half_open"
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+    # failed probe doubles the reset timeout (up to max)
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.reset_timeout == 15
+    now += 15
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.reset_timeout == 10
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("spawner_config", [None])
+async def test_fetch_fails_fast(app, monkeypatch):
+    from spawner.circuit_breaker import CircuitOpenError
+    from tornado.httpclient import AsyncHTTPClient
+    from tornado.httpclient import HTTPClientError
+    from tornado.httpclient import HTTPRequest
+
+    calls = 0
+
+    async def mock_fetch(self, *args, **kwargs):
+        nonlocal calls
+        calls += 1
+        raise HTTPClientError(599, "Timeout")
+
+    monkeypatch.setattr(AsyncHTTPClient, "fetch", mock_fetch)
+    monkeypatch.setattr(
+        http_client, "circuit_breakers", type(http_client.circuit_breakers)()
+    )
+    req = HTTPRequest(url="http://downhub:8000/hub/api/events", method="GET")
+    for _ in range(3):
+        with pytest.raises(HTTPClientError) as e:
+            await http_client.fetch(req)
+        assert not isinstance(e.value, CircuitOpenError)
+    with pytest.raises(CircuitOpenError):
+        await http_client.fetch(req)
+    assert calls == 3
+    assert (
+        http_client.circuit_breakers.to_dict()["http://downhub:8000"]["state"] == "open"
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("spawner_config", [None])
+async def test_fetch_cancelled_probe(app, monkeypatch):
+    from tornado.httpclient import AsyncHTTPClient
+    from tornado.httpclient import HTTPRequest
+    from tornado.httpclient import HTTPResponse
+
+    started = asyncio.Event()
+
+    async def hanging_fetch(self, request, *args, **kwargs):
+        started.set()
+        await asyncio.sleep(60)
+
+    async def error_response(self, request, *args, **kwargs):
+        return HTTPResponse(request, 599)
+
+    monkeypatch.setattr(
+        http_client, "circuit_breakers", type(http_client.circuit_breakers)()
+    )
+    req = HTTPRequest(url="http://downhub:8000/hub/api/events", method="GET")
+    breaker = http_client.circuit_breakers.get(req.url)
+    # 599 responses of raise_error=False count as failures, too
+    monkeypatch.setattr(AsyncHTTPClient, "fetch", error_response)
+    for _ in range(3):
+        response = await http_client.fetch(req, raise_error=False)
+        assert response.code == 599
+    assert breaker.state == "open"
+
+    breaker.opened_at -= breaker.reset_timeout
+    assert breaker.state == "half_open"
+    monkeypatch.setattr(AsyncHTTPClient, "fetch", hanging_fetch)
+    task = asyncio.create_task(http_client.fetch(req))
+    await started.wait()
+    assert breaker.probe_in_flight
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert breaker.state == "half_open"
+    assert not breaker.probe_in_flight
+    assert breaker.allow_request()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("spawner_config", [None])
+async def test_fetch_keeps_shared_headers(app, monkeypatch):
+    import tracing
+    from tornado.httpclient import AsyncHTTPClient
+    from tornado.httpclient import HTTPRequest
+    from tornado.httpclient import HTTPResponse
+
+    sent = []
+
+    async def mock_fetch(self, request, *args, **kwargs):
+        sent.append(request.headers["traceparent"])
+        return HTTPResponse(request, 200)
+
+    monkeypatch.setattr(AsyncHTTPClient, "fetch", mock_fetch)
+    monkeypatch.setattr(tracing, "_exporter", tracing.InMemoryExporter())
+    headers = {"Authorization": "token secret"}
+    for _ in range(2):
+        with tracing.span("send"):
+            req = HTTPRequest(url="http://hub:8000/hub/api", headers=headers)
+            await http_client.fetch(req)
+    assert headers == {"Authorization": "token secret"}
+    assert len(set(sent)) == 2
@@ -0,0 +1,64 @@
+import importlib
+import json
+import os
+from datetime import datetime
+from datetime import timezone
+
+import json_codec
+import pytest
+from cryptography.fernet import Fernet
+from database.schemas import decrypt
+from database.schemas import encrypt
+
+
+@pytest.fixture(params=["json", "orjson"])
+def json_backend(request):
+    if request.param == "orjson":
+        pytest.importorskip("orjson")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("OUTPOST_JSON_BACKEND", request.param)
+        importlib.reload(json_codec)
+        assert json_codec.backend == request.param
+        yield request.param
+    importlib.reload(json_codec)
+
+
+@pytest.mark.parametrize("spawner_config", [None])
+def test_json_codec_roundtrip(app, json_backend):
+    data = {"name": "server", "env": {"UNICODE": "äöü"}, "ports": [8888, 1.5, None]}
+    assert json_codec.loads(json_codec.dumps(data)) == data
+    assert json.loads(json_codec.dumps_str(data)) == data
+    # Values written before, with the default settings of the json module
+    fernet = Fernet(os.environ.get("OUTPOST_CRYPT_KEY"))
+    assert decrypt(fernet.encrypt(json.dumps(data).encode())) == data
+    assert json.loads(fernet.decrypt(encrypt(data))) == data
+
+
+@pytest.mark.parametrize("spawner_config", [None])
+def test_json_codec_default(app, json_backend):
+    # Neither backend serializes sets
+    with pytest.raises(TypeError):
+        json_codec.dumps({"ids": {1}})
+    assert json_codec.loads(json_codec.dumps({"ids": {1}}, default=list)) == {
+        "ids": [1]
+    }
+    # Like jsonable_encoder
+    date = datetime(2024, 1, 1, 12, 30, 0, 5, tzinfo=timezone.utc)
+    assert json_codec.loads(json_codec.dumps({"date": date})) == {
+        "date": date.isoformat()
+    }
+    assert json_codec.loads(json_codec.dumps([date], default=str)) == [date.isoformat()]
+
+
+@pytest.mark.parametrize("spawner_config", [None])
+def test_json_codec_response(app, json_backend):
+    response = json_codec.JSONResponse({"services": [{"name": "server"}]})
+    assert response.headers["content-type"] == "application/json"
+    assert json.loads(response.body) == {"services": [{"name": "server"}]}
+
+
+@pytest.mark.parametrize("spawner_config", [None])
+def test_json_codec_unsupported_backend(app, monkeypatch):
+    monkeypatch.setenv("OUTPOST_JSON_BACKEND", "unknown")
+    with pytest.raises(ValueError, match="Use one of"):
+        json_codec._get_backend()
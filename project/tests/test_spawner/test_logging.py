@@ -0,0 +1,329 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+import file_watcher
+import pytest
+from spawner import get_wrapper
+from spawner import logging_utils
+
+logging_config = """
+stream:
+  enabled: true
+  level: {level}
+  formatter: simple
+  stream: ext://sys.stderr
+"""
+
+
+def write_logging_config(path, level, mtime):
+    with open(path, "w") as f:
+        f.write(logging_config.format(level=level))
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.mark.parametrize("spawner_config", [None])
+def test_trace_disabled_by_handler_levels(app, tmp_path, monkeypatch):
+    wrapper = get_wrapper()
+    path = str(tmp_path / "logging_config.yaml")
+    monkeypatch.setattr(wrapper, "logging_config_file", path)
+    monkeypatch.setattr(wrapper, "logging_config_last_update", 0)
+    handlers = list(wrapper.log.handlers)
+    try:
+        write_logging_config(path, "INFO", 1000)
+        wrapper.update_logging()
+        assert not wrapper.log.isEnabledFor(5)
+        assert wrapper.log.isEnabledFor(20)
+
+        write_logging_config(path, "TRACE", 2000)
+        wrapper.update_logging()
+        assert wrapper.log.isEnabledFor(5)
+    finally:
+        for handler in wrapper.log.handlers:
+            if handler not in handlers:
+                handler.close()
+        wrapper.log.handlers = handlers
+        wrapper.update_logger_levels()
+
+
+class SlowHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.emitting = threading.Event()
+        self.unblock = threading.Event()
+        self.records = []
+
+    def emit(self, record):
+        self.emitting.set()
+        self.unblock.wait(5)
+        self.records.append(record.getMessage())
+
+
+def log_while_blocked(overflow):
+    slow = SlowHandler()
+    handler = logging_utils.NonBlockingQueueHandler(
+        slow, queue_size=2, overflow=overflow
+    )
+    log = logging.getLogger(f"test_queue_handler_{overflow}")
+    log.propagate = False
+    log.addHandler(handler)
+    try:
+        log.warning("message 0")
+        assert slow.emitting.wait(5)
+        start = time.monotonic()
+        for i in range(1, 10):
+            log.warning("message %d", i)
+        assert time.monotonic() - start < 1
+    finally:
+        slow.unblock.set()
+        log.removeHandler(handler)
+        handler.close()
+    # One record in the slow handler, two in the queue
+    assert handler.dropped == 7
+    return slow.records
+
+
+@pytest.mark.parametrize("spawner_config", [None])
+def test_queue_handler_drop_new(app):
+    records = log_while_blocked("drop_new")
+    assert records == ["message 0", "message 1", "message 2"]
+
+
+@pytest.mark.parametrize("spawner_config", [None])
+def test_queue_handler_drop_oldest(app):
+    records = log_while_blocked("drop_oldest")
+    assert records == ["message 0", "message 8", "message 9"]
+
+
+@pytest.mark.parametrize("spawner_config", [None])
+def test_missing_logging_config(app, tmp_path, monkeypatch):
+    wrapper = get_wrapper()
+    monkeypatch.setattr(
+        wrapper, "logging_config_file", str(tmp_path / "logging_config.yaml")
+    )
+    monkeypatch.setattr(wrapper, "logging_config_missing", False)
+    wrapper.update_logging()
+    assert wrapper.logging_config_missing
+    # Warned once, later calls return silently
+    wrapper.update_logging()
+    assert wrapper.logging_config_missing
+
+
+async def wait_for_change(tmp_path, **kwargs):
+    path = tmp_path / "logging_config.yaml"
+    path.write_text("")
+    changed = asyncio.Event()
+    task = asyncio.create_task(
+        file_watcher.watch(str(path), changed.set, debounce=0.01, **kwargs)
+    )
+    try:
+        await asyncio.sleep(0.1)
+        path.write_text("stream:\n  enabled: false\n")
+        await asyncio.wait_for(changed.wait(), 2)
+    finally:
+        task.cancel()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("spawner_config", [None])
+async def test_file_watcher(app, tmp_path):
+    await wait_for_change(tmp_path, interval=60)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("spawner_config", [None])
+async def test_file_watcher_without_inotify(app, tmp_path, monkeypatch):
+    def no_inotify(directory):
+        raise OSError("inotify not available")
+
+    monkeypatch.setattr(file_watcher, "Inotify", no_inotify)
+    await wait_for_change(tmp_path, interval=0.05)
+
+
+def create_record(msg, args=(), **extra):
+    record = logging.LogRecord(
+        "JupyterHubOutpost", logging.INFO, "/app/outpost.py", 10, msg, args, None
+    )
+    record.__dict__.update(extra)
+    return record
+
+
+@pytest.mark.parametrize("spawner_config", [None])
+def test_extra_formatter(app):
+    formatter = logging_utils.ExtraFormatter(fmt="%(levelname)s %(message)s")
+    assert formatter.format(create_record("Poll %s", ("server",))) == "INFO Poll server"
+    assert (
+        formatter.format(create_record("Poll", service="server", start_id="0"))
+        == "INFO Poll --- service=server --- start_id=0"
+    )
+
+
+@pytest.mark.parametrize("spawner_config", [None])
+def test_json_formatter(app):
+    formatter = logging_utils.JsonFormatter(
+        **logging_utils.supported_formatter_kwargs["json"]
+    )
+    record = create_record(
+        "Poll %s", ("server",), start_id="0", stream=object(), line="extra line"
+    )
+    result = json.loads(formatter.format(record))
+    assert list(result.keys()) == [
+        "asctime",
+        "levelno",
+        "levelname",
+        "logger",
+        "file",
+        "line",
+        "function",
+        "Message",
+        "start_id",
+        "stream",
+    ]
+    assert result["levelno"] == logging.INFO
+    assert result["logger"] == logging_utils.logged_logger_name
+    assert result["file"] == "/app/outpost.py"
+    assert result["Message"] == "Poll server"
+    # extra overrides the configured value
+    assert result["line"] == "extra line"
+    # not JSON serializable
+    assert result["stream"].startswith("<object object")
+    assert json.loads(formatter.format(create_record(5)))["Message"] == 5
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def rate_limited_logger(name, rules):
+    handler = ListHandler()
+    handler.addFilter(logging_utils.RateLimitFilter(handler, rules))
+    log = logging.getLogger(name)
+    log.propagate = False
+    log.handlers = [handler]
+    log.setLevel(logging.DEBUG)
+    return log, handler
+
+
+@pytest.mark.parametrize("spawner_config", [None])
+def test_rate_limit_filter(app):
+    log, handler = rate_limited_logger(
+        "test_rate_limit_filter",
+        [{"match": "Poll service$", "rate": 2, "interval": 60}],
+    )
+    for i in range(10):
+        log.debug(f"server-{i} - Poll service")
+        log.info(f"server-{i} - Start service")
+    messages = [record.getMessage() for record in handler.records]
+    assert messages.count("server-0 - Poll service") == 1
+    assert len([m for m in messages if m.endswith("Poll service")]) == 2
+    assert len([m for m in messages if m.endswith("Start service")]) == 10
+
+    handler.filters[0].emit_summaries(force=True)
+    summary = handler.records[-1]
+    assert summary.suppressed == 8
+    assert summary.levelno == logging.DEBUG
+    assert summary.getMessage().startswith("Suppressed 8 similar messages")
+
+
+@pytest.mark.parametrize("spawner_config", [None])
+def test_rate_limit_filter_sample_and_interval(app, monkeypatch):
+    now = 1000
+    monkeypatch.setattr(logging_utils.time, "monotonic", lambda: now)
+    log, handler = rate_limited_logger(
+        "test_rate_limit_filter_sample",
+        [{"match": "does not exist", "rate": 1, "interval": 10, "sample": 3}],
+    )
+    for i in range(10):
+        log.info(f"Service {i} does not exist")
+    # first one, then every third suppressed one
+    assert [r.getMessage() for r in handler.records] == [
+        "Service 0 does not exist",
+        "Service 3 does not exist",
+        "Service 6 does not exist",
+        "Service 9 does not exist",
+    ]
+
+    now = 1011
+    log.info("Service 10 does not exist")
+    assert handler.records[-2].suppressed == 6
+    assert handler.records[-1].getMessage() == "Service 10 does not exist"
+
+
+@pytest.mark.parametrize("spawner_config", [None])
+def test_rate_limit_config(app, tmp_path, monkeypatch):
+    wrapper = get_wrapper()
+    path = tmp_path / "logging_config.yaml"
+    path.write_text(
+        logging_config.format(level="DEBUG")
+        + """
+rate_limit:
+  - match: "Poll service$"
+    rate: 5
+    interval: 60
+"""
+    )
+    monkeypatch.setattr(wrapper, "logging_config_file", str(path))
+    monkeypatch.setattr(wrapper, "logging_config_last_update", 0)
+    handlers = list(wrapper.log.handlers)
+    try:
+        wrapper.update_logging()
+        added = [h for h in wrapper.log.handlers if h not in handlers]
+        assert [h.name for h in added] == ["stream"]
+        assert isinstance(added[0].filters[0], logging_utils.RateLimitFilter)
+    finally:
+        for handler in wrapper.log.handlers:
+            if handler not in handlers:
+                handler.close()
+        wrapper.log.handlers = handlers
+        wrapper.update_logger_levels()
+
+
+class SlowCloseHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.name = "stream"
+        self.unblock = threading.Event()
+        self.closed = threading.Event()
+
+    def emit(self, record):
+        pass
+
+    def close(self):
+        self.unblock.wait(5)
+        super().close()
+        self.closed.set()
+
+
+@pytest.mark.parametrize("spawner_config", [None])
+def test_update_logging_closes_handlers_in_background(app, tmp_path, monkeypatch):
+    wrapper = get_wrapper()
+    path = str(tmp_path / "logging_config.yaml")
+    monkeypatch.setattr(wrapper, "logging_config_file", path)
+    monkeypatch.setattr(wrapper, "logging_config_last_update", 0)
+    handlers = list(wrapper.log.handlers)
+    slow = SlowCloseHandler()
+    wrapper.log.addHandler(slow)
+    try:
+        write_logging_config(path, "INFO", 1000)
+        start = time.monotonic()
+        wrapper.update_logging()
+        assert time.monotonic() - start < 1
+        assert slow not in wrapper.log.handlers
+        assert not slow.closed.is_set()
+        slow.unblock.set()
+        assert slow.closed.wait(5)
+    finally:
+        slow.unblock.set()
+        for handler in wrapper.log.handlers:
+            if handler not in handlers:
+                handler.close()
+        wrapper.log.handlers = handlers
+        wrapper.update_logger_levels()
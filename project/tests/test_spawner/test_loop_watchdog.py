@@ -0,0 +1,32 @@
+import asyncio
+import time
+
+import pytest
+from loop_watchdog import EventLoopWatchdog
+from prometheus_client import REGISTRY
+
+
+def blocking_call():
+    time.sleep(0.5)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("spawner_config", [None])
+async def test_watchdog_reports_blocking_call(app):
+    labels = {"location": "test_loop_watchdog.py:blocking_call"}
+    before = REGISTRY.get_sample_value("outpost_event_loop_blocked_total", labels) or 0
+    watchdog = EventLoopWatchdog(threshold=0.1, interval=0.02)
+    watchdog.start()
+    try:
+        await asyncio.sleep(0.1)
+        assert watchdog.last_report is None
+        blocking_call()
+        await asyncio.sleep(0.1)
+    finally:
+        watchdog.stop()
+    assert watchdog.last_report["location"] == "test_loop_watchdog.py:blocking_call"
+    assert "time.sleep(0.5)" in watchdog.last_report["stack"]
+    assert (
+        REGISTRY.get_sample_value("outpost_event_loop_blocked_total", labels)
+        == before + 1
+    )
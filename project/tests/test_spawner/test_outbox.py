@@ -0,0 +1,155 @@
+import json
+
+import pytest
+import spawner
+from database import models
+from database.schemas import decrypt
+from spawner import http_client
+from spawner import outbox
+from spawner.circuit_breaker import CircuitBreakerRegistry
+from tornado.httpclient import AsyncHTTPClient
+from tornado.httpclient import HTTPClientError
+from tornado.httpclient import HTTPResponse
+
+url = "http://hub:8000/hub/api/flavors"
+headers = {"Authorization": "token secret"}
+
+
+@pytest.fixture(scope="function")
+def breakers(monkeypatch):
+    monkeypatch.setattr(http_client, "circuit_breakers", CircuitBreakerRegistry())
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("spawner_config", [None])
+async def test_outbox_keeps_latest_flavor_update(db_session):
+    key = outbox.flavor_update_key("hub", url)
+    outbox.enqueue(
+        db_session, "hub", outbox.KIND_FLAVOR_UPDATE, url, headers, {"a": 1}, key
+    )
+    outbox.enqueue(
+        db_session, "hub", outbox.KIND_FLAVOR_UPDATE, url, headers, {"a": 2}, key
+    )
+    outbox.enqueue(db_session, "hub", outbox.KIND_EVENT, url, headers, {"progress": 1})
+    outbox.enqueue(db_session, "hub", outbox.KIND_EVENT, url, headers, {"progress": 2})
+    notifications = db_session.query(models.Notification).all()
+    assert len(notifications) == 3
+    flavor_update = [x for x in notifications if x.dedup_key == key][0]
+    assert decrypt(flavor_update.payload)["body"] == {"a": 2}
+    assert outbox.get_status(db_session) == {
+        "hub": {
+            "flavor_update": {"pending": 1, "failed_attempts": 0, "last_error": None},
+            "event": {"pending": 2, "failed_attempts": 0, "last_error": None},
+        }
+    }
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("spawner_config", [None])
+async def test_outbox_dispatch(app, db_session, breakers, monkeypatch):
+    sent = []
+
+    async def mock_fetch(self, req, *args, **kwargs):
+        sent.append(req.body)
+        return HTTPResponse(req, 200)
+
+    monkeypatch.setattr(AsyncHTTPClient, "fetch", mock_fetch)
+    outbox.enqueue(db_session, "hub", outbox.KIND_EVENT, url, headers, {"progress": 1})
+    outbox.enqueue(db_session, "hub", outbox.KIND_EVENT, url, headers, {"progress": 2})
+    assert await outbox.dispatch(db_session, spawner.get_wrapper()) == 2
+    assert [json.loads(body) for body in sent] == [{"progress": 1}, {"progress": 2}]
+    assert db_session.query(models.Notification).count() == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("spawner_config", [None])
+async def test_outbox_dispatch_retry(app, db_session, breakers, monkeypatch):
+    code = 599
+
+    async def mock_fetch(self, req, *args, **kwargs):
+        raise HTTPClientError(code)
+
+    monkeypatch.setattr(AsyncHTTPClient, "fetch", mock_fetch)
+    outbox.enqueue(db_session, "hub", outbox.KIND_EVENT, url, headers, {"progress": 1})
+    outbox.enqueue(db_session, "hub", outbox.KIND_EVENT, url, headers, {"progress": 2})
+    assert await outbox.dispatch(db_session, spawner.get_wrapper()) == 0
+    notifications = (
+        db_session.query(models.Notification).order_by(models.Notification.id).all()
+    )
+    # The second event waits for the first one
+    assert [x.attempts for x in notifications] == [1, 0]
+    assert notifications[0].last_error
+
+    # Rejected by JupyterHub: do not retry
+    code = 404
+    for notification in notifications:
+        notification.next_attempt = notification.created
+    db_session.commit()
+    assert await outbox.dispatch(db_session, spawner.get_wrapper()) == 0
+    assert db_session.query(models.Notification).count() == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("spawner_config", [None])
+async def test_outbox_dispatch_skips_blocked_urls(
+    app, db_session, breakers, monkeypatch
+):
+    sent = []
+
+    async def mock_fetch(self, req, *args, **kwargs):
+        if req.url == url:
+            raise HTTPClientError(599)
+        sent.append(json.loads(req.body))
+        return HTTPResponse(req, 200)
+
+    monkeypatch.setattr(AsyncHTTPClient, "fetch", mock_fetch)
+    for i in range(5):
+        outbox.enqueue(
+            db_session, "hub", outbox.KIND_EVENT, url, headers, {"progress": i}
+        )
+    other_url = "http://otherhub:8000/hub/api/flavors"
+    for i in range(3):
+        outbox.enqueue(
+            db_session, "otherhub", outbox.KIND_EVENT, other_url, headers, {"i": i}
+        )
+    wrapper = spawner.get_wrapper()
+    assert await outbox.dispatch(db_session, wrapper, limit=2) == 3
+    assert sent == [{"i": 0}, {"i": 1}, {"i": 2}]
+
+    # Not due yet: not fetched at all
+    for i in range(3):
+        outbox.enqueue(
+            db_session, "otherhub", outbox.KIND_EVENT, other_url, headers, {"i": i}
+        )
+    sent.clear()
+    assert await outbox.dispatch(db_session, wrapper, limit=2) == 3
+    assert sent == [{"i": 0}, {"i": 1}, {"i": 2}]
+    notifications = db_session.query(models.Notification).all()
+    assert [x.attempts for x in notifications] == [1, 0, 0, 0, 0]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("spawner_config", [None])
+async def test_outbox_dispatch_circuit_open(app, db_session, breakers, monkeypatch):
+    calls = 0
+
+    async def mock_fetch(self, req, *args, **kwargs):
+        nonlocal calls
+        calls += 1
+        return HTTPResponse(req, 200)
+
+    monkeypatch.setattr(AsyncHTTPClient, "fetch", mock_fetch)
+    breaker = http_client.circuit_breakers.get(url)
+    while breaker.state != "open":
+        breaker.record_failure()
+    wrapper = spawner.get_wrapper()
+    outbox.enqueue(db_session, "hub", outbox.KIND_EVENT, url, headers, {"progress": 1})
+    notification = db_session.query(models.Notification).one()
+    notification.attempts = wrapper.notification_max_attempts - 1
+    db_session.commit()
+    assert await outbox.dispatch(db_session, wrapper) == 0
+    # Not sent, so it is neither counted as attempt nor dropped
+    notification = db_session.query(models.Notification).one()
+    assert notification.attempts == wrapper.notification_max_attempts - 1
+    assert notification.next_attempt > notification.created
+    assert calls == 0